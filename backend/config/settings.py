@@ -1,4 +1,5 @@
 from pathlib import Path
+from importlib.util import find_spec
 import os
 from dotenv import load_dotenv
 
@@ -64,6 +65,8 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    # Полнотекстовый поиск (tsvector/GIN) на PostgreSQL
+    'django.contrib.postgres',
     
     # Third party
     'rest_framework',
@@ -239,6 +242,30 @@ else:
         }
     }
 
+# L1: кэш ответов API в памяти процесса поверх Redis (core.utils.local_cache).
+# Согласованность - через Redis pub/sub; TTL ограничивает устаревание при потерянном сообщении.
+# В разработке (LocMem, один процесс) не нужен
+API_L1_CACHE_ENABLED = _env_bool('API_L1_CACHE_ENABLED', not DEBUG)
+API_L1_CACHE_MAX_ENTRIES = int(os.getenv('API_L1_CACHE_MAX_ENTRIES', 500))
+API_L1_CACHE_MAX_BYTES = int(os.getenv('API_L1_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+API_L1_CACHE_TTL = int(os.getenv('API_L1_CACHE_TTL', 30))  # секунд
+
+# Заголовки X-Cache-Key/X-Cache-Query с ключом кэша ответа и каноничными параметрами (отладка)
+API_CACHE_KEY_HEADER = _env_bool('API_CACHE_KEY_HEADER', DEBUG)
+
+# Прогрев кэша ответов API (core.cache_warming, manage.py warm_cache): после деплоя и сброса тегов списков
+CACHE_WARM_TOP = int(os.getenv('CACHE_WARM_TOP', 100))  # самых частых запросов из выборки
+CACHE_WARM_CONCURRENCY = int(os.getenv('CACHE_WARM_CONCURRENCY', 4))
+CACHE_WARM_SAMPLE_RATE = float(os.getenv('CACHE_WARM_SAMPLE_RATE', 0.05))  # доля запросов в выборке
+CACHE_WARM_ON_INVALIDATE = _env_bool('CACHE_WARM_ON_INVALIDATE', not DEBUG)
+CACHE_WARM_DELAY = int(os.getenv('CACHE_WARM_DELAY', 60))  # секунд: сбросы за это время - один прогрев
+# Хост и схема запросов прогрева: от них зависят абсолютные ссылки в кэшируемых ответах
+CACHE_WARM_HOST = os.getenv('CACHE_WARM_HOST', ALLOWED_HOSTS[0] if ALLOWED_HOSTS else 'localhost')
+CACHE_WARM_SECURE = _env_bool('CACHE_WARM_SECURE', not DEBUG)
+
+# Поиск: конфигурации Postgres full-text search для поискового документа
+SEARCH_CONFIGS = ('russian', 'english')
+
 # ✅ ДОБАВЛЕНО: Настройки кэширования сессий и middleware
 CACHE_MIDDLEWARE_ALIAS = 'default'
 CACHE_MIDDLEWARE_SECONDS = 300  # 5 минут для страниц
@@ -307,9 +334,12 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # ИСПРАВЛЕНО: Django REST Framework с улучшенными настройками
 REST_FRAMEWORK = {
+    # JSON через orjson; Accept: application/msgpack - если установлен msgpack
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-    ],
+        'core.renderers.ORJSONRenderer',
+        # ?format=normalized - списки промокодов с included.stores/categories
+        'core.renderers.NormalizedJSONRenderer',
+    ] + (['core.renderers.MessagePackRenderer'] if find_spec('msgpack') else []),
     # ✅ ИСПРАВЛЕНО: Унифицированная пагинация
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 12,  # ✅ Единый размер страницы для всего проекта
@@ -590,6 +620,31 @@ CKEDITOR_CONFIGS = {
         'removePlugins': 'stylesheetparser',
     }
 }
+# ========================================
+# Analytics ingestion
+# ========================================
+
+# direct - события пишутся в Postgres прямо в запросе /api/v1/track/
+# buffered - запрос только делает XADD в Redis Stream, в Event их переносит
+#            задача drain_event_stream (или manage.py drain_events --loop)
+ANALYTICS_INGEST_MODE = os.getenv('ANALYTICS_INGEST_MODE', 'direct')
+ANALYTICS_STREAM_MAXLEN = int(os.getenv('ANALYTICS_STREAM_MAXLEN', 100000))  # записей (батчей), защита памяти Redis
+ANALYTICS_DRAIN_BATCH = int(os.getenv('ANALYTICS_DRAIN_BATCH', 500))
+
+# Локальный spool на случай недоступности Postgres/Redis (загружается replay_spool)
+ANALYTICS_SPOOL_DIR = os.getenv('ANALYTICS_SPOOL_DIR', str(BASE_DIR / 'var' / 'spool'))
+ANALYTICS_SPOOL_MAX_BYTES = int(os.getenv('ANALYTICS_SPOOL_MAX_BYTES', 16 * 1024 * 1024))
+ANALYTICS_SPOOL_MAX_AGE = int(os.getenv('ANALYTICS_SPOOL_MAX_AGE', 60))  # секунд до ротации файла
+
+# Роллапы: часовые агрегаты храним N дней, дальше история в DailyAgg/MonthlyAgg
+ANALYTICS_HOURLY_RETENTION_DAYS = int(os.getenv('ANALYTICS_HOURLY_RETENTION_DAYS', 35))
+# Живые топы в Redis (sorted sets по дням): сколько дней хранить; дольше - из роллапов
+ANALYTICS_LEADERBOARD_DAYS = int(os.getenv('ANALYTICS_LEADERBOARD_DAYS', 35))
+# HyperLogLog уникальных посетителей по дням: сколько дней хранить счётчики
+ANALYTICS_UNIQUES_DAYS = int(os.getenv('ANALYTICS_UNIQUES_DAYS', 40))
+# ordering=trending: период полураспада веса клика, часов
+ANALYTICS_TRENDING_HALF_LIFE_HOURS = float(os.getenv('ANALYTICS_TRENDING_HALF_LIFE_HOURS', 24))
+
 # ========================================
 # Celery Configuration
 # ========================================
@@ -615,9 +670,29 @@ CELERY_BEAT_SCHEDULE = {
         'args': (30,),  # Keep last 30 days
         'options': {'expires': 82800},
     },
-    'cleanup-redis-dedup-keys': {
-        'task': 'core.tasks.cleanup_redis_dedup_keys',
-        'schedule': 21600.0,  # Every 6 hours
-        'options': {'expires': 19800},
+    'drain-event-stream': {
+        'task': 'core.tasks.drain_event_stream',
+        'schedule': 10.0,  # Every 10 seconds (no-op in direct ingest mode)
+        'options': {'expires': 9},
+    },
+    'replay-event-spool': {
+        'task': 'core.tasks.replay_event_spool',
+        'schedule': 300.0,  # Every 5 minutes
+        'options': {'expires': 280},
+    },
+    'compact-rollups-daily': {
+        'task': 'core.tasks.compact_rollups',
+        'schedule': 86400.0,  # Every day (24 hours)
+        'options': {'expires': 82800},
+    },
+    'reconcile-leaderboards-daily': {
+        'task': 'core.tasks.reconcile_leaderboards',
+        'schedule': 86400.0,  # Every day (24 hours)
+        'options': {'expires': 82800},
+    },
+    'update-trending': {
+        'task': 'core.tasks.update_trending',
+        'schedule': 900.0,  # Every 15 minutes
+        'options': {'expires': 840},
     },
 }
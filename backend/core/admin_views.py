@@ -125,10 +125,10 @@ def reaggregate_events_view(request):
         days = int(request.POST.get('days', 7))
         
         try:
-            from .tasks import aggregate_events_hourly
+            from .tasks import rebuild_daily_aggregates
 
             # Запускаем задачу
-            task = aggregate_events_hourly.delay()
+            task = rebuild_daily_aggregates.delay(days)
             task_id = task.id if hasattr(task, 'id') else 'N/A'
 
             # Логируем действие
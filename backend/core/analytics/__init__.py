@@ -0,0 +1,7 @@
+"""
+Аналитика BoltPromo: приём событий трекинга (напрямую или через Redis Stream).
+"""
+from .ingest import ingest_batch, parse_events, validate_events
+from .stream import drain as drain_event_stream, stream_stats
+
+__all__ = ('drain_event_stream', 'ingest_batch', 'parse_events', 'stream_stats', 'validate_events')
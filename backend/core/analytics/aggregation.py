@@ -0,0 +1,330 @@
+"""
+Incremental aggregation of ``Event`` into the rollup tables.
+
+Three resolutions are maintained from the same event range:
+
+* ``HourlyAgg`` - local hour, kept for ``ANALYTICS_HOURLY_RETENTION_DAYS``
+  (``compact_rollups`` drops older hours);
+* ``DailyAgg`` - local date;
+* ``MonthlyAgg`` - first day of the local month (the compacted history).
+
+A persisted high-watermark (``AggregationWatermark.last_event_id``) marks the
+last aggregated event. Each run takes strictly newer events, groups them by
+their own local time (``created_at`` in ``TIME_ZONE``), type and target, and
+applies all groups with one ``INSERT ... SELECT ... ON CONFLICT DO UPDATE``
+per table on Postgres (per-group upserts on SQLite). All three tables and the
+watermark move in one transaction, so ``core.analytics.planner`` can combine
+them with the raw events above the watermark without double counting.
+``unique_count`` of daily and monthly rows is then overwritten with the
+HyperLogLog counts (``uniques.py``), and ``PromoCode.popularity_7d`` of the
+touched promos is refreshed (``popularity.py``). A run is O(new events) and
+idempotent: repeating it finds nothing above the watermark.
+
+Event ids are assigned at insert time, so late events (stream buffer, disk
+spool) are picked up by the next run and land in their own hour/day/month.
+"""
+import logging
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count, F, Max, Q
+from django.db.models.functions import TruncDate, TruncHour, TruncMonth
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_NAME = 'daily'
+
+# Сколько событий обрабатывать в одной транзакции (первый прогон после простоя)
+CHUNK_SIZE = 200000
+
+HOURLY = 'hourly'
+DAILY = 'daily'
+MONTHLY = 'monthly'
+ROLLUPS = (HOURLY, DAILY, MONTHLY)
+
+# Таблица, колонка времени и её выражение от created_at (в локальной зоне)
+_ROLLUP_SQL = {
+    HOURLY: ('core_hourlyagg', 'hour', "date_trunc('hour', e.created_at AT TIME ZONE %(tz)s) AT TIME ZONE %(tz)s"),
+    DAILY: ('core_dailyagg', 'date', '(e.created_at AT TIME ZONE %(tz)s)::date'),
+    MONTHLY: ('core_monthlyagg', 'month', "date_trunc('month', e.created_at AT TIME ZONE %(tz)s)::date"),
+}
+
+_UPSERT_SQL = """
+INSERT INTO {table} ({column}, event_type, promo_id, store_id, showcase_id, count, unique_count)
+SELECT {expression}, e.event_type, e.promo_id, e.store_id, e.showcase_id,
+       count(*), count(*) FILTER (WHERE e.is_unique)
+FROM core_event e
+WHERE e.id > %(lower)s AND e.id <= %(upper)s {date_filter}
+GROUP BY 1, 2, 3, 4, 5
+ON CONFLICT ({column}, event_type, COALESCE(promo_id, 0), COALESCE(store_id, 0), COALESCE(showcase_id, 0))
+DO UPDATE SET count = {table}.count + EXCLUDED.count,
+              unique_count = {table}.unique_count + EXCLUDED.unique_count
+"""
+
+
+def rollup_model(resolution):
+    """(model, time field) of a rollup resolution."""
+    from ..models import DailyAgg, HourlyAgg, MonthlyAgg
+
+    return {
+        HOURLY: (HourlyAgg, 'hour'),
+        DAILY: (DailyAgg, 'date'),
+        MONTHLY: (MonthlyAgg, 'month'),
+    }[resolution]
+
+
+def local_midnight(day):
+    """Aware start of a local date."""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def settled_max_event_id(using='default'):
+    """
+    Highest Event id below which no insert is still in flight.
+
+    On Postgres a SHARE lock waits for running inserts to commit, so a
+    smaller id can no longer appear after the watermark has passed it.
+    The lock is held for a single ``max(id)`` read.
+    """
+    from ..models import Event
+
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('LOCK TABLE core_event IN SHARE MODE')
+        return Event.objects.using(using).aggregate(last=Max('id'))['last'] or 0
+
+
+def _apply_postgres(lower, upper, since=None, before=None, rollups=ROLLUPS, using='default'):
+    date_filter = ''
+    params = {'tz': settings.TIME_ZONE, 'lower': lower, 'upper': upper}
+    if since is not None:
+        date_filter += ' AND (e.created_at AT TIME ZONE %(tz)s)::date >= %(since)s'
+        params['since'] = since
+    if before is not None:
+        date_filter += ' AND (e.created_at AT TIME ZONE %(tz)s)::date < %(before)s'
+        params['before'] = before
+
+    groups = 0
+    with connections[using].cursor() as cursor:
+        for resolution in rollups:
+            table, column, expression = _ROLLUP_SQL[resolution]
+            cursor.execute(
+                _UPSERT_SQL.format(table=table, column=column, expression=expression, date_filter=date_filter),
+                params,
+            )
+            if resolution == DAILY:
+                groups = cursor.rowcount
+    return groups
+
+
+def _upsert(model, key, total, unique, using):
+    updated = model.objects.using(using).filter(**key).update(
+        count=F('count') + total,
+        unique_count=F('unique_count') + unique,
+    )
+    if not updated:
+        model.objects.using(using).create(count=total, unique_count=unique, **key)
+
+
+def _apply_fallback(lower, upper, since=None, before=None, rollups=ROLLUPS, using='default'):
+    """Per-group upsert for backends without ON CONFLICT on expressions (SQLite)."""
+    from ..models import Event
+
+    events = Event.objects.using(using).filter(id__gt=lower, id__lte=upper)
+    if since is not None:
+        events = events.filter(created_at__gte=local_midnight(since))
+    if before is not None:
+        events = events.filter(created_at__lt=local_midnight(before))
+
+    truncations = {
+        HOURLY: TruncHour('created_at'),
+        DAILY: TruncDate('created_at'),
+        MONTHLY: TruncMonth('created_at'),
+    }
+    groups = 0
+    for resolution in rollups:
+        model, field = rollup_model(resolution)
+        rows = (
+            events.annotate(bucket=truncations[resolution])
+            .values('bucket', 'event_type', 'promo_id', 'store_id', 'showcase_id')
+            .annotate(total=Count('id'), unique=Count('id', filter=Q(is_unique=True)))
+            .order_by()
+        )
+        for row in rows:
+            bucket = row['bucket']
+            if resolution == MONTHLY:
+                bucket = timezone.localtime(bucket).date() if isinstance(bucket, datetime) else bucket
+            key = {
+                field: bucket,
+                'event_type': row['event_type'],
+                'promo_id': row['promo_id'],
+                'store_id': row['store_id'],
+                'showcase_id': row['showcase_id'],
+            }
+            _upsert(model, key, row['total'], row['unique'], using)
+            if resolution == DAILY:
+                groups += 1
+    return groups
+
+
+def _apply(lower, upper, since=None, before=None, rollups=ROLLUPS, using='default'):
+    """
+    Add events with ``lower < id <= upper`` (optionally within local dates)
+    to the given rollup tables. Returns the number of daily groups.
+    """
+    apply = _apply_postgres if connections[using].vendor == 'postgresql' else _apply_fallback
+    return apply(lower, upper, since=since, before=before, rollups=rollups, using=using)
+
+
+def _persist_uniques(lower, upper, since=None, using='default'):
+    """True daily/monthly uniques from HyperLogLog; without Redis the sums of is_unique stay."""
+    from .uniques import persist_unique_counts
+
+    try:
+        persist_unique_counts(lower, upper, since=since, using=using)
+    except Exception as e:
+        logger.warning(f"Unique counts not persisted: {str(e)}")
+
+
+def _refresh_popularity(lower=0, upper=None, using='default'):
+    """PromoCode.popularity_7d: touched promos, or all of them once a day (upper=None - all)."""
+    from .popularity import refresh_after_aggregation, refresh_popularity
+
+    try:
+        if upper is None:
+            refresh_popularity(using=using)
+        else:
+            refresh_after_aggregation(lower, upper, using=using)
+    except Exception as e:
+        logger.warning(f"Popularity not refreshed: {str(e)}")
+
+
+def aggregate_new_events(using='default'):
+    """
+    Aggregate events above the watermark into HourlyAgg, DailyAgg and MonthlyAgg.
+
+    Returns:
+        dict: {'events_from': id, 'events_to': id, 'groups': n}
+    """
+    from ..models import AggregationWatermark
+
+    upper = settled_max_event_id(using)
+    stats = {'events_from': None, 'events_to': None, 'groups': 0}
+
+    while True:
+        with transaction.atomic(using=using):
+            # Блокировка строки: параллельные запуски ждут друг друга
+            watermark, _ = AggregationWatermark.objects.using(using).select_for_update().get_or_create(
+                name=WATERMARK_NAME
+            )
+            lower = watermark.last_event_id
+            if lower >= upper:
+                break
+            chunk_upper = min(upper, lower + CHUNK_SIZE)
+
+            stats['groups'] += _apply(lower, chunk_upper, using=using)
+            _persist_uniques(lower, chunk_upper, using=using)
+            if stats['events_from'] is None:
+                stats['events_from'] = lower + 1
+            stats['events_to'] = chunk_upper
+
+            watermark.last_event_id = chunk_upper
+            watermark.save(update_fields=['last_event_id', 'updated_at'])
+
+    _refresh_popularity((stats['events_from'] or 1) - 1, stats['events_to'] or 0, using=using)
+
+    if stats['events_to']:
+        logger.info(
+            f"Events aggregated: ids {stats['events_from']}..{stats['events_to']}, {stats['groups']} groups"
+        )
+    return stats
+
+
+def _rebuild_months_from_days(month_start, using='default'):
+    """Recompute MonthlyAgg from month_start on as sums of DailyAgg."""
+    from ..models import DailyAgg, MonthlyAgg
+
+    totals = {}
+    rows = (
+        DailyAgg.objects.using(using).filter(date__gte=month_start)
+        .values('date', 'event_type', 'promo_id', 'store_id', 'showcase_id', 'count', 'unique_count')
+    )
+    for row in rows.iterator():
+        key = (row['date'].replace(day=1), row['event_type'], row['promo_id'], row['store_id'], row['showcase_id'])
+        total = totals.setdefault(key, [0, 0])
+        total[0] += row['count']
+        total[1] += row['unique_count']
+
+    MonthlyAgg.objects.using(using).bulk_create([
+        MonthlyAgg(
+            month=month, event_type=event_type, promo_id=promo_id, store_id=store_id, showcase_id=showcase_id,
+            count=count, unique_count=unique_count,
+        )
+        for (month, event_type, promo_id, store_id, showcase_id), (count, unique_count) in totals.items()
+    ], batch_size=1000)
+
+
+def rebuild_daily_aggregates(days, using='default'):
+    """
+    Recompute the rollups for the last ``days`` days from raw events.
+
+    Hourly and daily rows of those dates are deleted and rebuilt from all
+    events up to the current settled id; the watermark moves there too.
+    Months touched by the window are re-summed from DailyAgg (their earlier
+    days are no longer in the raw events). Days older than the raw event
+    retention (cleanup_old_events) must not be rebuilt.
+
+    Returns:
+        dict: {'since': date, 'deleted': n, 'groups': n}
+    """
+    from ..models import AggregationWatermark, DailyAgg, HourlyAgg, MonthlyAgg
+
+    since = timezone.localdate() - timedelta(days=days)
+    month_start = since.replace(day=1)
+    upper = settled_max_event_id(using)
+
+    with transaction.atomic(using=using):
+        watermark, _ = AggregationWatermark.objects.using(using).select_for_update().get_or_create(
+            name=WATERMARK_NAME
+        )
+        deleted, _ = DailyAgg.objects.using(using).filter(date__gte=since).delete()
+        HourlyAgg.objects.using(using).filter(hour__gte=local_midnight(since)).delete()
+        MonthlyAgg.objects.using(using).filter(month__gte=month_start).delete()
+
+        groups = _apply(0, upper, since=since, rollups=(HOURLY, DAILY), using=using)
+        # Новые события за более ранние дни догружаем как при обычном прогоне
+        groups += _apply(watermark.last_event_id, upper, before=since, rollups=(HOURLY, DAILY), using=using)
+        _apply(watermark.last_event_id, upper, before=month_start, rollups=(MONTHLY,), using=using)
+        _rebuild_months_from_days(month_start, using=using)
+        _persist_uniques(0, upper, since=month_start, using=using)
+
+        watermark.last_event_id = max(upper, watermark.last_event_id)
+        watermark.save(update_fields=['last_event_id', 'updated_at'])
+
+    _refresh_popularity(using=using)
+
+    logger.info(f"Rollups rebuilt since {since}: {deleted} daily rows replaced by {groups} groups")
+    return {'since': since.isoformat(), 'deleted': deleted, 'groups': groups}
+
+
+def compact_rollups(using='default'):
+    """
+    Drop HourlyAgg rows older than ``ANALYTICS_HOURLY_RETENTION_DAYS``.
+
+    Older history is answered by DailyAgg/MonthlyAgg, so hourly rows are
+    only needed for recent ranges and range edges.
+
+    Returns:
+        dict: {'before': datetime, 'deleted': n}
+    """
+    from ..models import HourlyAgg
+
+    before = local_midnight(timezone.localdate() - timedelta(days=settings.ANALYTICS_HOURLY_RETENTION_DAYS))
+    deleted, _ = HourlyAgg.objects.using(using).filter(hour__lt=before).delete()
+    if deleted:
+        logger.info(f"HourlyAgg compacted: {deleted} rows before {before:%Y-%m-%d}")
+    return {'before': before.isoformat(), 'deleted': deleted}
@@ -0,0 +1,193 @@
+"""
+Batch ingestion of tracking events.
+
+A request batch is validated in memory, its sessions are added to the
+HyperLogLog unique counters with one Redis pipeline (``uniques.py``) and
+the batch is written with a single ``bulk_create`` (``direct`` mode) or
+appended to the Redis Stream buffer (``buffered`` mode, see ``stream.py``). The old per-event path cost ~3
+round-trips per event.
+
+Redis and Postgres calls go through per-process circuit breakers. When a
+backend is failing the batch is appended to the local disk spool
+(``spool.py``) instead, so a Redis/DB incident neither loses events nor
+makes every request wait out connection timeouts. Only connection-level
+errors count as breaker failures: rows the database rejects (bad ids from
+a client) are dropped by ``insert_events``, not treated as an outage.
+
+Accepted batches also bump the live Redis leaderboards (``leaderboard.py``).
+"""
+import logging
+
+from django.utils import timezone
+
+from ..utils.circuit_breaker import CircuitBreaker
+from . import leaderboard, spool, stream, uniques
+
+logger = logging.getLogger(__name__)
+
+redis_breaker = CircuitBreaker('analytics-redis')
+db_breaker = CircuitBreaker('analytics-db')
+
+# Больше событий за запрос фронтенд не шлёт (batchSize = 10), остальное - мусор
+MAX_BATCH_SIZE = 100
+
+_FK_FIELDS = ('promo_id', 'store_id', 'showcase_id')
+_TEXT_FIELDS = {
+    'session_id': 64,
+    'ref': 100,
+    'utm_source': 100,
+    'utm_medium': 100,
+    'utm_campaign': 100,
+}
+_EVENT_TYPE_MAX_LENGTH = 40
+
+
+def parse_events(data):
+    """
+    Extract the list of raw events from a request body.
+
+    Body: ``{"events": [{...}]}`` or a single event object ``{...}``.
+    """
+    if not isinstance(data, dict):
+        return []
+    if 'events' in data:
+        events = data['events']
+        return events if isinstance(events, list) else []
+    if 'event_type' in data:
+        # Одиночное событие - оборачиваем в массив
+        return [data]
+    return []
+
+
+def _to_id(value):
+    if value in (None, ''):
+        return None
+    if isinstance(value, bool):
+        raise ValueError('boolean id')
+    value = int(value)
+    if value <= 0:
+        raise ValueError('non-positive id')
+    return value
+
+
+def validate_events(events_data, client_ip=None, user_agent=''):
+    """
+    Validate raw events in memory.
+
+    Returns:
+        tuple: (rows, rejected) - rows are ``Event`` field dicts ready for
+        ``bulk_create``, rejected is the number of dropped events
+    """
+    rows = []
+    rejected = max(len(events_data) - MAX_BATCH_SIZE, 0)
+    created_at = timezone.now()
+
+    for event_data in events_data[:MAX_BATCH_SIZE]:
+        if not isinstance(event_data, dict):
+            rejected += 1
+            continue
+
+        event_type = event_data.get('event_type')
+        if not event_type or not isinstance(event_type, str) or len(event_type) > _EVENT_TYPE_MAX_LENGTH:
+            rejected += 1
+            continue
+
+        try:
+            row = {field: _to_id(event_data.get(field)) for field in _FK_FIELDS}
+        except (TypeError, ValueError):
+            rejected += 1
+            continue
+
+        for field, max_length in _TEXT_FIELDS.items():
+            value = event_data.get(field) or ''
+            row[field] = str(value)[:max_length]
+
+        row.update(
+            created_at=created_at,
+            event_type=event_type,
+            client_ip=client_ip,
+            user_agent=user_agent,
+            is_unique=False,
+        )
+        rows.append(row)
+
+    return rows, rejected
+
+
+def write_events(rows):
+    """Insert validated rows with one ``bulk_create``. Returns the number written."""
+    from ..models import Event
+
+    if not rows:
+        return 0
+    rejected = stream.insert_events([Event(**row) for row in rows])
+    return len(rows) - len(rejected)
+
+
+def _is_outage(exc):
+    """Backend unavailable (counts toward the breaker), as opposed to a bad request or a bug."""
+    import redis
+    from django.db import InterfaceError, OperationalError
+
+    return isinstance(exc, (
+        OperationalError, InterfaceError, redis.ConnectionError, redis.TimeoutError, ConnectionError, TimeoutError,
+    ))
+
+
+def _call(breaker, func, *args):
+    """Run ``func`` behind a circuit breaker. Returns (ok, result)."""
+    if not breaker.allow():
+        return False, None
+    try:
+        result = func(*args)
+    except Exception as e:
+        # Пробный вызов half-open должен закрыть или снова открыть breaker:
+        # ошибка данных/кода - бэкенд ответил, это не сбой
+        if _is_outage(e):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        logger.error(f"{breaker.name} call failed: {str(e)}")
+        return False, None
+    breaker.record_success()
+    return True, result
+
+
+def ingest_batch(events_data, client_ip=None, user_agent=''):
+    """
+    Validate, deduplicate and store a batch of raw events.
+
+    Returns:
+        dict: ``{'accepted': n, 'deduplicated': n, 'rejected': n, 'sink': ...}``,
+        sink is where the batch went: ``db``, ``stream`` or ``spool``
+    """
+    rows, rejected = validate_events(events_data, client_ip=client_ip, user_agent=user_agent)
+    # Redis недоступен - события сохраняются с is_unique=False
+    _, deduplicated = _call(redis_breaker, uniques.mark_unique, rows)
+    result = {'accepted': len(rows), 'deduplicated': deduplicated or 0, 'rejected': rejected, 'sink': 'db'}
+    if not rows:
+        return result
+
+    # Живые топы обновляются сразу, куда бы ни ушёл сам батч.
+    # offer_type - из кэша процесса; недостающие грузятся через db_breaker
+    promo_ids = {row['promo_id'] for row in rows if row['promo_id']}
+    missing = leaderboard.stale_offer_types(promo_ids)
+    if missing:
+        _call(db_breaker, leaderboard.load_offer_types, missing)
+    _call(redis_breaker, leaderboard.record, rows, leaderboard.offer_types(promo_ids))
+
+    if stream.buffered_mode():
+        ok, entry_id = _call(redis_breaker, stream.enqueue, rows)
+        if ok and entry_id is not None:
+            result['sink'] = 'stream'
+            return result
+
+    ok, written = _call(db_breaker, write_events, rows)
+    if ok:
+        result['accepted'] = written
+        result['rejected'] += len(rows) - written
+    else:
+        # Postgres недоступен - на диск, replay_spool загрузит позже
+        spool.append(rows)
+        result['sink'] = 'spool'
+    return result
@@ -0,0 +1,204 @@
+"""
+Live top-N leaderboards on Redis sorted sets.
+
+Every accepted tracking batch increments per-day sorted sets (one pipeline
+of ``ZINCRBY``):
+
+* ``promo`` - click events (``CLICK_EVENT_TYPES``) per promo id;
+* ``store`` - all events per store id;
+* ``type`` - all events with a promo, per promo ``offer_type``.
+
+Day keys expire ``ANALYTICS_LEADERBOARD_DAYS`` after the day ends. Top-N for
+``range=Nd`` is one ``ZUNIONSTORE`` over the day keys (the union is kept a
+few seconds for concurrent readers) and a ``ZREVRANGE``; no SQL aggregation
+on read. Offer types come from a per-process cache that ingest refreshes
+through the DB circuit breaker; while the database is down the stale map is
+used and promos never seen by the process are left out of ``type``.
+
+Increments happen at ingest time, so a retried stream entry, a lost
+pipeline or a missing offer type can skew a day slightly; ``reconcile``
+rewrites past days from the rollups (nightly task ``reconcile_leaderboards``).
+"""
+import logging
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from ..utils.redis import get_redis_client, make_key
+from .aggregation import local_midnight
+
+logger = logging.getLogger(__name__)
+
+# Клики по карточкам (Event.event_type), учитываются в топах промокодов
+CLICK_EVENT_TYPES = [
+    'copy', 'open',
+    'promo_copy', 'promo_open',
+    'finance_open', 'deal_open'
+]
+
+PROMO = 'promo'
+STORE = 'store'
+TYPE = 'type'
+DIMENSIONS = (PROMO, STORE, TYPE)
+
+# Сколько секунд живёт результат ZUNIONSTORE
+UNION_TTL = 5
+
+# offer_type промокодов в памяти процесса: на горячем пути без запросов к БД
+OFFER_TYPE_TTL = 60 * 10
+_offer_types = {}
+
+
+def day_key(dimension, day):
+    return make_key(f'analytics:top:{dimension}:{day:%Y%m%d}')
+
+
+def _expire_at(day):
+    return int(local_midnight(day + timedelta(days=settings.ANALYTICS_LEADERBOARD_DAYS + 1)).timestamp())
+
+
+def stale_offer_types(promo_ids):
+    """Ids whose offer_type is not cached in this process or has expired."""
+    now = time.monotonic()
+    return {
+        promo_id for promo_id in promo_ids
+        if promo_id not in _offer_types or _offer_types[promo_id][1] < now
+    }
+
+
+def load_offer_types(promo_ids):
+    """Fetch offer_type of ``promo_ids`` into the process cache (one query)."""
+    from ..models import PromoCode
+
+    expires = time.monotonic() + OFFER_TYPE_TTL
+    for promo_id, offer_type in PromoCode.objects.filter(id__in=promo_ids).values_list('id', 'offer_type'):
+        _offer_types[promo_id] = (offer_type, expires)
+
+
+def offer_types(promo_ids):
+    """promo_id -> offer_type from the process cache (expired entries included); unknown ids are skipped."""
+    return {promo_id: _offer_types[promo_id][0] for promo_id in promo_ids if promo_id in _offer_types}
+
+
+def _increments(rows, types):
+    counters = {dimension: Counter() for dimension in DIMENSIONS}
+    for row in rows:
+        if row['promo_id']:
+            if row['event_type'] in CLICK_EVENT_TYPES:
+                counters[PROMO][row['promo_id']] += 1
+            if row['promo_id'] in types:
+                counters[TYPE][types[row['promo_id']]] += 1
+        if row['store_id']:
+            counters[STORE][row['store_id']] += 1
+    return counters
+
+
+def record(rows, types):
+    """
+    Add validated rows to today's leaderboards with one pipeline.
+
+    ``types`` is the promo_id -> offer_type map (``offer_types``); the caller
+    loads it, so this function never touches the database.
+
+    Returns:
+        int: number of ZINCRBY commands sent (0 without Redis)
+    """
+    client = get_redis_client()
+    if client is None or not rows:
+        return 0
+
+    day = timezone.localdate()
+    expire_at = _expire_at(day)
+    pipe = client.pipeline(transaction=False)
+    commands = 0
+    for dimension, counter in _increments(rows, types).items():
+        if not counter:
+            continue
+        key = day_key(dimension, day)
+        for member, amount in counter.items():
+            pipe.zincrby(key, amount, member)
+            commands += 1
+        pipe.expireat(key, expire_at)
+    if commands:
+        pipe.execute()
+    return commands
+
+
+def top(dimension, days, limit=10):
+    """
+    Top members of ``dimension`` from local midnight ``days`` ago until now.
+
+    Returns:
+        list: ``(member, score)`` pairs, best first (member is a str), or
+        None if Redis is unavailable or the range exceeds the retention
+    """
+    if days > settings.ANALYTICS_LEADERBOARD_DAYS:
+        return None
+    client = get_redis_client()
+    if client is None:
+        return None
+
+    today = timezone.localdate()
+    first = today - timedelta(days=days)
+    if days == 0:
+        key = day_key(dimension, today)
+    else:
+        key = make_key(f'analytics:top:{dimension}:{first:%Y%m%d}-{today:%Y%m%d}')
+        if not client.exists(key):
+            pipe = client.pipeline(transaction=False)
+            pipe.zunionstore(key, [day_key(dimension, first + timedelta(days=i)) for i in range(days + 1)])
+            pipe.expire(key, UNION_TTL)
+            pipe.execute()
+
+    members = client.zrevrange(key, 0, (limit or 0) - 1, withscores=True)
+    return [
+        (member.decode() if isinstance(member, bytes) else member, int(score))
+        for member, score in members
+    ]
+
+
+def reconcile(days=None):
+    """
+    Rewrite the leaderboards of the last ``days`` complete days from the rollups
+    (all retained days by default).
+
+    Today is left alone: its numbers are still being incremented.
+
+    Returns:
+        dict: {'days': n, 'members': n}
+    """
+    from .planner import rollup_totals
+
+    client = get_redis_client()
+    stats = {'days': 0, 'members': 0}
+    if client is None:
+        return stats
+
+    days = days or settings.ANALYTICS_LEADERBOARD_DAYS
+    today = timezone.localdate()
+    sources = {
+        PROMO: (('promo_id',), {'event_type__in': CLICK_EVENT_TYPES, 'promo__isnull': False}),
+        STORE: (('store_id',), {'store__isnull': False}),
+        TYPE: (('promo__offer_type',), {'promo__isnull': False}),
+    }
+    for offset in range(1, days + 1):
+        day = today - timedelta(days=offset)
+        start, end = local_midnight(day), local_midnight(day + timedelta(days=1))
+        pipe = client.pipeline(transaction=True)
+        for dimension, (group_by, filters) in sources.items():
+            totals = rollup_totals(start, end, group_by, **filters)
+            key = day_key(dimension, day)
+            pipe.delete(key)
+            mapping = {str(item[group_by[0]]): item['count'] for item in totals if item['count']}
+            if mapping:
+                pipe.zadd(key, mapping)
+                pipe.expireat(key, _expire_at(day))
+            stats['members'] += len(mapping)
+        pipe.execute()
+        stats['days'] += 1
+
+    logger.info(f"Leaderboards reconciled: {stats['days']} days, {stats['members']} members")
+    return stats
@@ -0,0 +1,261 @@
+"""
+Query planner over the analytics rollups.
+
+A requested ``[start, end)`` range is aligned to local hours and split into
+the coarsest pieces that cover it:
+
+* whole local months -> ``MonthlyAgg``;
+* remaining whole days -> ``DailyAgg``;
+* partial days at the range edges -> ``HourlyAgg`` (edges older than the
+  hourly retention are widened to whole days);
+* events above the aggregation watermark (not rolled up yet, normally the
+  last hour) -> raw ``Event`` by primary key range.
+
+Each resolution is read with one grouped query, so a stats request costs at
+most four queries whatever the length of the range and of the history.
+
+Time series (``granularity`` hour/day/week) are read from a single table -
+``HourlyAgg`` for hours, ``DailyAgg`` for days and weeks - UNION ALL the
+raw tail, grouped by bucket in one statement.
+"""
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate, TruncHour, TruncWeek
+from django.utils import timezone
+
+from .aggregation import DAILY, HOURLY, MONTHLY, WATERMARK_NAME, local_midnight, rollup_model
+
+# Сколько раз перечитывать, если агрегация сдвинула водяной знак во время чтения
+MAX_ATTEMPTS = 3
+
+HOUR = 'hour'
+DAY = 'day'
+WEEK = 'week'
+GRANULARITIES = (HOUR, DAY, WEEK)
+
+
+def _floor_hour(value):
+    return timezone.localtime(value).replace(minute=0, second=0, microsecond=0)
+
+
+def _ceil_hour(value):
+    floored = _floor_hour(value)
+    return floored if floored == value else floored + timedelta(hours=1)
+
+
+def _next_month(day):
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def _merge(ranges):
+    merged = []
+    for lo, hi in sorted(ranges):
+        if merged and lo <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(hi, merged[-1][1]))
+        else:
+            merged.append((lo, hi))
+    return merged
+
+
+def plan(start, end):
+    """
+    Split ``[start, end)`` into rollup segments.
+
+    Returns:
+        list: ``(resolution, lo, hi)`` half-open ranges; datetimes for
+        hourly segments, dates for daily and monthly ones
+    """
+    start, end = _floor_hour(start), _ceil_hour(end)
+    if start >= end:
+        return []
+
+    first_day = start.date() if start == local_midnight(start.date()) else start.date() + timedelta(days=1)
+    last_day = end.date()
+    if first_day >= last_day:
+        hours = [(start, end)]
+        days = []
+    else:
+        hours = [(start, local_midnight(first_day)), (local_midnight(last_day), end)]
+        days = [(first_day, last_day)]
+
+    hourly_from = local_midnight(timezone.localdate() - timedelta(days=settings.ANALYTICS_HOURLY_RETENTION_DAYS))
+    segments = []
+    for lo, hi in hours:
+        if lo >= hi:
+            continue
+        if lo < hourly_from:
+            # Часовые строки уже удалены compact_rollups - берём день целиком
+            hi_day = hi.date() if hi == local_midnight(hi.date()) else hi.date() + timedelta(days=1)
+            days.append((lo.date(), hi_day))
+        else:
+            segments.append((HOURLY, lo, hi))
+
+    for lo, hi in _merge(days):
+        month_lo = lo if lo.day == 1 else _next_month(lo)
+        month_hi = hi.replace(day=1)
+        if month_lo < month_hi:
+            segments.append((MONTHLY, month_lo, month_hi))
+            for day_lo, day_hi in ((lo, month_lo), (month_hi, hi)):
+                if day_lo < day_hi:
+                    segments.append((DAILY, day_lo, day_hi))
+        else:
+            segments.append((DAILY, lo, hi))
+    return segments
+
+
+def current_watermark():
+    from ..models import AggregationWatermark
+
+    return AggregationWatermark.objects.filter(name=WATERMARK_NAME).values_list(
+        'last_event_id', flat=True
+    ).first() or 0
+
+
+def _querysets(start, end, watermark):
+    """(queryset, count expression, unique expression) per resolution + raw tail."""
+    from ..models import Event
+
+    conditions = defaultdict(Q)
+    for resolution, lo, hi in plan(start, end):
+        field = rollup_model(resolution)[1]
+        conditions[resolution] |= Q(**{f'{field}__gte': lo, f'{field}__lt': hi})
+
+    for resolution, condition in conditions.items():
+        model = rollup_model(resolution)[0]
+        yield model.objects.filter(condition), Sum('count'), Sum('unique_count')
+
+    tail = Event.objects.filter(
+        id__gt=watermark, created_at__gte=_floor_hour(start), created_at__lt=_ceil_hour(end)
+    )
+    yield tail, Count('id'), Count('id', filter=Q(is_unique=True))
+
+
+def rollup_totals(start, end, group_by, **filters):
+    """
+    Event counts in ``[start, end)`` grouped by ``group_by``.
+
+    Args:
+        start, end: aware datetimes (aligned to local hours)
+        group_by: field names shared by Event and the rollups
+            ('event_type', 'promo_id', 'promo__title', 'store__name', ...)
+        **filters: lookups over the same fields
+
+    Returns:
+        list: dicts with the ``group_by`` values plus 'count' and 'unique_count'
+    """
+    group_by = tuple(group_by)
+    for _ in range(MAX_ATTEMPTS):
+        watermark = current_watermark()
+        totals = defaultdict(lambda: [0, 0])
+        for queryset, count, unique in _querysets(start, end, watermark):
+            rows = queryset.filter(**filters).values(*group_by).annotate(total=count, unique=unique).order_by()
+            for row in rows:
+                total = totals[tuple(row[field] for field in group_by)]
+                total[0] += row['total'] or 0
+                total[1] += row['unique'] or 0
+        # Агрегация закоммитила новый кусок между чтениями - иначе он посчитается дважды
+        if current_watermark() == watermark:
+            break
+
+    return [
+        {**dict(zip(group_by, key)), 'count': count, 'unique_count': unique}
+        for key, (count, unique) in totals.items()
+    ]
+
+
+def range_for_days(days):
+    """``range=Nd`` of the stats API: from local midnight N days ago until now."""
+    return local_midnight(timezone.localdate() - timedelta(days=days)), timezone.now()
+
+
+def normalize_range(start, end, granularity):
+    """Align ``[start, end)`` outwards to whole buckets of the granularity."""
+    start, end = _floor_hour(start), _ceil_hour(end)
+    if granularity == HOUR:
+        return start, end
+
+    start_day = start.date()
+    end_day = end.date() if end == local_midnight(end.date()) else end.date() + timedelta(days=1)
+    if granularity == WEEK:
+        start_day -= timedelta(days=start_day.weekday())
+        end_day += timedelta(days=-end_day.weekday() % 7)
+    return local_midnight(start_day), local_midnight(end_day)
+
+
+def bucket_starts(start, end, granularity):
+    """Bucket keys of a normalized range: local datetimes for hours, dates for days/weeks."""
+    if granularity == HOUR:
+        step, current, last = timedelta(hours=1), start, end
+    else:
+        step = timedelta(days=7 if granularity == WEEK else 1)
+        current, last = timezone.localtime(start).date(), timezone.localtime(end).date()
+    buckets = []
+    while current < last:
+        buckets.append(current)
+        current += step
+    return buckets
+
+
+def _series_querysets(start, end, granularity, watermark):
+    from ..models import Event
+
+    if granularity == HOUR:
+        model, field = rollup_model(HOURLY)
+        lo, hi = start, end
+        # Хвост режем по часам в UTC: колонка UNION берёт тип/конвертер HourlyAgg.hour (момент времени),
+        # а локальный срез даёт timestamp без зоны. Для зон с целым смещением часы совпадают
+        rollup_bucket, tail_bucket = F('hour'), TruncHour('created_at', tzinfo=dt_timezone.utc)
+    else:
+        model, field = rollup_model(DAILY)
+        lo, hi = timezone.localtime(start).date(), timezone.localtime(end).date()
+        if granularity == WEEK:
+            rollup_bucket, tail_bucket = TruncWeek('date'), TruncWeek(TruncDate('created_at'))
+        else:
+            rollup_bucket, tail_bucket = F('date'), TruncDate('created_at')
+
+    rollups = model.objects.filter(**{f'{field}__gte': lo, f'{field}__lt': hi}).annotate(bucket=rollup_bucket)
+    tail = Event.objects.filter(
+        id__gt=watermark, created_at__gte=start, created_at__lt=end
+    ).annotate(bucket=tail_bucket)
+    return (
+        (rollups, Sum('count'), Sum('unique_count')),
+        (tail, Count('id'), Count('id', filter=Q(is_unique=True))),
+    )
+
+
+def rollup_series(start, end, granularity, group_by, **filters):
+    """
+    Event counts per time bucket in a normalized ``[start, end)``.
+
+    One UNION ALL statement: the rollup table of the granularity grouped by
+    bucket and ``group_by``, plus the not yet aggregated events grouped the
+    same way.
+
+    Returns:
+        list: dicts with 'bucket', the ``group_by`` values, 'count' and 'unique_count'
+    """
+    group_by = tuple(group_by)
+    for _ in range(MAX_ATTEMPTS):
+        watermark = current_watermark()
+        parts = [
+            queryset.filter(**filters).values('bucket', *group_by).annotate(total=count, unique=unique).order_by()
+            for queryset, count, unique in _series_querysets(start, end, granularity, watermark)
+        ]
+        totals = defaultdict(lambda: [0, 0])
+        for row in parts[0].union(*parts[1:], all=True):
+            bucket = row['bucket']
+            if granularity == HOUR:
+                bucket = _floor_hour(bucket)
+            total = totals[(bucket, *(row[field] for field in group_by))]
+            total[0] += row['total'] or 0
+            total[1] += row['unique'] or 0
+        if current_watermark() == watermark:
+            break
+
+    return [
+        {'bucket': key[0], **dict(zip(group_by, key[1:])), 'count': count, 'unique_count': unique}
+        for key, (count, unique) in totals.items()
+    ]
@@ -0,0 +1,97 @@
+"""
+Denormalized popularity of promo codes for ``ordering=popular``.
+
+``PromoCode.popularity_7d`` holds the usage (clicks and copies, see
+``USAGE_EVENT_TYPES``) of the last ``WINDOW_DAYS`` local days plus today,
+summed from ``DailyAgg``; ``PromoCode.has_badge`` is a generated column
+(``is_hot OR is_recommended``). The popular ordering is then a plain
+``ORDER BY`` on the ``idx_promo_popular`` index instead of an aggregate over
+the ``DailyAgg`` join on every request.
+
+The aggregation run refreshes the promos touched by the new events; once a
+day (the window slides at local midnight) all promos are recomputed.
+"""
+import logging
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from ..utils.cache import invalidate_tags, ranking_tag
+from .leaderboard import CLICK_EVENT_TYPES
+
+logger = logging.getLogger(__name__)
+
+# Использование промокода; 'click' - тип событий из старого трекинга
+USAGE_EVENT_TYPES = ['click', *CLICK_EVENT_TYPES]
+
+WINDOW_DAYS = 7
+
+# Дата последнего полного пересчёта (окно сдвигается в полночь)
+REFRESHED_ON_KEY = 'analytics:popularity:refreshed_on'
+
+
+def refresh_popularity(promo_ids=None, using='default'):
+    """
+    Recompute ``popularity_7d`` of the given promos (all if None) from DailyAgg.
+
+    Only rows whose value changed are written.
+
+    Returns:
+        int: number of updated promos
+    """
+    from ..models import DailyAgg, PromoCode
+
+    since = timezone.localdate() - timedelta(days=WINDOW_DAYS)
+    usage = DailyAgg.objects.using(using).filter(
+        date__gte=since, event_type__in=USAGE_EVENT_TYPES, promo__isnull=False
+    )
+    promos = PromoCode.objects.using(using)
+    if promo_ids is not None:
+        promo_ids = list(promo_ids)
+        if not promo_ids:
+            return 0
+        usage = usage.filter(promo_id__in=promo_ids)
+        promos = promos.filter(id__in=promo_ids)
+
+    totals = dict(usage.values('promo_id').annotate(total=Sum('count')).values_list('promo_id', 'total'))
+
+    changed = []
+    candidates = promos.filter(Q(id__in=list(totals)) | Q(popularity_7d__gt=0)).only('id', 'popularity_7d')
+    for promo in candidates.iterator():
+        total = totals.get(promo.id, 0)
+        if promo.popularity_7d != total:
+            promo.popularity_7d = total
+            changed.append(promo)
+    PromoCode.objects.using(using).bulk_update(changed, ['popularity_7d'], batch_size=1000)
+    if changed:
+        transaction.on_commit(lambda: invalidate_tags(ranking_tag('popular')), using=using)
+    return len(changed)
+
+
+def refresh_after_aggregation(lower, upper, using='default'):
+    """
+    Refresh popularity after an aggregation run over events ``lower < id <= upper``.
+
+    Returns:
+        int: number of updated promos
+    """
+    from ..models import Event
+
+    today = timezone.localdate().isoformat()
+    if cache.get(REFRESHED_ON_KEY) != today:
+        updated = refresh_popularity(using=using)
+        cache.set(REFRESHED_ON_KEY, today, timeout=60 * 60 * 24 * 2)
+        logger.info(f"Popularity recomputed for all promos: {updated} updated")
+        return updated
+
+    if upper is None or upper <= lower:
+        return 0
+    touched = (
+        Event.objects.using(using)
+        .filter(id__gt=lower, id__lte=upper, event_type__in=USAGE_EVENT_TYPES, promo__isnull=False)
+        .values_list('promo_id', flat=True).distinct().order_by()
+    )
+    return refresh_popularity(touched, using=using)
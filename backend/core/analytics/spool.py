@@ -0,0 +1,262 @@
+"""
+Local disk spool for tracking events.
+
+When Postgres (and the Redis buffer) are unavailable, validated batches are
+appended to a per-process spool file: one record is a 4-byte big-endian
+length followed by the JSON-encoded rows. Appending is a single ``write()``
+without fsync, so ingestion latency stays flat during an incident.
+
+Files rotate by size/age: the active file is ``<host>-<pid>-<n>.open``,
+closed files are renamed to ``.spool``. ``replay_spool`` (command and Celery
+task) claims closed files by renaming them to ``.replaying`` (an ``.open``
+file only once its writer process on this host is gone), bulk-loads the
+records into ``Event`` and deletes them. Every event gets a deterministic
+``ingest_id`` derived from file and position, so a replay interrupted half
+way can safely be repeated. Events the database rejects (``insert_events``)
+are quarantined to a ``.rejected`` file instead of failing the whole file
+on every replay; only connection errors leave the file for the next run.
+"""
+import hashlib
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+from .stream import decode_row, encode_row, insert_events
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('>I')
+
+OPEN_SUFFIX = '.open'
+CLOSED_SUFFIX = '.spool'
+REPLAYING_SUFFIX = '.replaying'
+# События, отвергнутые БД при загрузке (тот же формат записей, разбираются вручную)
+REJECTED_SUFFIX = '.rejected'
+
+# .open файл без записи дольше этого времени и без живого процесса-владельца
+# считается брошенным; так же долго может висеть .replaying упавшего прогона
+ABANDONED_AFTER = 60 * 10
+
+
+def spool_dir():
+    return Path(settings.ANALYTICS_SPOOL_DIR)
+
+
+class SpoolWriter:
+    """Append-only writer of one process; rotates by size and age."""
+
+    def __init__(self, directory=None, max_bytes=None, max_age=None):
+        self.directory = Path(directory or spool_dir())
+        self.max_bytes = max_bytes or settings.ANALYTICS_SPOOL_MAX_BYTES
+        self.max_age = max_age or settings.ANALYTICS_SPOOL_MAX_AGE
+        self._lock = threading.Lock()
+        self._fd = None
+        self._path = None
+        self._opened_at = 0.0
+        self._size = 0
+        self._seq = 0
+        self.pid = os.getpid()
+
+    def _open(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._seq += 1
+        name = f"{socket.gethostname()}-{os.getpid()}-{int(time.time())}-{self._seq}{OPEN_SUFFIX}"
+        self._path = self.directory / name
+        self._fd = os.open(self._path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o640)
+        self._opened_at = time.monotonic()
+        self._size = 0
+
+    def _close(self):
+        if self._fd is None:
+            return
+        fd, path = self._fd, self._path
+        # Сбрасываем до rename: при ошибке следующий append откроет новый файл
+        self._fd = None
+        self._path = None
+        os.close(fd)
+        try:
+            os.rename(path, path.with_suffix(CLOSED_SUFFIX))
+        except FileNotFoundError:
+            # Файл уже забрал replay (считал его брошенным)
+            logger.warning(f"Spool file {path.name} was claimed while open")
+
+    def append(self, rows):
+        """Append one batch as a length-prefixed record."""
+        payload = json.dumps([encode_row(row) for row in rows], ensure_ascii=False).encode()
+        record = _HEADER.pack(len(payload)) + payload
+        with self._lock:
+            if self._fd is not None and (
+                self._size >= self.max_bytes or time.monotonic() - self._opened_at >= self.max_age
+            ):
+                self._close()
+            if self._fd is None:
+                self._open()
+            os.write(self._fd, record)
+            self._size += len(record)
+
+    def rotate(self):
+        """Close the active file so it becomes replayable."""
+        with self._lock:
+            self._close()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+    with _writer_lock:
+        # После fork (gunicorn/celery) у дочернего процесса свой файл
+        if _writer is None or _writer.pid != os.getpid():
+            _writer = SpoolWriter()
+        return _writer
+
+
+def append(rows):
+    get_writer().append(rows)
+
+
+def read_records(path):
+    """
+    Yield decoded batches from a spool file.
+
+    A truncated trailing record (process killed mid-write) is skipped.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    offset = 0
+    while offset + _HEADER.size <= len(data):
+        (length,) = _HEADER.unpack_from(data, offset)
+        start = offset + _HEADER.size
+        if start + length > len(data):
+            logger.warning(f"Truncated spool record in {path.name} at offset {offset}")
+            return
+        yield json.loads(data[start:start + length])
+        offset = start + length
+
+
+def _writer_alive(path):
+    """True if the writer of an ``.open`` file may still be running."""
+    try:
+        host, pid, _, _ = path.stem.rsplit('-', 3)
+        pid = int(pid)
+    except ValueError:
+        return False
+    if host != socket.gethostname():
+        # Процессы другого хоста не проверить - остаётся только ABANDONED_AFTER
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _claim_files(directory):
+    """Rename replayable files to .replaying; returns claimed paths."""
+    now = time.time()
+    claimed = []
+    for path in sorted(directory.iterdir()):
+        if path.suffix == OPEN_SUFFIX:
+            # Брошенный файл умершего процесса; простаивающий файл живого
+            # процесса (и свой активный) не трогаем - владелец допишет его
+            try:
+                if now - path.stat().st_mtime < ABANDONED_AFTER or _writer_alive(path):
+                    continue
+            except FileNotFoundError:
+                continue
+        elif path.suffix != CLOSED_SUFFIX:
+            continue
+        target = path.with_suffix(REPLAYING_SUFFIX)
+        try:
+            os.rename(path, target)
+        except FileNotFoundError:
+            # Забрал другой воркер
+            continue
+        # mtime = время захвата, по нему определяются зависшие .replaying
+        os.utime(target)
+        claimed.append(target)
+    return claimed
+
+
+def _write_record(path, rows):
+    payload = json.dumps(rows, ensure_ascii=False).encode()
+    with open(path, 'ab') as f:
+        f.write(_HEADER.pack(len(payload)) + payload)
+
+
+def replay_file(path):
+    """
+    Load one claimed spool file into Event.
+
+    Returns:
+        tuple: (events written, events rejected by the database)
+    """
+    from ..models import Event
+
+    file_id = hashlib.sha1(path.stem.encode()).hexdigest()[:16]
+    events = []
+    rows_by_ingest_id = {}
+    for record_no, rows in enumerate(read_records(path)):
+        for position, row in enumerate(rows):
+            ingest_id = f"sp:{file_id}:{record_no}:{position}"
+            rows_by_ingest_id[ingest_id] = dict(row)
+            events.append(Event(ingest_id=ingest_id, **decode_row(row)))
+
+    rejected = insert_events(events)
+    if rejected:
+        _write_record(path.with_suffix(REJECTED_SUFFIX), [rows_by_ingest_id[event.ingest_id] for event in rejected])
+        logger.error(f"Spool {path.name}: {len(rejected)} events rejected, quarantined to {REJECTED_SUFFIX}")
+    return len(events) - len(rejected), len(rejected)
+
+
+def replay(directory=None):
+    """
+    Replay all closed (and abandoned) spool files into Event.
+
+    Returns:
+        dict: {'files': n, 'events': n, 'rejected': n, 'failed': n}
+    """
+    directory = Path(directory or spool_dir())
+    stats = {'files': 0, 'events': 0, 'rejected': 0, 'failed': 0}
+    if not directory.exists():
+        return stats
+
+    # Файлы, зависшие в .replaying после падения прошлого прогона, тоже берём
+    for path in directory.glob(f'*{REPLAYING_SUFFIX}'):
+        try:
+            if time.time() - path.stat().st_mtime >= ABANDONED_AFTER:
+                os.rename(path, path.with_suffix(CLOSED_SUFFIX))
+        except FileNotFoundError:
+            continue
+
+    for path in _claim_files(directory):
+        try:
+            events, rejected = replay_file(path)
+        except Exception as e:
+            stats['failed'] += 1
+            logger.error(f"Spool replay failed for {path.name}: {str(e)}")
+            os.rename(path, path.with_suffix(CLOSED_SUFFIX))
+            continue
+        path.unlink(missing_ok=True)
+        stats['files'] += 1
+        stats['events'] += events
+        stats['rejected'] += rejected
+    return stats
+
+
+def pending_files(directory=None):
+    directory = Path(directory or spool_dir())
+    if not directory.exists():
+        return 0
+    return sum(1 for path in directory.iterdir() if path.suffix in (OPEN_SUFFIX, CLOSED_SUFFIX, REPLAYING_SUFFIX))
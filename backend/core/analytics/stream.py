@@ -0,0 +1,298 @@
+"""
+Write-behind buffer for tracking events on a Redis Stream.
+
+In ``buffered`` ingest mode ``/api/v1/track/`` only validates a batch and
+XADDs it as one stream entry; Postgres is not touched on the request thread.
+A consumer group drains the stream in large chunks into ``Event``:
+
+* at-least-once: entries are XACKed (and XDELed) only after the
+  ``bulk_create`` is committed; entries of a crashed consumer are taken
+  over with XAUTOCLAIM after ``CLAIM_IDLE_MS``;
+* idempotent: every event gets ``ingest_id = <entry id>:<position>`` with a
+  unique index, so a replayed entry is skipped by ``ignore_conflicts``;
+* poison-proof: ids of deleted promos/stores/showcases are set to NULL
+  before the insert (``insert_events``), and events the database still
+  rejects go to the dead-letter stream ``DEAD_LETTER_KEY`` and are acked,
+  so one bad entry cannot block the group.
+"""
+import json
+import logging
+import os
+import socket
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, transaction
+
+from ..utils.redis import get_redis_client, make_key
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = 'analytics:events'
+GROUP = 'event-drain'
+# События, которые БД отвергла (разбираются вручную, XRANGE)
+DEAD_LETTER_KEY = 'analytics:events:dead'
+
+# Через сколько запись упавшего консьюмера можно забрать себе
+CLAIM_IDLE_MS = 60 * 1000
+
+
+def buffered_mode():
+    return getattr(settings, 'ANALYTICS_INGEST_MODE', 'direct') == 'buffered'
+
+
+def _stream_key():
+    return make_key(STREAM_KEY)
+
+
+def encode_row(row):
+    """JSON-friendly copy of a validated row."""
+    row = dict(row)
+    row['created_at'] = row['created_at'].isoformat()
+    return row
+
+
+def decode_row(row):
+    row['created_at'] = datetime.fromisoformat(row['created_at'])
+    return row
+
+
+def _text(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def enqueue(rows):
+    """
+    XADD a validated batch as one stream entry.
+
+    Returns:
+        Entry id, or None if Redis is not available (caller writes directly)
+    """
+    client = get_redis_client()
+    if client is None:
+        return None
+    payload = json.dumps([encode_row(row) for row in rows], ensure_ascii=False)
+    entry_id = client.xadd(
+        _stream_key(),
+        {'rows': payload},
+        maxlen=settings.ANALYTICS_STREAM_MAXLEN,
+        approximate=True,
+    )
+    return _text(entry_id)
+
+
+def ensure_group(client):
+    import redis
+
+    try:
+        client.xgroup_create(_stream_key(), GROUP, id='0', mkstream=True)
+    except redis.ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+def default_consumer_name():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def clear_unknown_refs(events):
+    """Set promo/store/showcase ids that no longer exist to NULL (as on_delete=SET_NULL would)."""
+    from ..models import Event
+
+    for field in ('promo', 'store', 'showcase'):
+        attname = f'{field}_id'
+        ids = {getattr(event, attname) for event in events} - {None}
+        if not ids:
+            continue
+        model = Event._meta.get_field(field).related_model
+        known = set(model.objects.filter(id__in=ids).values_list('id', flat=True))
+        for event in events:
+            if getattr(event, attname) is not None and getattr(event, attname) not in known:
+                setattr(event, attname, None)
+
+
+def _bulk_insert(events):
+    from ..models import Event
+
+    with transaction.atomic():
+        Event.objects.bulk_create(events, batch_size=1000, ignore_conflicts=True)
+
+
+def insert_events(events):
+    """
+    Insert ``Event`` objects, skipping already ingested ``ingest_id``s.
+
+    Unknown foreign keys are cleared first; if the batch is still rejected
+    (IntegrityError/DataError) the events are inserted one by one.
+
+    Returns:
+        list: events the database rejected (not written)
+    """
+    if not events:
+        return []
+    clear_unknown_refs(events)
+    try:
+        _bulk_insert(events)
+        return []
+    except (IntegrityError, DataError) as e:
+        logger.warning(f"Event batch rejected, inserting one by one: {str(e)}")
+
+    rejected = []
+    for event in events:
+        try:
+            _bulk_insert([event])
+        except (IntegrityError, DataError) as e:
+            logger.error(f"Event {event.ingest_id or event.event_type} rejected: {str(e)}")
+            rejected.append(event)
+    return rejected
+
+
+def _dead_letter(client, entry_rows, error):
+    """XADD rejected rows of each entry to the dead-letter stream."""
+    pipe = client.pipeline(transaction=False)
+    for entry_id, rows in entry_rows.items():
+        pipe.xadd(
+            make_key(DEAD_LETTER_KEY),
+            {'entry': entry_id, 'rows': json.dumps(rows, ensure_ascii=False), 'error': error},
+            maxlen=settings.ANALYTICS_STREAM_MAXLEN,
+            approximate=True,
+        )
+    pipe.execute()
+
+
+def _write_entries(client, entries):
+    """
+    Insert the events of stream entries, then XACK + XDEL them.
+
+    Returns:
+        tuple: (entries, events written, events dead-lettered)
+    """
+    from ..models import Event
+
+    entry_ids = []
+    events = []
+    rows_by_ingest_id = {}
+    for entry_id, fields in entries:
+        entry_id = _text(entry_id)
+        entry_ids.append(entry_id)
+        if not fields:
+            # Запись удалена из стрима (MAXLEN) до обработки
+            continue
+        try:
+            rows = json.loads(_text(fields.get(b'rows', fields.get('rows'))))
+        except (TypeError, ValueError) as e:
+            logger.error(f"Broken stream entry {entry_id} skipped: {str(e)}")
+            continue
+        for position, row in enumerate(rows):
+            ingest_id = f"{entry_id}:{position}"
+            rows_by_ingest_id[ingest_id] = (entry_id, dict(row))
+            events.append(Event(ingest_id=ingest_id, **decode_row(row)))
+
+    # Ошибки подключения к БД пробрасываются: записи не подтверждены и будут перечитаны
+    rejected = insert_events(events)
+    if rejected:
+        entry_rows = {}
+        for event in rejected:
+            entry_id, row = rows_by_ingest_id[event.ingest_id]
+            entry_rows.setdefault(entry_id, []).append(row)
+        _dead_letter(client, entry_rows, 'rejected by database')
+
+    if entry_ids:
+        pipe = client.pipeline(transaction=False)
+        pipe.xack(_stream_key(), GROUP, *entry_ids)
+        pipe.xdel(_stream_key(), *entry_ids)
+        pipe.execute()
+    return len(entry_ids), len(events) - len(rejected), len(rejected)
+
+
+def drain(consumer=None, count=None, block_ms=None, max_batches=None):
+    """
+    Move buffered events from the stream into ``Event``.
+
+    Args:
+        consumer: consumer name inside the group (hostname-pid by default)
+        count: stream entries per XREADGROUP
+        block_ms: block waiting for new entries (None - return when empty)
+        max_batches: stop after this many XREADGROUP batches
+
+    Returns:
+        dict: {'entries': n, 'events': n, 'claimed': n, 'dead': n}
+    """
+    stats = {'entries': 0, 'events': 0, 'claimed': 0, 'dead': 0}
+    client = get_redis_client()
+    if client is None:
+        return stats
+
+    key = _stream_key()
+    count = count or settings.ANALYTICS_DRAIN_BATCH
+    consumer = consumer or default_consumer_name()
+    ensure_group(client)
+
+    # 1. Забираем записи, зависшие у упавших консьюмеров
+    start_id = '0-0'
+    while True:
+        response = client.xautoclaim(
+            key, GROUP, consumer, min_idle_time=CLAIM_IDLE_MS, start_id=start_id, count=count
+        )
+        next_id, claimed = _text(response[0]), response[1]
+        if claimed:
+            entries, events, dead = _write_entries(client, claimed)
+            stats['claimed'] += entries
+            stats['entries'] += entries
+            stats['events'] += events
+            stats['dead'] += dead
+        if next_id == '0-0':
+            break
+        start_id = next_id
+
+    # 2. Новые записи
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        response = client.xreadgroup(GROUP, consumer, {key: '>'}, count=count, block=block_ms)
+        if not response or not response[0][1]:
+            break
+        entries, events, dead = _write_entries(client, response[0][1])
+        stats['entries'] += entries
+        stats['events'] += events
+        stats['dead'] += dead
+        batches += 1
+
+    return stats
+
+
+def stream_stats():
+    """
+    Lag metrics of the ingest buffer.
+
+    Returns:
+        dict: mode, backlog (entries in the stream), pending (delivered but
+        not acked), oldest_age_seconds (age of the oldest undrained entry),
+        consumers
+    """
+    stats = {
+        'mode': getattr(settings, 'ANALYTICS_INGEST_MODE', 'direct'),
+        'backlog': 0,
+        'pending': 0,
+        'oldest_age_seconds': None,
+        'consumers': 0,
+    }
+    client = get_redis_client(write=False)
+    if client is None:
+        return stats
+
+    key = _stream_key()
+    if not client.exists(key):
+        return stats
+
+    stats['backlog'] = client.xlen(key)
+    oldest = client.xrange(key, count=1)
+    if oldest:
+        millis = int(_text(oldest[0][0]).split('-')[0])
+        stats['oldest_age_seconds'] = max(round(time.time() - millis / 1000, 1), 0)
+
+    for group in client.xinfo_groups(key):
+        if _text(group.get('name')) == GROUP:
+            stats['pending'] = group.get('pending', 0)
+            stats['consumers'] = group.get('consumers', 0)
+    return stats
@@ -0,0 +1,116 @@
+"""
+Time-decayed "trending now" scores of promo codes and stores.
+
+Every usage event (``popularity.USAGE_EVENT_TYPES``) adds ``2^(-age / H)`` to
+the ``trending_score`` of its promo and its store, where ``H`` is
+``ANALYTICS_TRENDING_HALF_LIFE_HOURS``. A burst of recent clicks therefore
+outranks a larger but older total.
+
+The scores are kept incrementally by ``update_trending_scores`` (beat task
+``update_trending``), with its own ``AggregationWatermark`` row:
+
+1. all stored scores are multiplied by the decay since the previous run -
+   one ``UPDATE`` per table over the rows with a non-zero score;
+2. events above the watermark are grouped by hour, promo and store, and
+   their decayed weights are added.
+
+Events older than ``HORIZON_HALF_LIVES`` half-lives weigh less than 0.1% and
+are skipped, which also bounds the first run. Scores below ``MIN_SCORE``
+are reset to zero so the decayed rows drop out of the update.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from ..utils.cache import invalidate_tags, ranking_tag
+from .aggregation import settled_max_event_id
+from .popularity import USAGE_EVENT_TYPES
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_NAME = 'trending'
+
+HORIZON_HALF_LIVES = 10
+MIN_SCORE = 0.001
+
+
+def half_life():
+    return timedelta(hours=settings.ANALYTICS_TRENDING_HALF_LIFE_HOURS)
+
+
+def decay(age):
+    """Weight of something ``age`` (timedelta) old: 1 now, 1/2 after one half-life."""
+    return 0.5 ** (max(age.total_seconds(), 0) / half_life().total_seconds())
+
+
+def _add_scores(model, increments, using='default'):
+    rows = list(model.objects.using(using).filter(id__in=list(increments)).only('id', 'trending_score'))
+    for row in rows:
+        row.trending_score += increments[row.id]
+    model.objects.using(using).bulk_update(rows, ['trending_score'], batch_size=1000)
+    return len(rows)
+
+
+def update_trending_scores(using='default'):
+    """
+    Decay the stored scores to now and add the events above the watermark.
+
+    Returns:
+        dict: {'events_to': id, 'promos': n, 'stores': n}
+    """
+    from ..models import AggregationWatermark, Event, PromoCode, Store
+
+    upper = settled_max_event_id(using)
+    with transaction.atomic(using=using):
+        watermark, created = AggregationWatermark.objects.using(using).select_for_update().get_or_create(
+            name=WATERMARK_NAME
+        )
+        now = timezone.now()
+
+        if not created:
+            factor = decay(now - watermark.updated_at)
+            for model in (PromoCode, Store):
+                scored = model.objects.using(using).filter(trending_score__gt=0)
+                scored.update(trending_score=F('trending_score') * factor)
+                scored.filter(trending_score__lt=MIN_SCORE).update(trending_score=0)
+
+        groups = (
+            Event.objects.using(using)
+            .filter(
+                id__gt=watermark.last_event_id, id__lte=upper,
+                event_type__in=USAGE_EVENT_TYPES,
+                created_at__gte=now - half_life() * HORIZON_HALF_LIVES,
+            )
+            .annotate(hour=TruncHour('created_at'))
+            .values('hour', 'promo_id', 'store_id')
+            .annotate(events=Count('id'))
+            .order_by()
+        )
+        promos, stores = defaultdict(float), defaultdict(float)
+        for group in groups:
+            # Середина часа: погрешность веса не больше получаса затухания
+            weight = group['events'] * decay(now - group['hour'] - timedelta(minutes=30))
+            if group['promo_id']:
+                promos[group['promo_id']] += weight
+            if group['store_id']:
+                stores[group['store_id']] += weight
+
+        stats = {
+            'events_to': upper,
+            'promos': _add_scores(PromoCode, promos, using=using),
+            'stores': _add_scores(Store, stores, using=using),
+        }
+        watermark.last_event_id = max(upper, watermark.last_event_id)
+        watermark.save(update_fields=['last_event_id', 'updated_at'])
+
+    if stats['promos']:
+        # Равномерное затухание порядок не меняет, новые события - меняют
+        invalidate_tags(ranking_tag('trending'))
+    logger.info(f"Trending scores updated: {stats['promos']} promos, {stats['stores']} stores")
+    return stats
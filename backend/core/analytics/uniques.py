@@ -0,0 +1,250 @@
+"""
+Unique visitor counting on Redis HyperLogLog.
+
+A visitor is a tracking ``session_id``. At ingest every event is PFADDed to
+two kinds of per-day counters (~12KB each at most, sparse when small):
+
+* row counters - one per ``DailyAgg`` row (date, type, promo, store,
+  showcase); the aggregation run writes their PFCOUNT to
+  ``DailyAgg.unique_count`` and the PFCOUNT of the month's day counters to
+  ``MonthlyAgg.unique_count``;
+* entity counters - per promo (click events), store and showcase; the stats
+  API answers "unique visitors over N days" with one multi-key PFCOUNT
+  (a union, not a sum of daily numbers).
+
+PFADD reports whether the counter changed, which marks the first event of a
+session per row and day (``Event.is_unique``). Counters expire
+``ANALYTICS_UNIQUES_DAYS`` after their day; older rollup rows keep the last
+persisted value.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
+
+from ..utils.redis import get_redis_client, make_key
+from .aggregation import local_midnight
+from .leaderboard import CLICK_EVENT_TYPES, PROMO, STORE
+
+SHOWCASE = 'showcase'
+
+
+def _row_suffix(day, event_type, promo_id, store_id, showcase_id):
+    return f"{day:%Y%m%d}:{event_type}:{promo_id or 0}:{store_id or 0}:{showcase_id or 0}"
+
+
+def row_key(day, event_type, promo_id, store_id, showcase_id):
+    return make_key(f"analytics:uv:{_row_suffix(day, event_type, promo_id, store_id, showcase_id)}")
+
+
+def entity_key(dimension, day, entity_id):
+    return make_key(f"analytics:uv:{dimension}:{day:%Y%m%d}:{entity_id}")
+
+
+def _expire_at(day):
+    return int(local_midnight(day + timedelta(days=settings.ANALYTICS_UNIQUES_DAYS + 1)).timestamp())
+
+
+def _entity_keys(day, row):
+    keys = []
+    if row['promo_id'] and row['event_type'] in CLICK_EVENT_TYPES:
+        keys.append(entity_key(PROMO, day, row['promo_id']))
+    if row['store_id']:
+        keys.append(entity_key(STORE, day, row['store_id']))
+    if row['showcase_id']:
+        keys.append(entity_key(SHOWCASE, day, row['showcase_id']))
+    return keys
+
+
+def mark_unique(rows):
+    """
+    PFADD the sessions of validated rows and set ``is_unique``.
+
+    Without Redis (development) the first event per row and day is found
+    with ``cache.add``.
+
+    Returns:
+        int: number of events recognised as repeats
+    """
+    candidates = [row for row in rows if row['session_id']]
+    if not candidates:
+        return 0
+
+    client = get_redis_client()
+    if client is not None:
+        pipe = client.pipeline(transaction=False)
+        expiring = {}
+        positions = []
+        for row in candidates:
+            day = timezone.localdate(row['created_at'])
+            keys = [row_key(day, row['event_type'], row['promo_id'], row['store_id'], row['showcase_id'])]
+            keys.extend(_entity_keys(day, row))
+            # Номер ответа PFADD счётчика строки - по нему определяется is_unique
+            positions.append(len(pipe))
+            for key in keys:
+                pipe.pfadd(key, row['session_id'])
+                expiring[key] = day
+        for key, day in expiring.items():
+            pipe.expireat(key, _expire_at(day))
+        results = pipe.execute()
+        changed = [results[position] for position in positions]
+    else:
+        changed = []
+        for row in candidates:
+            day = timezone.localdate(row['created_at'])
+            suffix = _row_suffix(day, row['event_type'], row['promo_id'], row['store_id'], row['showcase_id'])
+            timeout = (local_midnight(day + timedelta(days=1)) - timezone.now()).total_seconds()
+            changed.append(cache.add(f"uv:{suffix}:{row['session_id']}", 1, timeout=max(int(timeout), 1)))
+
+    deduplicated = 0
+    for row, is_new in zip(candidates, changed):
+        row['is_unique'] = bool(is_new)
+        if not is_new:
+            deduplicated += 1
+    return deduplicated
+
+
+def count_entities(dimension, entity_ids, first, last):
+    """
+    Unique visitors of each entity over local dates ``first..last``.
+
+    Returns:
+        dict: entity id -> count, or None without Redis
+    """
+    client = get_redis_client(write=False)
+    if client is None:
+        return None
+    days = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+    entity_ids = list(entity_ids)
+    pipe = client.pipeline(transaction=False)
+    for entity_id in entity_ids:
+        pipe.pfcount(*[entity_key(dimension, day, entity_id) for day in days])
+    return dict(zip(entity_ids, pipe.execute()))
+
+
+def persist_unique_counts(lower, upper, since=None, using='default'):
+    """
+    Overwrite ``unique_count`` of the DailyAgg/MonthlyAgg rows touched by
+    events ``lower < id <= upper`` with PFCOUNT of their counters.
+
+    Rows of days whose counters have already expired are left as they are.
+
+    Returns:
+        int: number of updated rows (0 without Redis)
+    """
+    from django.db.models.functions import TruncDate
+
+    from ..models import DailyAgg, Event, MonthlyAgg
+
+    client = get_redis_client(write=False)
+    if client is None:
+        return 0
+
+    today = timezone.localdate()
+    oldest = today - timedelta(days=settings.ANALYTICS_UNIQUES_DAYS)
+    events = Event.objects.using(using).filter(
+        id__gt=lower, id__lte=upper, created_at__gte=local_midnight(max(oldest, since or oldest))
+    )
+    groups = list(
+        events.annotate(day=TruncDate('created_at'))
+        .values_list('day', 'event_type', 'promo_id', 'store_id', 'showcase_id')
+        .distinct()
+        .order_by()
+    )
+    if not groups:
+        return 0
+
+    # Месяц: объединение счётчиков всех его дней (если ни один ещё не истёк)
+    months = defaultdict(set)
+    for day, *dims in groups:
+        month = day.replace(day=1)
+        if month >= oldest:
+            months[month].add(tuple(dims))
+
+    pipe = client.pipeline(transaction=False)
+    for group in groups:
+        pipe.pfcount(row_key(*group))
+    month_groups = []
+    for month, dims_set in months.items():
+        month_days = [month + timedelta(days=i) for i in range((min(today, _month_end(month)) - month).days + 1)]
+        for dims in dims_set:
+            pipe.pfcount(*[row_key(day, *dims) for day in month_days])
+            month_groups.append((month, *dims))
+    counts = pipe.execute()
+    daily_counts = dict(zip(groups, counts[:len(groups)]))
+    monthly_counts = dict(zip(month_groups, counts[len(groups):]))
+
+    return (
+        _set_unique_counts(DailyAgg, 'date', daily_counts, using)
+        + _set_unique_counts(MonthlyAgg, 'month', monthly_counts, using)
+    )
+
+
+# Строки роллапа ищутся по тем же COALESCE, что и в уникальном индексе
+_SET_UNIQUE_SQL = """
+UPDATE {table} AS t SET unique_count = v.unique_count
+FROM (VALUES {values}) AS v (period, event_type, promo_id, store_id, showcase_id, unique_count)
+WHERE t.{column} = v.period AND t.event_type = v.event_type
+  AND COALESCE(t.promo_id, 0) = v.promo_id
+  AND COALESCE(t.store_id, 0) = v.store_id
+  AND COALESCE(t.showcase_id, 0) = v.showcase_id
+  AND t.unique_count <> v.unique_count
+"""
+_SET_UNIQUE_ROW = '(%s::date, %s::varchar, %s::bigint, %s::bigint, %s::bigint, %s::integer)'
+_SET_UNIQUE_BATCH = 1000
+
+
+def _set_unique_counts(model, field, wanted, using):
+    """Write ``wanted`` ({(period, type, promo, store, showcase): count}) to the rollup rows with these keys."""
+    if not wanted:
+        return 0
+    if connections[using].vendor == 'postgresql':
+        return _set_unique_counts_postgres(model, field, wanted, using)
+    return _set_unique_counts_fallback(model, field, wanted, using)
+
+
+def _set_unique_counts_postgres(model, field, wanted, using):
+    items = list(wanted.items())
+    updated = 0
+    with connections[using].cursor() as cursor:
+        for start in range(0, len(items), _SET_UNIQUE_BATCH):
+            batch = items[start:start + _SET_UNIQUE_BATCH]
+            params = []
+            for (period, event_type, promo_id, store_id, showcase_id), count in batch:
+                params += [period, event_type, promo_id or 0, store_id or 0, showcase_id or 0, count]
+            cursor.execute(
+                _SET_UNIQUE_SQL.format(
+                    table=model._meta.db_table, column=field, values=', '.join([_SET_UNIQUE_ROW] * len(batch)),
+                ),
+                params,
+            )
+            updated += cursor.rowcount
+    return updated
+
+
+def _set_unique_counts_fallback(model, field, wanted, using):
+    """Backends without UPDATE ... FROM (SQLite): per-dimension ``__in`` prefilter, exact match in Python."""
+    periods, event_types, *fks = (set(values) for values in zip(*wanted))
+    rows = model.objects.using(using).filter(**{f'{field}__in': periods, 'event_type__in': event_types})
+    for name, ids in zip(('promo_id', 'store_id', 'showcase_id'), fks):
+        condition = Q(**{f'{name}__in': ids - {None}})
+        if None in ids:
+            condition |= Q(**{f'{name}__isnull': True})
+        rows = rows.filter(condition)
+
+    changed = []
+    for row in rows:
+        key = (getattr(row, field), row.event_type, row.promo_id, row.store_id, row.showcase_id)
+        if key in wanted and row.unique_count != wanted[key]:
+            row.unique_count = wanted[key]
+            changed.append(row)
+    model.objects.using(using).bulk_update(changed, ['unique_count'], batch_size=1000)
+    return len(changed)
+
+
+def _month_end(month):
+    return (month + timedelta(days=32)).replace(day=1) - timedelta(days=1)
@@ -8,6 +8,7 @@ class CoreConfig(AppConfig):
 
     def ready(self):
         from . import models
+        from . import signals  # noqa: F401
 
         def apply_labels(model, singular, plural, field_labels):
             model._meta.verbose_name = singular
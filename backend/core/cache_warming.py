@@ -0,0 +1,156 @@
+"""
+Warming of the API response cache.
+
+After a deploy, a ``CACHE_VERSION`` bump or an invalidation of a list tag
+the first visitors of every list would pay for the cold cache (and wait on
+the recompute lock of ``cache_api_response``). ``warm()`` recomputes those
+responses ahead of them:
+
+* landing queries - promo code, category, banner, partner and showcase
+  lists plus the promo codes of every active category, store and showcase;
+* the ``CACHE_WARM_TOP`` most frequent request paths from the sample that
+  ``cache_api_response`` records in Redis (``sample_request``).
+
+Requests are dispatched to the resolved view in-process (no HTTP, no
+middleware, no throttling) with ``CACHE_WARM_CONCURRENCY`` threads, under
+the public host (``CACHE_WARM_HOST``) so absolute URLs in the cached
+responses are the same as for real requests. A response that is already
+fresh is served from the cache and costs nothing.
+
+Runs: ``manage.py warm_cache`` from ``ops/deploy.sh``; the ``warm_cache``
+Celery task, scheduled by ``invalidate_tags`` for list and ranking tags
+(debounced, ``CACHE_WARM_DELAY``) and by ``flush_cache('all')``.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.test import RequestFactory
+from django.urls import Resolver404, resolve, reverse
+
+from .utils.cache import decay_request_samples, top_requests
+
+logger = logging.getLogger(__name__)
+
+# Отметка о запланированном прогреве: сбросы тегов в течение CACHE_WARM_DELAY - один прогрев
+SCHEDULED_KEY = 'cache:warm:scheduled'
+# Сколько путей выборки хранить между прогревами
+SAMPLE_KEEP = 1000
+
+
+def landing_paths():
+    """Lists and the promo codes of every active category, store and showcase."""
+    from .models import Category, Showcase, Store
+
+    paths = [
+        reverse('promocode-list'),
+        reverse('category-list'),
+        reverse('banner-list'),
+        reverse('partner-list'),
+        reverse('showcase-list'),
+    ]
+    for slug in Category.objects.filter(is_active=True).values_list('slug', flat=True):
+        paths.append(reverse('category-promocodes-paginated', args=[slug]))
+    for slug in Store.objects.filter(is_active=True).values_list('slug', flat=True):
+        paths.append(reverse('store-promocodes-paginated', args=[slug]))
+    for slug in Showcase.objects.filter(is_active=True).values_list('slug', flat=True):
+        paths.append(reverse('showcase-promos', args=[slug]))
+    return paths
+
+
+def _view(match):
+    """The resolved view without throttling (``throttle_classes`` is a DRF init kwarg)."""
+    view = match.func
+    cls = getattr(view, 'cls', None)
+    if cls is None:
+        return view
+    initkwargs = {**view.initkwargs, 'throttle_classes': ()}
+    actions = getattr(view, 'actions', None)
+    if actions:
+        return cls.as_view(actions, **initkwargs)
+    return cls.as_view(**initkwargs)
+
+
+def warm_path(path):
+    """Request ``path`` in-process; True if the view answered 200."""
+    try:
+        request = RequestFactory().get(
+            path, HTTP_HOST=settings.CACHE_WARM_HOST, secure=settings.CACHE_WARM_SECURE
+        )
+        match = resolve(request.path_info)
+        response = _view(match)(request, *match.args, **match.kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return response.status_code == 200
+    except Resolver404:
+        return False
+    except Exception as e:
+        logger.warning(f"Cache warm error for {path}: {str(e)}")
+        return False
+
+
+def _warm_path_in_thread(path):
+    try:
+        return warm_path(path)
+    finally:
+        # Соединения с БД потоков пула не переиспользуются
+        connections.close_all()
+
+
+def warm(top=None, concurrency=None, landing=True):
+    """
+    Recompute the cached responses of the landing queries and the top sampled paths.
+
+    Returns ``{'paths', 'warmed', 'failed', 'seconds'}``.
+    """
+    top = settings.CACHE_WARM_TOP if top is None else top
+    concurrency = settings.CACHE_WARM_CONCURRENCY if concurrency is None else concurrency
+    started = time.monotonic()
+
+    paths = landing_paths() if landing else []
+    try:
+        paths += top_requests(top)
+    except Exception as e:
+        logger.warning(f"Cache warm: request sample unavailable: {str(e)}")
+    paths = list(dict.fromkeys(paths))
+
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='cache-warm') as pool:
+            results = list(pool.map(_warm_path_in_thread, paths))
+    else:
+        results = [warm_path(path) for path in paths]
+
+    if landing:
+        # Полный прогрев (деплой) - заодно старим выборку: недавний трафик весит больше
+        try:
+            decay_request_samples(SAMPLE_KEEP)
+        except Exception as e:
+            logger.warning(f"Cache warm: request sample decay error: {str(e)}")
+
+    warmed = sum(results)
+    stats = {
+        'paths': len(paths),
+        'warmed': warmed,
+        'failed': len(paths) - warmed,
+        'seconds': round(time.monotonic() - started, 2),
+    }
+    logger.info(f"Cache warm: {stats}")
+    return stats
+
+
+def schedule_warm(landing=False):
+    """Queue a warm in CACHE_WARM_DELAY seconds unless one is already queued."""
+    if not getattr(settings, 'CACHE_WARM_ON_INVALIDATE', False):
+        return
+    delay = settings.CACHE_WARM_DELAY
+    try:
+        if not cache.add(SCHEDULED_KEY, 1, delay):
+            return
+        from .tasks import warm_cache
+
+        warm_cache.apply_async(kwargs={'landing': landing}, countdown=delay)
+    except Exception as e:
+        logger.warning(f"Cache warm scheduling error: {str(e)}")
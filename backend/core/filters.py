@@ -1,8 +1,10 @@
 import django_filters
 from django.utils import timezone
 from django.db import models
-from rest_framework.filters import OrderingFilter
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
 from .models import PromoCode, Store, Category
+from .search import search_promocodes
+from .search.engine import order_by_rank
 
 
 class PromoCodeFilter(django_filters.FilterSet):
@@ -12,6 +14,7 @@ class PromoCodeFilter(django_filters.FilterSet):
     q = django_filters.CharFilter(method='search_filter', label='Поиск')
     store = django_filters.ModelChoiceFilter(queryset=Store.objects.filter(is_active=True), field_name='store', to_field_name='slug')
     category = django_filters.CharFilter(field_name='categories__slug', lookup_expr='exact')
+    offer_type = django_filters.ChoiceFilter(choices=PromoCode.OFFER_TYPE_CHOICES)
     
     # Булевые фильтры
     is_hot = django_filters.BooleanFilter()
@@ -30,49 +33,17 @@ class PromoCodeFilter(django_filters.FilterSet):
     class Meta:
         model = PromoCode
         fields = [
-            'store', 'category', 'is_hot', 'is_recommended', 
+            'store', 'category', 'offer_type', 'is_hot', 'is_recommended', 
             'with_code', 'expires_soon', 'created_after', 'created_before',
             'expires_after', 'expires_before'
         ]
         # ИСПРАВЛЕНО: Убрали поля которых может не быть в модели
     
     def search_filter(self, queryset, name, value):
-        """Улучшенный поиск по множественным полям"""
+        """Поиск через поисковый движок (tsvector на Postgres, icontains на SQLite)"""
         if not value:
             return queryset
-        
-        # Нормализуем поисковый запрос
-        search_terms = value.lower().strip().split()
-        
-        # Создаем Q объект для поиска
-        search_q = models.Q()
-        
-        for term in search_terms:
-            if len(term) < 2:  # Игнорируем слишком короткие термины
-                continue
-                
-            # ИСПРАВЛЕНО: Используем только поля которые точно есть в модели
-            term_q = (
-                models.Q(title__icontains=term) |
-                models.Q(description__icontains=term) |
-                models.Q(store__name__icontains=term) |
-                models.Q(categories__name__icontains=term)
-            )
-            
-            # Безопасно добавляем поиск по code если поле существует
-            if hasattr(PromoCode, 'code'):
-                term_q |= models.Q(code__icontains=term)
-            
-            # Безопасно добавляем поиск по discount_label если поле существует  
-            if hasattr(PromoCode, 'discount_label'):
-                term_q |= models.Q(discount_label__icontains=term)
-            
-            search_q &= term_q  # AND логика - все термины должны быть найдены
-        
-        if search_q:
-            return queryset.filter(search_q).distinct()
-        
-        return queryset
+        return search_promocodes(queryset, value)
     
     def filter_with_code(self, queryset, name, value):
         """Фильтр по наличию промокода"""
@@ -202,44 +173,46 @@ class PromoCodeOrderingFilter(OrderingFilter):
         return mapped
 
     def filter_queryset(self, request, queryset, view):
-        """Override to handle special 'popular' ordering"""
+        """Override to handle special 'popular' and 'trending' ordering"""
         ordering_param = request.query_params.get(self.ordering_param)
 
-        # Специальная обработка для ordering=popular
+        # ordering=popular: badges first (is_hot впереди) → клики за 7 дней → свежесть.
+        # Денормализованные поля (core.analytics.popularity), индекс idx_promo_popular
         if ordering_param == 'popular' or ordering_param == '-popular':
-            from django.db.models import Sum, Case, When, IntegerField, Value
-            from datetime import timedelta
-            from django.utils import timezone
-
-            week_ago = (timezone.now() - timedelta(days=7)).date()
-
-            # Аннотируем usage_7d (клики + копирования за 7 дней)
-            queryset = queryset.annotate(
-                usage_7d=Sum(
-                    Case(
-                        When(
-                            dailyagg__date__gte=week_ago,
-                            dailyagg__event_type__in=['click', 'copy'],
-                            then='dailyagg__count'
-                        ),
-                        default=Value(0),
-                        output_field=IntegerField()
-                    )
-                )
-            )
+            return queryset.order_by('-has_badge', '-is_hot', '-popularity_7d', '-created_at', '-id')
 
-            # Аннотируем has_badge (is_hot OR is_recommended)
-            queryset = queryset.annotate(
-                has_badge=Case(
-                    When(models.Q(is_hot=True) | models.Q(is_recommended=True), then=Value(1)),
-                    default=Value(0),
-                    output_field=IntegerField()
-                )
-            )
-
-            # Сортировка: badges first → usage_7d → freshness
-            queryset = queryset.order_by('-has_badge', '-usage_7d', '-created_at')
-            return queryset
+        # ordering=trending: затухающий счёт (core.analytics.trending), индекс idx_promo_trending
+        if ordering_param == 'trending' or ordering_param == '-trending':
+            return queryset.order_by('-trending_score', '-created_at', '-id')
 
         # Обычная сортировка
         return super().filter_queryset(request, queryset, view)
+
+
+class StoreOrderingFilter(OrderingFilter):
+    """OrderingFilter магазинов с ordering=trending (core.analytics.trending)"""
+
+    def filter_queryset(self, request, queryset, view):
+        ordering_param = request.query_params.get(self.ordering_param)
+        if ordering_param == 'trending' or ordering_param == '-trending':
+            return queryset.order_by('-trending_score', 'name')
+        return super().filter_queryset(request, queryset, view)
+
+
+class PromoCodeSearchFilter(BaseFilterBackend):
+    """
+    Поиск по параметру ?search= через поисковый движок.
+
+    Если сортировка не задана явно, результаты упорядочиваются по релевантности.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        value = request.query_params.get(self.search_param, '')
+        if not value.strip():
+            return queryset
+
+        queryset = search_promocodes(queryset, value)
+        if not request.query_params.get('ordering'):
+            queryset = order_by_rank(queryset)
+        return queryset
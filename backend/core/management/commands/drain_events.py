@@ -0,0 +1,52 @@
+"""
+Management команда для переноса событий из Redis Stream в Event
+Использование: python manage.py drain_events [--loop] [--batch-size N]
+"""
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Переносит буферизованные события трекинга из Redis Stream в Event'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Работать постоянно (выделенный воркер), ожидая новые события'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Записей стрима за одно чтение (по умолчанию ANALYTICS_DRAIN_BATCH)'
+        )
+        parser.add_argument(
+            '--consumer',
+            default=None,
+            help='Имя консьюмера в группе (по умолчанию hostname-pid)'
+        )
+
+    def handle(self, *args, **options):
+        from core.analytics import stream
+
+        if not options['loop']:
+            stats = stream.drain(consumer=options['consumer'], count=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f"✓ Перенесено {stats['events']} событий из {stats['entries']} записей "
+                f"(забрано у других консьюмеров: {stats['claimed']}, отвергнуто БД: {stats['dead']})"
+            ))
+            return
+
+        self.stdout.write('Ожидание событий (Ctrl+C для остановки)...')
+        try:
+            while True:
+                stats = stream.drain(
+                    consumer=options['consumer'],
+                    count=options['batch_size'],
+                    block_ms=5000,
+                    max_batches=100,
+                )
+                if stats['events']:
+                    self.stdout.write(f"Перенесено {stats['events']} событий")
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS('✓ Остановлено'))
@@ -0,0 +1,19 @@
+"""
+Management команда для пересчёта поисковых документов промокодов
+Использование: python manage.py rebuild_search_index
+"""
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает search_vector (tsvector) для всех промокодов'
+
+    def handle(self, *args, **options):
+        from core.search import refresh_search_vectors, uses_full_text_search
+
+        if not uses_full_text_search():
+            self.stdout.write(self.style.WARNING('Полнотекстовый поиск доступен только на PostgreSQL, пропускаем'))
+            return
+
+        updated = refresh_search_vectors()
+        self.stdout.write(self.style.SUCCESS(f'✓ Обновлено поисковых документов: {updated}'))
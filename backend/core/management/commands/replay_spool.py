@@ -0,0 +1,31 @@
+"""
+Management команда для загрузки событий из локального spool в Event
+Использование: python manage.py replay_spool [--dir PATH]
+"""
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Загружает события трекинга, сохранённые в spool во время сбоя, в Event'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dir',
+            default=None,
+            help='Каталог spool (по умолчанию ANALYTICS_SPOOL_DIR)'
+        )
+
+    def handle(self, *args, **options):
+        from core.analytics import spool
+
+        stats = spool.replay(options['dir'])
+
+        if stats['failed']:
+            self.stdout.write(self.style.WARNING(f"Не удалось загрузить файлов: {stats['failed']}"))
+        if stats['rejected']:
+            self.stdout.write(self.style.WARNING(
+                f"Отвергнуто БД событий: {stats['rejected']} (сохранены в *.rejected)"
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Загружено {stats['events']} событий из {stats['files']} файлов"
+        ))
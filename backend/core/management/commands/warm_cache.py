@@ -0,0 +1,45 @@
+"""
+Management команда для прогрева кэша ответов API (после деплоя или смены CACHE_VERSION)
+Использование: python manage.py warm_cache [--top N] [--concurrency N] [--no-landing]
+"""
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Прогревает кэш ответов API: списки, страницы категорий/магазинов/витрин и частые запросы'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=None,
+            help='Сколько самых частых запросов из выборки прогреть (по умолчанию CACHE_WARM_TOP)'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=None,
+            help='Число параллельных запросов (по умолчанию CACHE_WARM_CONCURRENCY)'
+        )
+        parser.add_argument(
+            '--no-landing',
+            action='store_true',
+            help='Только частые запросы из выборки, без списков и страниц категорий/магазинов/витрин'
+        )
+
+    def handle(self, *args, **options):
+        from core.cache_warming import warm
+
+        stats = warm(
+            top=options['top'],
+            concurrency=options['concurrency'],
+            landing=not options['no_landing'],
+        )
+
+        style = self.style.SUCCESS if not stats['failed'] else self.style.WARNING
+        self.stdout.write(
+            style(
+                f"✓ Прогрето {stats['warmed']} из {stats['paths']} запросов за {stats['seconds']} с"
+                + (f", ошибок: {stats['failed']}" if stats['failed'] else '')
+            )
+        )
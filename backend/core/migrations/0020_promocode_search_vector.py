@@ -0,0 +1,58 @@
+# Generated by Django 5.0.8 on 2026-10-17 22:05
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+STORE_SQL = "(SELECT s.name FROM core_store s WHERE s.id = p.store_id)"
+CATEGORIES_SQL = (
+    "(SELECT string_agg(c.name, ' ') FROM core_category c "
+    "JOIN core_promocode_categories pc ON pc.category_id = c.id "
+    "WHERE pc.promocode_id = p.id)"
+)
+
+
+def _document_sql():
+    parts = ["setweight(to_tsvector('simple', coalesce(p.code, '')), 'A')"]
+    for config in ('russian', 'english'):
+        parts.extend([
+            f"setweight(to_tsvector('{config}', coalesce(p.title, '')), 'A')",
+            f"setweight(to_tsvector('{config}', coalesce({STORE_SQL}, '')), 'B')",
+            f"setweight(to_tsvector('{config}', coalesce({CATEGORIES_SQL}, '')), 'C')",
+            f"setweight(to_tsvector('{config}', coalesce(p.discount_label, '') || ' ' || "
+            f"coalesce(p.description, '')), 'D')",
+        ])
+    return ' || '.join(parts)
+
+
+def create_search_index(apps, schema_editor):
+    """GIN индекс и заполнение search_vector (только PostgreSQL)"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_promo_search_vector "
+        "ON core_promocode USING gin (search_vector)"
+    )
+    schema_editor.execute(f"UPDATE core_promocode AS p SET search_vector = {_document_sql()}")
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS idx_promo_search_vector")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_add_seo_verification_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promocode',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations
+
+
+TRIGRAM_INDEXES = (
+    ('idx_store_name_trgm', 'core_store', 'name'),
+    ('idx_promo_title_trgm', 'core_promocode', 'title'),
+    ('idx_category_name_trgm', 'core_category', 'name'),
+)
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """
+    pg_trgm + GIN триграммные индексы (только PostgreSQL).
+
+    Если расширение недоступно на сервере, миграция не падает: поиск
+    работает без нечёткого сравнения (см. core.search.uses_trigram_search).
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for index_name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {index_name} "
+            f"ON {table} USING gin ({column} gin_trgm_ops)"
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for index_name, _, _ in TRIGRAM_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {index_name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_promocode_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.8 on 2026-10-17 22:18
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='ingest_id',
+            field=models.CharField(blank=True, editable=False, max_length=40, null=True, unique=True, verbose_name='ID приёма'),
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
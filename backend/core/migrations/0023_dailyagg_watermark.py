@@ -0,0 +1,65 @@
+# Generated by Django 5.0.8 on 2026-10-17 22:22
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+
+
+def merge_duplicate_rows(apps, schema_editor):
+    """Склеиваем дубли DailyAgg (с NULL в FK), иначе уникальный индекс не создастся"""
+    DailyAgg = apps.get_model('core', 'DailyAgg')
+    key_fields = ('date', 'event_type', 'promo_id', 'store_id', 'showcase_id')
+
+    duplicates = (
+        DailyAgg.objects.values(*key_fields)
+        .annotate(rows=Count('id'), total=Sum('count'), unique=Sum('unique_count'), keep_id=Max('id'))
+        .filter(rows__gt=1)
+    )
+    for group in duplicates:
+        key = {field: group[field] for field in key_fields}
+        DailyAgg.objects.filter(**key).exclude(id=group['keep_id']).delete()
+        DailyAgg.objects.filter(id=group['keep_id']).update(count=group['total'], unique_count=group['unique'])
+
+
+def init_watermark(apps, schema_editor):
+    """
+    Уже агрегированные события не считаем повторно: водяной знак = последнее событие.
+    Точный пересчёт истории: manage.py aggregate_events --rebuild --days 30
+    """
+    Event = apps.get_model('core', 'Event')
+    AggregationWatermark = apps.get_model('core', 'AggregationWatermark')
+    last_id = Event.objects.aggregate(last=Max('id'))['last'] or 0
+    AggregationWatermark.objects.get_or_create(name='daily', defaults={'last_event_id': last_id})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_event_ingest_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AggregationWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Агрегация')),
+                ('last_event_id', models.BigIntegerField(default=0, verbose_name='ID последнего события')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Водяной знак агрегации',
+                'verbose_name_plural': 'Водяные знаки агрегации',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailyagg',
+            unique_together=set(),
+        ),
+        migrations.RunPython(merge_duplicate_rows, migrations.RunPython.noop),
+        migrations.RunPython(init_watermark, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='dailyagg',
+            constraint=models.UniqueConstraint(models.F('date'), models.F('event_type'), django.db.models.functions.comparison.Coalesce('promo', 0), django.db.models.functions.comparison.Coalesce('store', 0), django.db.models.functions.comparison.Coalesce('showcase', 0), name='uniq_dailyagg_row'),
+        ),
+    ]
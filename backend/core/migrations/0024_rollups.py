@@ -0,0 +1,112 @@
+# Generated by Django 5.0.8 on 2026-10-17 22:27
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.db.models.functions import TruncHour
+
+
+def backfill_monthly(apps, schema_editor):
+    """MonthlyAgg из уже накопленных DailyAgg"""
+    DailyAgg = apps.get_model('core', 'DailyAgg')
+    MonthlyAgg = apps.get_model('core', 'MonthlyAgg')
+
+    totals = {}
+    rows = DailyAgg.objects.values('date', 'event_type', 'promo_id', 'store_id', 'showcase_id', 'count', 'unique_count')
+    for row in rows.iterator():
+        key = (row['date'].replace(day=1), row['event_type'], row['promo_id'], row['store_id'], row['showcase_id'])
+        total = totals.setdefault(key, [0, 0])
+        total[0] += row['count']
+        total[1] += row['unique_count']
+
+    MonthlyAgg.objects.bulk_create([
+        MonthlyAgg(
+            month=month, event_type=event_type, promo_id=promo_id, store_id=store_id, showcase_id=showcase_id,
+            count=count, unique_count=unique_count,
+        )
+        for (month, event_type, promo_id, store_id, showcase_id), (count, unique_count) in totals.items()
+    ], batch_size=1000)
+
+
+def backfill_hourly(apps, schema_editor):
+    """
+    HourlyAgg из сырых событий, которые уже учтены в DailyAgg (id <= водяного знака).
+    События старше cleanup_old_events уже удалены - для них планировщик берёт DailyAgg.
+    """
+    Event = apps.get_model('core', 'Event')
+    HourlyAgg = apps.get_model('core', 'HourlyAgg')
+    AggregationWatermark = apps.get_model('core', 'AggregationWatermark')
+
+    watermark = AggregationWatermark.objects.filter(name='daily').values_list('last_event_id', flat=True).first()
+    if not watermark:
+        return
+    groups = (
+        Event.objects.filter(id__lte=watermark)
+        .annotate(hour=TruncHour('created_at'))
+        .values('hour', 'event_type', 'promo_id', 'store_id', 'showcase_id')
+        .annotate(total=Count('id'), unique=Count('id', filter=Q(is_unique=True)))
+        .order_by()
+    )
+    HourlyAgg.objects.bulk_create((
+        HourlyAgg(
+            hour=group['hour'], event_type=group['event_type'], promo_id=group['promo_id'],
+            store_id=group['store_id'], showcase_id=group['showcase_id'],
+            count=group['total'], unique_count=group['unique'],
+        )
+        for group in groups.iterator()
+    ), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_dailyagg_watermark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HourlyAgg',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(db_index=True, verbose_name='Час')),
+                ('event_type', models.CharField(max_length=40, verbose_name='Тип события')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Количество')),
+                ('unique_count', models.PositiveIntegerField(default=0, verbose_name='Уникальных')),
+                ('promo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.promocode', verbose_name='Промокод')),
+                ('showcase', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.showcase', verbose_name='Витрина')),
+                ('store', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.store', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Агрегат по часам',
+                'verbose_name_plural': 'Агрегаты по часам',
+            },
+        ),
+        migrations.CreateModel(
+            name='MonthlyAgg',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(db_index=True, verbose_name='Месяц')),
+                ('event_type', models.CharField(max_length=40, verbose_name='Тип события')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Количество')),
+                ('unique_count', models.PositiveIntegerField(default=0, verbose_name='Уникальных')),
+                ('promo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.promocode', verbose_name='Промокод')),
+                ('showcase', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.showcase', verbose_name='Витрина')),
+                ('store', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.store', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Агрегат по месяцам',
+                'verbose_name_plural': 'Агрегаты по месяцам',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='hourlyagg',
+            constraint=models.UniqueConstraint(models.F('hour'), models.F('event_type'), django.db.models.functions.comparison.Coalesce('promo', 0), django.db.models.functions.comparison.Coalesce('store', 0), django.db.models.functions.comparison.Coalesce('showcase', 0), name='uniq_hourlyagg_row'),
+        ),
+        migrations.RunPython(backfill_monthly, migrations.RunPython.noop),
+        migrations.RunPython(backfill_hourly, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='monthlyagg',
+            constraint=models.UniqueConstraint(models.F('month'), models.F('event_type'), django.db.models.functions.comparison.Coalesce('promo', 0), django.db.models.functions.comparison.Coalesce('store', 0), django.db.models.functions.comparison.Coalesce('showcase', 0), name='uniq_monthlyagg_row'),
+        ),
+    ]
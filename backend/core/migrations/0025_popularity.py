@@ -0,0 +1,47 @@
+# Generated by Django 5.0.8 on 2026-10-17 22:38
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Sum
+from django.utils import timezone
+
+
+def backfill_popularity(apps, schema_editor):
+    """popularity_7d из DailyAgg (см. core.analytics.popularity.USAGE_EVENT_TYPES)"""
+    DailyAgg = apps.get_model('core', 'DailyAgg')
+    PromoCode = apps.get_model('core', 'PromoCode')
+
+    since = timezone.localdate() - timedelta(days=7)
+    usage_types = ['click', 'copy', 'open', 'promo_copy', 'promo_open', 'finance_open', 'deal_open']
+    totals = (
+        DailyAgg.objects.filter(date__gte=since, event_type__in=usage_types, promo__isnull=False)
+        .values('promo_id').annotate(total=Sum('count')).values_list('promo_id', 'total')
+    )
+    for promo_id, total in totals:
+        PromoCode.objects.filter(id=promo_id).update(popularity_7d=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promocode',
+            name='has_badge',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(models.Q(('is_hot', True), ('is_recommended', True), _connector='OR'), then=models.Value(True)), default=models.Value(False)), output_field=models.BooleanField(), verbose_name='Есть бейдж'),
+        ),
+        migrations.AddField(
+            model_name='promocode',
+            name='popularity_7d',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Клики за 7 дней'),
+        ),
+        migrations.AddIndex(
+            model_name='promocode',
+            index=models.Index(fields=['-has_badge', '-is_hot', '-popularity_7d', '-created_at', '-id'], name='idx_promo_popular'),
+        ),
+        migrations.RunPython(backfill_popularity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.8 on 2026-10-17 22:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_popularity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promocode',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False, verbose_name='Тренд'),
+        ),
+        migrations.AddField(
+            model_name='store',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False, verbose_name='Тренд'),
+        ),
+        migrations.AddIndex(
+            model_name='promocode',
+            index=models.Index(fields=['-trending_score', '-created_at', '-id'], name='idx_promo_trending'),
+        ),
+        migrations.AddIndex(
+            model_name='store',
+            index=models.Index(fields=['-trending_score', 'name'], name='idx_store_trending'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+
+INDEX_NAME = 'idx_promo_description_trgm'
+
+
+def create_description_trigram_index(apps, schema_editor):
+    """
+    GIN триграммный индекс по описанию промокода для trigram_word_similar.
+
+    Как и в 0021: без pg_trgm на сервере индекс не создаётся.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute(
+        f"CREATE INDEX IF NOT EXISTS {INDEX_NAME} "
+        f"ON core_promocode USING gin (description gin_trgm_ops)"
+    )
+
+
+def drop_description_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f"DROP INDEX IF EXISTS {INDEX_NAME}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_trending'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_description_trigram_index, drop_description_trigram_index),
+    ]
@@ -1,4 +1,6 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.urls import reverse
 from ckeditor.fields import RichTextField
@@ -98,12 +100,16 @@ class Store(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # ordering=trending: затухающая сумма кликов (core.analytics.trending)
+    trending_score = models.FloatField(default=0, editable=False, verbose_name='Тренд')
+
     class Meta:
         verbose_name = 'Магазин'
         verbose_name_plural = 'Магазины'
         ordering = ['name']
         indexes = [
             models.Index(fields=['is_active', '-rating', 'name'], name='idx_store_active_rating'),
+            models.Index(fields=['-trending_score', 'name'], name='idx_store_trending'),
         ]
 
     def __str__(self):
@@ -196,6 +202,23 @@ class PromoCode(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Поисковый документ (Postgres tsvector), обновляется через core.search
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # Сортировка ordering=popular: бейдж (горячие впереди), клики за 7 дней (core.analytics.popularity), свежесть
+    has_badge = models.GeneratedField(
+        expression=models.Case(
+            models.When(models.Q(is_hot=True) | models.Q(is_recommended=True), then=models.Value(True)),
+            default=models.Value(False),
+        ),
+        output_field=models.BooleanField(),
+        db_persist=True,
+        verbose_name='Есть бейдж',
+    )
+    popularity_7d = models.PositiveIntegerField(default=0, editable=False, verbose_name='Клики за 7 дней')
+    # ordering=trending: затухающая сумма кликов (core.analytics.trending)
+    trending_score = models.FloatField(default=0, editable=False, verbose_name='Тренд')
+
     class Meta:
         verbose_name = 'Промокод'
         verbose_name_plural = 'Промокоды'
@@ -205,6 +228,10 @@ class PromoCode(models.Model):
             models.Index(fields=['store', 'is_active']),
             models.Index(fields=['is_hot', 'is_active']),
             models.Index(fields=['-created_at']),
+            models.Index(
+                fields=['-has_badge', '-is_hot', '-popularity_7d', '-created_at', '-id'], name='idx_promo_popular'
+            ),
+            models.Index(fields=['-trending_score', '-created_at', '-id'], name='idx_promo_trending'),
         ]
 
     def __str__(self):
@@ -598,7 +625,8 @@ class SiteAssets(models.Model):
 
 class Event(models.Model):
     """Событие трекинга"""
-    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    # default вместо auto_now_add: при буферизованном приёме сохраняем время события, а не вставки
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
     event_type = models.CharField(max_length=40, db_index=True, verbose_name="Тип события")
     # Типы: 'promo_view','promo_copy','promo_open','finance_open','deal_open','showcase_view','showcase_open'
 
@@ -617,6 +645,9 @@ class Event(models.Model):
 
     is_unique = models.BooleanField(default=False, verbose_name="Уникальное")
 
+    # ID записи Redis Stream + позиция в батче: повторная доставка не создаёт дублей
+    ingest_id = models.CharField(max_length=40, null=True, blank=True, unique=True, editable=False, verbose_name="ID приёма")
+
     class Meta:
         verbose_name = "Событие"
         verbose_name_plural = "События"
@@ -646,10 +677,86 @@ class DailyAgg(models.Model):
     class Meta:
         verbose_name = "Агрегат по дням"
         verbose_name_plural = "Агрегаты по дням"
-        unique_together = [('date', 'event_type', 'promo', 'store', 'showcase')]
+        constraints = [
+            # COALESCE: NULL в unique_together не конфликтуют между собой, строки дублировались.
+            # Этот же индекс - цель ON CONFLICT в core.analytics.aggregation
+            models.UniqueConstraint(
+                'date', 'event_type',
+                Coalesce('promo', 0), Coalesce('store', 0), Coalesce('showcase', 0),
+                name='uniq_dailyagg_row',
+            ),
+        ]
         indexes = [
             models.Index(fields=['date', 'event_type']),
         ]
 
     def __str__(self):
-        return f"{self.date} - {self.event_type} - {self.count}"
\ No newline at end of file
+        return f"{self.date} - {self.event_type} - {self.count}"
+
+
+class HourlyAgg(models.Model):
+    """Агрегированная статистика по часам (хранится ANALYTICS_HOURLY_RETENTION_DAYS дней)"""
+    hour = models.DateTimeField(db_index=True, verbose_name="Час")
+    event_type = models.CharField(max_length=40, verbose_name="Тип события")
+
+    promo = models.ForeignKey('PromoCode', null=True, blank=True, on_delete=models.SET_NULL, related_name='+', verbose_name="Промокод")
+    store = models.ForeignKey('Store', null=True, blank=True, on_delete=models.SET_NULL, related_name='+', verbose_name="Магазин")
+    showcase = models.ForeignKey('Showcase', null=True, blank=True, on_delete=models.SET_NULL, related_name='+', verbose_name="Витрина")
+
+    count = models.PositiveIntegerField(default=0, verbose_name="Количество")
+    unique_count = models.PositiveIntegerField(default=0, verbose_name="Уникальных")
+
+    class Meta:
+        verbose_name = "Агрегат по часам"
+        verbose_name_plural = "Агрегаты по часам"
+        constraints = [
+            models.UniqueConstraint(
+                'hour', 'event_type',
+                Coalesce('promo', 0), Coalesce('store', 0), Coalesce('showcase', 0),
+                name='uniq_hourlyagg_row',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.hour} - {self.event_type} - {self.count}"
+
+
+class MonthlyAgg(models.Model):
+    """Агрегированная статистика по месяцам (month - первое число месяца)"""
+    month = models.DateField(db_index=True, verbose_name="Месяц")
+    event_type = models.CharField(max_length=40, verbose_name="Тип события")
+
+    promo = models.ForeignKey('PromoCode', null=True, blank=True, on_delete=models.SET_NULL, related_name='+', verbose_name="Промокод")
+    store = models.ForeignKey('Store', null=True, blank=True, on_delete=models.SET_NULL, related_name='+', verbose_name="Магазин")
+    showcase = models.ForeignKey('Showcase', null=True, blank=True, on_delete=models.SET_NULL, related_name='+', verbose_name="Витрина")
+
+    count = models.PositiveIntegerField(default=0, verbose_name="Количество")
+    unique_count = models.PositiveIntegerField(default=0, verbose_name="Уникальных")
+
+    class Meta:
+        verbose_name = "Агрегат по месяцам"
+        verbose_name_plural = "Агрегаты по месяцам"
+        constraints = [
+            models.UniqueConstraint(
+                'month', 'event_type',
+                Coalesce('promo', 0), Coalesce('store', 0), Coalesce('showcase', 0),
+                name='uniq_monthlyagg_row',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} - {self.event_type} - {self.count}"
+
+
+class AggregationWatermark(models.Model):
+    """Последнее агрегированное событие (инкрементальная агрегация Event -> Hourly/Daily/MonthlyAgg)"""
+    name = models.CharField(max_length=50, unique=True, verbose_name="Агрегация")
+    last_event_id = models.BigIntegerField(default=0, verbose_name="ID последнего события")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
+
+    class Meta:
+        verbose_name = "Водяной знак агрегации"
+        verbose_name_plural = "Водяные знаки агрегации"
+
+    def __str__(self):
+        return f"{self.name}: {self.last_event_id}"
@@ -0,0 +1,288 @@
+"""
+Pagination of promo code lists.
+
+``PromoCodePagination`` is page-number based by default (``?page=``, with
+``page_size``/``limit``). Passing ``?cursor=`` (empty for the first page)
+switches to keyset pagination: the cursor encodes the sort key of the last
+row, and the next page is ``WHERE (sort key) after (cursor) LIMIT n`` -
+no ``OFFSET`` scan and no ``COUNT(*)``, so a deep page of an infinite scroll
+costs the same as the first one.
+
+The sort key is the queryset ordering (any plain field or annotation,
+including ``ordering=popular``/``trending`` and search relevance) with the
+primary key appended as a tie-breaker. Cursor pages go forward only and
+have no ``count``; an ordering over related fields falls back to page
+numbers.
+
+Page mode avoids ``COUNT(*)`` where it can. The page is read with one extra
+row; ``count_type`` in the response tells which total the client got:
+
+* ``exact`` - the page is the last one (total = offset + rows), or the
+  total was counted now (``?count=exact`` always counts);
+* ``cached`` - an exact total counted earlier for the same path and
+  filter parameters (``COUNT_CACHE_TTL``, invalidated on PromoCode writes
+  through ``bump_count_version``);
+* ``estimate`` - the planner row estimate on Postgres for lists without
+  filter parameters.
+"""
+import base64
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+logger = logging.getLogger(__name__)
+
+COUNT_EXACT = 'exact'
+COUNT_CACHED = 'cached'
+COUNT_ESTIMATE = 'estimate'
+
+COUNT_VERSION_KEY = 'pagination:count:version'
+COUNT_CACHE_TTL = 60 * 5
+
+# Параметры, не меняющие набор строк (не входят в ключ кэша количества)
+NON_FILTER_PARAMS = {'page', 'page_size', 'limit', 'cursor', 'ordering', 'count', 'format', 'facets'}
+
+
+class CursorEncoder(json.JSONEncoder):
+    """Полная точность значений ключа (DjangoJSONEncoder обрезает микросекунды)"""
+
+    def default(self, o):
+        if hasattr(o, 'isoformat'):
+            return o.isoformat()
+        return str(o)
+
+
+def keyset_ordering(queryset):
+    """
+    ``[(name, descending), ...]`` of the queryset ordering plus the pk, or
+    None if it cannot be used as a keyset (expressions, related fields).
+    """
+    terms = list(queryset.query.order_by) or list(queryset.model._meta.ordering)
+    ordering = []
+    for term in terms:
+        if not isinstance(term, str) or '__' in term or term.startswith('?'):
+            return None
+        name = term.lstrip('-')
+        if name == 'pk':
+            name = queryset.model._meta.pk.name
+        ordering.append((name, term.startswith('-')))
+    pk_name = queryset.model._meta.pk.name
+    if pk_name not in [name for name, _ in ordering]:
+        ordering.append((pk_name, ordering[-1][1] if ordering else False))
+    return ordering
+
+
+def keyset_filter(ordering, values):
+    """Rows strictly after ``values`` in ``ordering``: (a < x) OR (a = x AND b < y) OR ..."""
+    after = Q()
+    equal = {}
+    for (name, descending), value in zip(ordering, values):
+        after |= Q(**equal, **{f"{name}__{'lt' if descending else 'gt'}": value})
+        equal[name] = value
+    return after
+
+
+def bump_count_version():
+    """Invalidate cached list totals in every worker."""
+    try:
+        cache.incr(COUNT_VERSION_KEY)
+    except ValueError:
+        cache.add(COUNT_VERSION_KEY, 1, None)
+
+
+def count_cache_key(request):
+    """Path + sorted filter parameters + current count version."""
+    version = cache.get(COUNT_VERSION_KEY) or 0
+    params = sorted(
+        (key, value) for key, values in request.query_params.lists()
+        if key not in NON_FILTER_PARAMS for value in values
+    )
+    digest = hashlib.md5(f"{request.path}?{params}".encode()).hexdigest()
+    return f"pagination:count:{version}:{digest}"
+
+
+def estimate_count(queryset):
+    """Planner row estimate (Postgres EXPLAIN), None elsewhere."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class PromoCodePagination(PageNumberPagination):
+    """Pagination for promo codes with optional `limit` query support, `cursor` mode and cheap totals."""
+    page_size = 12
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    count_query_param = 'count'
+
+    @classmethod
+    def default_params(cls, params):
+        """Query parameters assumed when absent (canonical cache keys): page=1 and page_size"""
+        defaults = {}
+        if cls.cursor_query_param not in params:
+            defaults[cls.page_query_param] = 1
+        if 'limit' not in params:
+            defaults[cls.page_size_query_param] = cls.page_size
+        return defaults
+
+    def get_page_size(self, request):
+        limit = request.query_params.get('limit')
+        if limit is not None:
+            try:
+                limit_value = int(limit)
+                if limit_value > 0:
+                    return min(limit_value, self.max_page_size)
+            except (TypeError, ValueError):
+                pass
+        return super().get_page_size(request)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.ordering = None
+        self.count_type = COUNT_EXACT
+        if self.cursor_query_param in request.query_params and hasattr(queryset, 'query'):
+            self.ordering = keyset_ordering(queryset)
+        if self.ordering is None:
+            if not hasattr(queryset, 'query') or request.query_params.get(self.count_query_param) == COUNT_EXACT:
+                return super().paginate_queryset(queryset, request, view)
+            return self.paginate_without_count(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*[f"{'-' if desc else ''}{name}" for name, desc in self.ordering])
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(keyset_filter(self.ordering, self.decode_cursor(cursor, queryset.model)))
+
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        self.page_rows = rows[:page_size]
+        return self.page_rows
+
+    def paginate_without_count(self, queryset, request, view=None):
+        """Page-number pagination that reads page_size + 1 rows and counts only if needed."""
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        page_number = request.query_params.get(self.page_query_param) or 1
+        if page_number in self.last_page_strings:
+            # Последняя страница требует точного количества
+            return super().paginate_queryset(queryset, request, view)
+
+        try:
+            number = int(page_number)
+            if number < 1:
+                raise ValueError
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message='Invalid page.'))
+
+        offset = (number - 1) * page_size
+        rows = list(queryset[offset:offset + page_size + 1])
+        if not rows and number > 1:
+            raise NotFound(
+                self.invalid_page_message.format(page_number=page_number, message='That page contains no results')
+            )
+
+        if len(rows) <= page_size:
+            count = offset + len(rows)
+        else:
+            rows = rows[:page_size]
+            count, self.count_type = self.get_count(queryset, request)
+            # Устаревшее значение не должно противоречить наличию следующей страницы
+            count = max(count, offset + page_size + 1)
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        paginator.count = count
+        self.page = paginator._get_page(rows, number, paginator)
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        self.request = request
+        return list(self.page)
+
+    def get_count(self, queryset, request):
+        """Total rows of a list that has more than one page: (count, count_type)."""
+        key = count_cache_key(request)
+        count = cache.get(key)
+        if count is not None:
+            return count, COUNT_CACHED
+
+        filtered = any(param not in NON_FILTER_PARAMS for param in request.query_params)
+        if not filtered:
+            try:
+                count = estimate_count(queryset)
+            except Exception as e:
+                logger.warning(f"Count estimate failed: {str(e)}")
+            if count is not None:
+                return count, COUNT_ESTIMATE
+
+        count = queryset.count()
+        cache.set(key, count, COUNT_CACHE_TTL)
+        return count, COUNT_EXACT
+
+    def encode_cursor(self, row):
+        payload = {
+            'o': [f"{'-' if desc else ''}{name}" for name, desc in self.ordering],
+            'v': [getattr(row, name) for name, _ in self.ordering],
+        }
+        data = json.dumps(payload, cls=CursorEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor, model):
+        """Sort key values of the cursor, converted by the model fields."""
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            if payload['o'] != [f"{'-' if desc else ''}{name}" for name, desc in self.ordering]:
+                raise ValueError('ordering changed')
+            values = []
+            for (name, _), value in zip(self.ordering, payload['v'], strict=True):
+                try:
+                    field = model._meta.get_field(name)
+                    # GeneratedField: значение в типе output_field
+                    value = getattr(field, 'output_field', field).to_python(value)
+                except FieldDoesNotExist:
+                    pass  # аннотация (search_rank) - число как есть
+                values.append(value)
+            return values
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_paginated_response(self, data):
+        if self.ordering is None:
+            return Response(OrderedDict([
+                ('count', self.page.paginator.count),
+                ('count_type', self.count_type),
+                ('next', self.get_next_link()),
+                ('previous', self.get_previous_link()),
+                ('results', data),
+            ]))
+        return Response(OrderedDict([
+            ('next', self.get_next_cursor_link()),
+            ('previous', None),
+            ('results', data),
+        ]))
+
+    def get_next_cursor_link(self):
+        if not self.has_next:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page_rows[-1]))
@@ -0,0 +1,73 @@
+"""
+API renderers.
+
+``ORJSONRenderer`` is the default JSON renderer: the same output as DRF's
+``JSONRenderer`` (compact, UTF-8, ``\\u2028``/``\\u2029`` escaped, datetimes
+and decimals through DRF's encoder) produced by orjson. Without orjson, or
+for an indented response (``Accept: application/json; indent=4``), it falls
+back to the stdlib renderer.
+
+``MessagePackRenderer`` answers ``Accept: application/msgpack`` (or
+``?format=msgpack``) when msgpack is installed.
+
+``?format=`` is DRF's format override: it selects a renderer by its
+``format``. ``normalized`` renders JSON, and promo code lists that see it as
+the accepted renderer (``is_normalized``) reference stores and categories by
+id with the objects themselves once in ``included``.
+"""
+from rest_framework.utils import encoders
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson в requirements.txt
+    orjson = None
+
+NORMALIZED_FORMAT = 'normalized'
+
+# Типы, которых нет в JSON/MessagePack (datetime, Decimal, lazy-строки), - как в DRF
+_encoder = encoders.JSONEncoder()
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(
+            data, default=_encoder.default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+        )
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class NormalizedJSONRenderer(ORJSONRenderer):
+    """?format=normalized - JSON со ссылками store_id/category_ids и блоком included"""
+    format = NORMALIZED_FORMAT
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Accept: application/msgpack"""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        import msgpack
+
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_encoder.default, use_bin_type=True)
+
+
+def is_normalized(request):
+    """True if the request was negotiated to ``NormalizedJSONRenderer``."""
+    renderer = getattr(request, 'accepted_renderer', None)
+    return getattr(renderer, 'format', None) == NORMALIZED_FORMAT
@@ -0,0 +1,24 @@
+"""
+Поисковая подсистема BoltPromo.
+
+Полнотекстовый поиск по промокодам (Postgres tsvector + GIN), нечёткий поиск
+по триграммам (pg_trgm) с учётом раскладки и транслитерации, fallback
+на icontains для SQLite.
+"""
+from .engine import (
+    refresh_search_vectors,
+    search_by_name,
+    search_promocodes,
+    uses_full_text_search,
+    uses_trigram_search,
+)
+from .normalize import query_variants
+
+__all__ = (
+    'query_variants',
+    'refresh_search_vectors',
+    'search_by_name',
+    'search_promocodes',
+    'uses_full_text_search',
+    'uses_trigram_search',
+)
@@ -0,0 +1,283 @@
+"""
+Full-text search engine for promo codes.
+
+On PostgreSQL every PromoCode keeps a precomputed ``search_vector``
+(Russian + English configs, weights: title/code > store > categories >
+description) backed by a GIN index, so a search is an index lookup ordered
+by ``ts_rank``. When the ``pg_trgm`` extension is installed, misspelled
+names are caught by trigram word similarity (``%>``: the query against the
+best matching part of the field, so a long title or description does not
+dilute the score) on the GIN trigram indexes over ``Store.name``,
+``PromoCode.title``, ``PromoCode.description`` and ``Category.name``. Every query is
+expanded into keyboard-layout / transliteration variants (see
+``normalize.py``) and all variants are matched in one SQL statement.
+
+Other backends (SQLite in development) fall back to an icontains scan over
+the same variants.
+"""
+import logging
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Exists, F, OuterRef, Q
+from django.db.models.functions import Greatest
+
+from .normalize import query_variants
+
+logger = logging.getLogger(__name__)
+
+# Минимальная длина поискового термина (короче — игнорируем, как и раньше)
+MIN_TERM_LENGTH = 2
+
+# Нечёткое сравнение на совсем коротких строках даёт в основном шум
+TRIGRAM_MIN_LENGTH = 3
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+# alias БД -> установлено ли расширение pg_trgm (проверяем один раз на процесс)
+_trigram_support = {}
+
+
+def get_search_configs():
+    """Postgres text search configs used for the search document."""
+    return tuple(getattr(settings, 'SEARCH_CONFIGS', ('russian', 'english')))
+
+
+def uses_full_text_search(using='default'):
+    """True if the given DB alias supports the tsvector search path."""
+    return connections[using].vendor == 'postgresql'
+
+
+def uses_trigram_search(using='default'):
+    """True if the DB alias is Postgres with the pg_trgm extension installed."""
+    if not uses_full_text_search(using):
+        return False
+    if using not in _trigram_support:
+        try:
+            with connections[using].cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                _trigram_support[using] = cursor.fetchone() is not None
+        except Exception as e:
+            logger.warning(f"pg_trgm check failed: {str(e)}")
+            return False
+    return _trigram_support[using]
+
+
+def split_terms(value):
+    """Split a raw query into normalized search terms."""
+    if not value:
+        return []
+    return [
+        term for term in _TERM_RE.findall(value.lower())
+        if len(term) >= MIN_TERM_LENGTH
+    ]
+
+
+def build_search_query(terms):
+    """
+    Build a prefix tsquery (``term:* & term:*``) for every configured config.
+
+    Prefix matching keeps search-as-you-type working: "телеф" finds "телефоны".
+    """
+    from django.contrib.postgres.search import SearchQuery
+
+    raw = ' & '.join(f'{term}:*' for term in terms)
+    query = None
+    for config in get_search_configs():
+        part = SearchQuery(raw, config=config, search_type='raw')
+        query = part if query is None else query | part
+    return query
+
+
+def _icontains_q(terms):
+    """Legacy icontains search: each term must match at least one field."""
+    search_q = Q()
+    for term in terms:
+        search_q &= (
+            Q(title__icontains=term) |
+            Q(description__icontains=term) |
+            Q(store__name__icontains=term) |
+            Q(categories__name__icontains=term) |
+            Q(code__icontains=term) |
+            Q(discount_label__icontains=term)
+        )
+    return search_q
+
+
+def _greatest(expressions):
+    """Greatest() needs at least two arguments."""
+    return expressions[0] if len(expressions) == 1 else Greatest(*expressions)
+
+
+def _variant_terms(value, fuzzy):
+    """Term lists for every spelling variant of the query (empty ones dropped)."""
+    variants = query_variants(value) if fuzzy else [value]
+    term_sets = []
+    for variant in variants:
+        terms = split_terms(variant)
+        if terms and terms not in term_sets:
+            term_sets.append(terms)
+    return term_sets
+
+
+def _trigram_phrases(term_sets):
+    return [
+        phrase for phrase in (' '.join(terms) for terms in term_sets)
+        if len(phrase) >= TRIGRAM_MIN_LENGTH
+    ]
+
+
+def search_promocodes(queryset, value, rank=True, fuzzy=True):
+    """
+    Filter a PromoCode queryset by a user search query.
+
+    Args:
+        queryset: PromoCode queryset to narrow down
+        value: raw search string from the request
+        rank: annotate ``search_rank`` (Postgres only, ``None`` otherwise)
+        fuzzy: also match layout/transliteration variants and, with pg_trgm,
+            misspelled words of titles, descriptions, store and category names
+
+    Returns:
+        Filtered queryset. Callers decide whether to order by ``search_rank``.
+    """
+    term_sets = _variant_terms(value, fuzzy)
+    if not term_sets:
+        return queryset
+
+    if uses_full_text_search(queryset.db):
+        from django.contrib.postgres.search import SearchRank, TrigramWordSimilarity
+
+        from ..models import Category
+
+        query = None
+        for terms in term_sets:
+            part = build_search_query(terms)
+            query = part if query is None else query | part
+        match = Q(search_vector=query)
+
+        similarities = []
+        if fuzzy and uses_trigram_search(queryset.db):
+            for phrase in _trigram_phrases(term_sets):
+                # Категории через EXISTS, чтобы M2M join не размножал строки
+                category_match = Exists(
+                    Category.objects.filter(promocode=OuterRef('pk'), name__trigram_word_similar=phrase)
+                )
+                match |= (
+                    Q(title__trigram_word_similar=phrase) |
+                    Q(description__trigram_word_similar=phrase) |
+                    Q(store__name__trigram_word_similar=phrase) |
+                    category_match
+                )
+                similarities.extend([
+                    TrigramWordSimilarity(phrase, 'title'),
+                    TrigramWordSimilarity(phrase, 'store__name'),
+                ])
+
+        queryset = queryset.filter(match)
+        if rank:
+            search_rank = SearchRank(F('search_vector'), query)
+            if similarities:
+                search_rank = search_rank + _greatest(similarities)
+            queryset = queryset.annotate(search_rank=search_rank)
+        return queryset
+
+    search_q = Q()
+    for terms in term_sets:
+        search_q |= _icontains_q(terms)
+    return queryset.filter(search_q).distinct()
+
+
+def search_by_name(queryset, value, fields=('name', 'description'), fuzzy=True):
+    """
+    Filter a Store/Category queryset by name-like fields.
+
+    All spelling variants are OR'ed into one query; with pg_trgm the first
+    field is also matched by trigram word similarity and the result is
+    ordered by relevance (``search_rank``).
+    """
+    term_sets = _variant_terms(value, fuzzy)
+    if not term_sets:
+        return queryset
+
+    phrases = [' '.join(terms) for terms in term_sets]
+    match = Q()
+    for phrase in phrases:
+        for field in fields:
+            match |= Q(**{f'{field}__icontains': phrase})
+
+    if not (fuzzy and uses_trigram_search(queryset.db)):
+        return queryset.filter(match)
+
+    from django.contrib.postgres.search import TrigramWordSimilarity
+
+    name_field = fields[0]
+    similarities = []
+    for phrase in _trigram_phrases(term_sets):
+        match |= Q(**{f'{name_field}__trigram_word_similar': phrase})
+        similarities.append(TrigramWordSimilarity(phrase, name_field))
+
+    queryset = queryset.filter(match)
+    if similarities:
+        queryset = order_by_rank(queryset.annotate(search_rank=_greatest(similarities)))
+    return queryset
+
+
+def order_by_rank(queryset):
+    """Put the most relevant results first, keeping the existing ordering as tie-breaker."""
+    if 'search_rank' not in queryset.query.annotations:
+        return queryset
+    existing = list(queryset.query.order_by) or list(queryset.model._meta.ordering)
+    return queryset.order_by('-search_rank', *existing)
+
+
+def _document_sql(configs):
+    """SQL expression building the weighted search document for alias ``p``."""
+    categories_sql = (
+        "(SELECT string_agg(c.name, ' ') FROM core_category c "
+        "JOIN core_promocode_categories pc ON pc.category_id = c.id "
+        "WHERE pc.promocode_id = p.id)"
+    )
+    store_sql = "(SELECT s.name FROM core_store s WHERE s.id = p.store_id)"
+
+    parts = ["setweight(to_tsvector('simple', coalesce(p.code, '')), 'A')"]
+    for config in configs:
+        parts.extend([
+            f"setweight(to_tsvector('{config}', coalesce(p.title, '')), 'A')",
+            f"setweight(to_tsvector('{config}', coalesce({store_sql}, '')), 'B')",
+            f"setweight(to_tsvector('{config}', coalesce({categories_sql}, '')), 'C')",
+            f"setweight(to_tsvector('{config}', coalesce(p.discount_label, '') || ' ' || "
+            f"coalesce(p.description, '')), 'D')",
+        ])
+    return ' || '.join(parts)
+
+
+def refresh_search_vectors(queryset=None):
+    """
+    Recompute ``search_vector`` for the given PromoCode queryset (all if None).
+
+    Runs a single UPDATE; no-op on backends without full-text search.
+
+    Returns:
+        Number of updated rows
+    """
+    from ..models import PromoCode
+
+    if queryset is None:
+        queryset = PromoCode.objects.all()
+
+    if not uses_full_text_search(queryset.db):
+        return 0
+
+    ids_sql, params = queryset.order_by().values('id').query.sql_with_params()
+    sql = (
+        f"UPDATE core_promocode AS p SET search_vector = {_document_sql(get_search_configs())} "
+        f"WHERE p.id IN ({ids_sql})"
+    )
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        updated = cursor.rowcount
+
+    logger.debug(f"Search vectors refreshed: {updated} promocodes")
+    return updated
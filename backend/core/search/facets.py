@@ -0,0 +1,127 @@
+"""
+Facet counts for promo code listings.
+
+All facets are computed by a single ``UNION ALL`` of grouped subqueries over
+the already filtered result set, so the filter sidebar renders without
+follow-up requests. Facet names match the ``PromoCodeFilter`` parameters
+(``store``, ``category``, ``offer_type``, ``with_code``, ``expires_soon``),
+so a facet value can be sent back as-is to narrow the search.
+
+Value facets (``DISJUNCTIVE_FACETS``) can be counted disjunctively: the
+caller passes, per facet, the result set filtered by everything except that
+facet's own parameter, so the sidebar still shows the other stores (types,
+categories) and how many results picking one of them would give. The flag
+facets are counted on the filtered set: with their filter on, the count is
+the same either way.
+"""
+from datetime import timedelta
+
+from django.db.models import Case, CharField, Count, Q, Value, When
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+# Сколько значений магазинов/категорий отдаём в сайдбар
+FACET_LIMIT = 20
+
+# Совпадает с PromoCodeFilter.filter_expires_soon
+EXPIRING_SOON_DAYS = 7
+
+# Фасеты, которые считаются без собственного фильтра (параметры PromoCodeFilter)
+DISJUNCTIVE_FACETS = ('store', 'category', 'offer_type')
+
+
+def _flag(condition):
+    return Case(When(condition, then=Value('1')), default=Value('0'), output_field=CharField())
+
+
+def _grouped(queryset, facet, key, label, count_field='pk'):
+    return (
+        queryset
+        .annotate(facet=Value(facet, output_field=CharField()), key=key, label=label)
+        .values('facet', 'key', 'label')
+        .annotate(count=Count(count_field))
+        .order_by()
+    )
+
+
+def compute_facets(queryset, limit=FACET_LIMIT, facet_querysets=None):
+    """
+    Facet counts for a filtered PromoCode queryset in one DB query.
+
+    ``facet_querysets`` maps a ``DISJUNCTIVE_FACETS`` name to the queryset
+    filtered without that facet (see ``PromoCodeListView``); facets missing
+    from it are counted on ``queryset``. Only active categories are counted.
+
+    Returns:
+        dict: {
+            'store': [{'value': slug, 'label': name, 'count': n}, ...],
+            'category': [...],
+            'offer_type': [...],
+            'with_code': n,
+            'expires_soon': n,
+        }
+    """
+    from ..models import PromoCode
+
+    # Фильтры по M2M могут размножать строки - считаем по уникальным id
+    ids = queryset.order_by().values('pk')
+    base = PromoCode.objects.filter(pk__in=ids)
+    facet_ids = {
+        facet: facet_queryset.order_by().values('pk')
+        for facet, facet_queryset in (facet_querysets or {}).items()
+    }
+
+    def facet_base(facet):
+        if facet not in facet_ids:
+            return base
+        return PromoCode.objects.filter(pk__in=facet_ids[facet])
+
+    now = timezone.now()
+    soon = now + timedelta(days=EXPIRING_SOON_DAYS)
+
+    text = CharField()
+    parts = [
+        _grouped(facet_base('store'), 'store', Cast('store__slug', text), Cast('store__name', text)),
+        _grouped(
+            PromoCode.categories.through.objects.filter(
+                promocode_id__in=facet_ids.get('category', ids), category__is_active=True,
+            ),
+            'category',
+            Cast('category__slug', text),
+            Cast('category__name', text),
+            count_field='promocode_id',
+        ),
+        _grouped(facet_base('offer_type'), 'offer_type', Cast('offer_type', text), Cast('offer_type', text)),
+        _grouped(
+            base, 'with_code',
+            _flag(Q(code__isnull=False) & ~Q(code='')),
+            Value('', output_field=text),
+        ),
+        _grouped(
+            base, 'expires_soon',
+            _flag(Q(expires_at__gte=now, expires_at__lte=soon)),
+            Value('', output_field=text),
+        ),
+    ]
+    rows = parts[0].union(*parts[1:], all=True)
+
+    offer_labels = dict(PromoCode.OFFER_TYPE_CHOICES)
+    facets = {'store': [], 'category': [], 'offer_type': [], 'with_code': 0, 'expires_soon': 0}
+    for row in rows:
+        facet = row['facet']
+        if facet in ('with_code', 'expires_soon'):
+            if row['key'] == '1':
+                facets[facet] = row['count']
+            continue
+        label = offer_labels.get(row['key'], row['key']) if facet == 'offer_type' else row['label']
+        facets[facet].append({'value': row['key'], 'label': label, 'count': row['count']})
+
+    for facet in ('store', 'category', 'offer_type'):
+        facets[facet].sort(key=lambda item: (-item['count'], item['label'] or ''))
+        facets[facet] = facets[facet][:limit]
+    return facets
+
+
+def wants_facets(request):
+    """``?facets=1`` / ``?facets=true`` switches facet counts on."""
+    return request.query_params.get('facets', '').lower() in ('1', 'true', 'yes')
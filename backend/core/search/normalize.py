@@ -0,0 +1,94 @@
+"""
+Query normalizer: keyboard-layout and transliteration variants.
+
+Users regularly type Russian words on the English layout ("ьфкшф" instead of
+"мария") or spell Russian store names in Latin ("ozon" vs "озон"). Instead of
+the frontend retrying several searches, the engine expands one query into a
+small set of variants and matches all of them in a single SQL statement.
+"""
+import re
+
+# Раскладка ЙЦУКЕН <-> QWERTY (одинаковые физические клавиши)
+_EN_KEYS = "`qwertyuiop[]asdfghjkl;'zxcvbnm,."
+_RU_KEYS = "ёйцукенгшщзхъфывапролджэячсмитьбю"
+
+_EN_TO_RU = str.maketrans(_EN_KEYS, _RU_KEYS)
+_RU_TO_EN = str.maketrans(_RU_KEYS, _EN_KEYS)
+
+# Транслитерация кириллица -> латиница (упрощённый ГОСТ, как в URL-слагах)
+_RU_TO_LAT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e',
+    'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
+    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch',
+    'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+}
+
+# Латиница -> кириллица: сначала многобуквенные сочетания
+_LAT_TO_RU = [
+    ('sch', 'щ'), ('shch', 'щ'), ('zh', 'ж'), ('kh', 'х'), ('ts', 'ц'),
+    ('ch', 'ч'), ('sh', 'ш'), ('yu', 'ю'), ('ya', 'я'), ('yo', 'ё'),
+    ('ia', 'ия'), ('iy', 'ий'), ('ph', 'ф'), ('ck', 'к'),
+    ('a', 'а'), ('b', 'б'), ('c', 'к'), ('d', 'д'), ('e', 'е'), ('f', 'ф'),
+    ('g', 'г'), ('h', 'х'), ('i', 'и'), ('j', 'дж'), ('k', 'к'), ('l', 'л'),
+    ('m', 'м'), ('n', 'н'), ('o', 'о'), ('p', 'п'), ('q', 'к'), ('r', 'р'),
+    ('s', 'с'), ('t', 'т'), ('u', 'у'), ('v', 'в'), ('w', 'в'), ('x', 'кс'),
+    ('y', 'ы'), ('z', 'з'),
+]
+_LAT_RE = re.compile('|'.join(sorted((re.escape(k) for k, _ in _LAT_TO_RU), key=len, reverse=True)))
+_LAT_MAP = dict(_LAT_TO_RU)
+
+_CYRILLIC_RE = re.compile('[а-яё]')
+_LATIN_RE = re.compile('[a-z]')
+
+# Больше вариантов почти не добавляют полноты, но утяжеляют запрос
+MAX_VARIANTS = 4
+
+
+def normalize_query(value):
+    """Lowercase, trim and collapse whitespace."""
+    return ' '.join((value or '').lower().split())
+
+
+def swap_layout(value):
+    """Re-type the string on the other keyboard layout."""
+    cyrillic = len(_CYRILLIC_RE.findall(value))
+    latin = len(_LATIN_RE.findall(value))
+    if cyrillic > latin:
+        return value.translate(_RU_TO_EN)
+    return value.translate(_EN_TO_RU)
+
+
+def transliterate(value):
+    """Transliterate Cyrillic to Latin or Latin to Cyrillic, whichever dominates."""
+    cyrillic = len(_CYRILLIC_RE.findall(value))
+    latin = len(_LATIN_RE.findall(value))
+    if cyrillic > latin:
+        return ''.join(_RU_TO_LAT.get(ch, ch) for ch in value)
+    return _LAT_RE.sub(lambda m: _LAT_MAP[m.group(0)], value)
+
+
+def query_variants(value):
+    """
+    Expand a search query into distinct candidate spellings.
+
+    Order: original, layout-swapped, transliterated original,
+    transliterated layout-swapped.
+
+    Example:
+        >>> query_variants('ьфкшф')
+        ['ьфкшф', 'maria', 'fkshf', 'мария']
+    """
+    original = normalize_query(value)
+    if not original:
+        return []
+
+    swapped = swap_layout(original)
+    candidates = [original, swapped, transliterate(original), transliterate(swapped)]
+
+    variants = []
+    for candidate in candidates:
+        candidate = normalize_query(candidate)
+        if candidate and candidate not in variants:
+            variants.append(candidate)
+    return variants[:MAX_VARIANTS]
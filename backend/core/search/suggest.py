@@ -0,0 +1,177 @@
+"""
+In-process prefix autocomplete for the header search box.
+
+Every worker keeps a compact sorted array of ``(key, entry_no)`` pairs, where
+``key`` is a lowercased label suffix starting at a word boundary ("скидка на
+смартфоны" -> "скидка на смартфоны", "на смартфоны", "смартфоны"). A lookup is
+a ``bisect`` plus a short scan, so suggestions never touch Postgres.
+
+Freshness: a version counter lives in the shared cache (Redis) and is bumped
+by model signals. Workers re-check it at most every
+``VERSION_CHECK_INTERVAL`` seconds; on a new version the raw entries are
+taken from the cache (built once by whichever worker gets there first) and
+only a cold cache falls back to the DB.
+"""
+import bisect
+import logging
+import threading
+import time
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .normalize import normalize_query, query_variants
+
+logger = logging.getLogger(__name__)
+
+VERSION_CACHE_KEY = 'search:suggest:version'
+ENTRIES_CACHE_KEY = 'search:suggest:entries:{version}'
+ENTRIES_TTL = 60 * 60 * 24
+
+# Как часто воркер сверяет версию индекса с Redis (секунды)
+VERSION_CHECK_INTERVAL = 5
+
+# Сколько популярных промокодов попадает в индекс
+PROMO_LIMIT = 1000
+
+KINDS = ('stores', 'categories', 'promocodes')
+
+
+class SuggestIndex:
+    """Immutable sorted-array prefix index over suggestion entries."""
+
+    def __init__(self, entries):
+        self.entries = entries
+        pairs = []
+        for entry_no, entry in enumerate(entries):
+            words = normalize_query(entry['title']).split(' ')
+            for i in range(len(words)):
+                pairs.append((' '.join(words[i:]), entry_no))
+        pairs.sort()
+        self.keys = [key for key, _ in pairs]
+        self.entry_nos = [entry_no for _, entry_no in pairs]
+
+    def lookup(self, prefix):
+        """Entry numbers whose label has a word starting with ``prefix``."""
+        start = bisect.bisect_left(self.keys, prefix)
+        found = []
+        for i in range(start, len(self.keys)):
+            if not self.keys[i].startswith(prefix):
+                break
+            found.append(self.entry_nos[i])
+        return found
+
+
+_state = {'index': SuggestIndex([]), 'version': None, 'checked_at': 0.0}
+_lock = threading.Lock()
+
+
+def build_entries():
+    """Load suggestion entries from the DB, ordered by popularity within each kind."""
+    from ..models import Category, PromoCode, Store
+
+    entries = []
+    for store in Store.objects.filter(is_active=True).order_by('-rating', 'name').values('name', 'slug'):
+        entries.append({'kind': 'stores', 'title': store['name'], 'slug': store['slug']})
+
+    for category in Category.objects.filter(is_active=True).order_by('name').values('name', 'slug'):
+        entries.append({'kind': 'categories', 'title': category['name'], 'slug': category['slug']})
+
+    promos = (
+        PromoCode.objects
+        .filter(is_active=True, expires_at__gt=timezone.now(), store__is_active=True)
+        .order_by('-views_count', '-created_at')
+        .values('id', 'title', 'expires_at', 'store__name', 'store__slug')[:PROMO_LIMIT]
+    )
+    for promo in promos:
+        entries.append({
+            'kind': 'promocodes',
+            'title': promo['title'],
+            'id': promo['id'],
+            'store_name': promo['store__name'],
+            'store_slug': promo['store__slug'],
+            'expires_at': promo['expires_at'].timestamp(),
+        })
+    return entries
+
+
+def get_version():
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(VERSION_CACHE_KEY, 1, None)
+        version = cache.get(VERSION_CACHE_KEY, 1)
+    return version
+
+
+def bump_version():
+    """Invalidate suggestion indexes in every worker."""
+    try:
+        cache.incr(VERSION_CACHE_KEY)
+    except ValueError:
+        cache.add(VERSION_CACHE_KEY, 1, None)
+    # Текущий процесс перестроит индекс при следующем запросе
+    _state['checked_at'] = 0.0
+
+
+def _load_index(version):
+    key = ENTRIES_CACHE_KEY.format(version=version)
+    entries = cache.get(key)
+    if entries is None:
+        entries = build_entries()
+        cache.set(key, entries, ENTRIES_TTL)
+        logger.info(f"Suggest index built from DB: {len(entries)} entries (v{version})")
+    return SuggestIndex(entries)
+
+
+def get_index():
+    """Current process-local index, refreshed when the shared version changes."""
+    now = time.monotonic()
+    if now - _state['checked_at'] < VERSION_CHECK_INTERVAL:
+        return _state['index']
+
+    with _lock:
+        if now - _state['checked_at'] < VERSION_CHECK_INTERVAL:
+            return _state['index']
+        try:
+            version = get_version()
+            if version != _state['version']:
+                _state['index'] = _load_index(version)
+                _state['version'] = version
+        except Exception as e:
+            # Redis недоступен - продолжаем отдавать старый индекс
+            logger.error(f"Suggest index refresh error: {str(e)}")
+        _state['checked_at'] = now
+    return _state['index']
+
+
+def suggest(value, limit=5):
+    """
+    Prefix suggestions grouped by kind.
+
+    Keyboard-layout and transliteration variants of the query are looked up
+    too, so "ghbdtn" suggests the same as "привет".
+
+    Returns:
+        dict: ``{'stores': [...], 'categories': [...], 'promocodes': [...]}``
+    """
+    result = {kind: [] for kind in KINDS}
+    variants = query_variants(value)
+    if not variants:
+        return result
+
+    index = get_index()
+    now = time.time()
+    seen = set()
+    for variant in variants:
+        for entry_no in sorted(set(index.lookup(variant))):
+            if entry_no in seen:
+                continue
+            seen.add(entry_no)
+            entry = index.entries[entry_no]
+            bucket = result[entry['kind']]
+            if len(bucket) >= limit:
+                continue
+            if entry.get('expires_at', now + 1) <= now:
+                continue
+            bucket.append({k: v for k, v in entry.items() if k not in ('kind', 'expires_at')})
+    return result
@@ -1,6 +1,26 @@
 from rest_framework import serializers
+from django.db import models
+from django.db.models import Count, Prefetch
 from django.utils import timezone
 from .models import Store, Category, PromoCode, Banner, StaticPage, Partner, ContactMessage, Showcase, ShowcaseItem
+from .renderers import is_normalized
+from .serializers_fast import CompiledListSerializer
+
+
+def active_promocode_counts(lookup):
+    """
+    Batch field for ``promocodes_count`` (as ``Store/Category.promocodes_count``):
+    active, not expired promo codes per object, one grouped query per list.
+    """
+    def counts(objects):
+        if not objects:
+            return {}
+        rows = PromoCode.objects.filter(
+            is_active=True, expires_at__gt=timezone.now(),
+            **{f'{lookup}__in': [obj.pk for obj in objects]}
+        ).values(lookup).annotate(n=Count('id')).order_by()
+        return {row[lookup]: row['n'] for row in rows}
+    return counts
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -13,6 +33,8 @@ class CategorySerializer(serializers.ModelSerializer):
             'is_active', 'created_at', 'promocodes_count'
         ]
         extra_kwargs = {}
+        list_serializer_class = CompiledListSerializer
+        batch_fields = {'promocodes_count': active_promocode_counts('categories')}
 
 
 class StoreSerializer(serializers.ModelSerializer):
@@ -24,6 +46,8 @@ class StoreSerializer(serializers.ModelSerializer):
             'id', 'name', 'slug', 'logo', 'rating', 'site_url',
             'description', 'is_active', 'promocodes_count', 'created_at'
         ]
+        list_serializer_class = CompiledListSerializer
+        batch_fields = {'promocodes_count': active_promocode_counts('store')}
 
 
 class StoreDetailSerializer(serializers.ModelSerializer):
@@ -37,6 +61,149 @@ class StoreDetailSerializer(serializers.ModelSerializer):
         ]
 
 
+class StoreCardSerializer(serializers.ModelSerializer):
+    """Магазин в карточке промокода (?view=card)"""
+
+    class Meta:
+        model = Store
+        fields = ['id', 'name', 'slug', 'logo', 'site_url']
+        list_serializer_class = CompiledListSerializer
+
+
+class CategoryCardSerializer(serializers.ModelSerializer):
+    """Категория в карточке промокода (?view=card)"""
+
+    class Meta:
+        model = Category
+        fields = ['id', 'name', 'slug']
+        list_serializer_class = CompiledListSerializer
+
+
+# ?view=card - поля карточки в сетке (PromoCard/HotPromoCard), без подробных текстов
+PROMO_CARD_FIELDS = [
+    'id', 'title', 'description', 'code', 'discount_value', 'discount_label',
+    'is_hot', 'is_recommended', 'expires_at', 'views', 'affiliate_url', 'store', 'categories',
+    'has_promocode', 'is_expired', 'days_until_expiry', 'discount_text', 'offer_type',
+    'offer_type_display', 'disclaimer',
+]
+
+# Колонки PromoCode, из которых строится поле ответа (для .only())
+PROMO_FIELD_COLUMNS = {
+    'views': ['views_count'],
+    'store': [],
+    'categories': [],
+    'has_promocode': ['code'],
+    'is_expired': ['expires_at'],
+    'days_until_expiry': ['expires_at'],
+    'discount_text': ['discount_label', 'discount_value'],
+    'valid_until': ['expires_at'],
+    'offer_type_display': ['offer_type'],
+}
+
+# Колонки сортировок и курсора (core.pagination) - загружаются всегда
+PROMO_ORDER_COLUMNS = [
+    'id', 'is_hot', 'is_recommended', 'has_badge', 'popularity_7d', 'trending_score',
+    'created_at', 'views_count', 'expires_at',
+]
+
+STORE_CARD_COLUMNS = ['id', 'name', 'slug', 'logo', 'site_url']
+CATEGORY_CARD_COLUMNS = ['id', 'name', 'slug']
+
+
+def promo_fieldset(request):
+    """
+    Requested PromoCode fields: ``?view=card`` or ``?fields=a,b``.
+
+    Returns:
+        tuple: (list of field names or None for all, is card view)
+    """
+    if request is None:
+        return None, False
+    params = request.query_params if hasattr(request, 'query_params') else request.GET
+    if params.get('view') == 'card':
+        return PROMO_CARD_FIELDS, True
+    fields = [name.strip() for name in params.get('fields', '').split(',') if name.strip()]
+    return (fields or None), False
+
+
+def apply_promo_fieldset(queryset, request, prefix=''):
+    """
+    Load only the columns behind the requested fields (``promo_fieldset``).
+
+    ``prefix`` - path to PromoCode in a related queryset (``'promocode__'``
+    for ShowcaseItem). The store join and the categories prefetch are
+    narrowed for the card view and dropped when not requested.
+    """
+    fields, card = promo_fieldset(request)
+    if fields is None:
+        return queryset
+
+    columns = set(PROMO_ORDER_COLUMNS)
+    for name in fields:
+        columns.update(PROMO_FIELD_COLUMNS.get(name, [name]))
+    columns &= {field.name for field in PromoCode._meta.concrete_fields}
+    if 'store' not in fields:
+        columns.add('store__id')
+    elif card:
+        columns.update(f'store__{column}' for column in STORE_CARD_COLUMNS)
+    else:
+        columns.add('store')
+    only = [f'{prefix}{column}' for column in columns]
+    if prefix:
+        # Собственные колонки связующей модели (сортировка, курсор)
+        only.extend(field.name for field in queryset.model._meta.concrete_fields if not field.is_relation)
+
+    lookup = f'{prefix}categories'
+    lookups = []
+    for item in queryset._prefetch_related_lookups:
+        path = item.prefetch_to if isinstance(item, Prefetch) else item
+        if path != lookup:
+            lookups.append(item)
+        elif 'categories' in fields:
+            if card:
+                base = getattr(item, 'queryset', None)
+                if base is None:
+                    base = Category.objects.all()
+                item = Prefetch(lookup, queryset=base.only(*CATEGORY_CARD_COLUMNS))
+            lookups.append(item)
+
+    return queryset.only(*only).prefetch_related(None).prefetch_related(*lookups)
+
+
+def included_of(data):
+    """``included`` block of ``PromoCodeSerializer(many=True).data`` in ?format=normalized, or None."""
+    return getattr(getattr(data, 'serializer', None), 'included', None)
+
+
+class PromoCodeListSerializer(CompiledListSerializer):
+    """
+    Promo code list. In ?format=normalized rows carry ``store_id`` /
+    ``category_ids`` and every store and category is serialized once into
+    ``self.included`` (``{'stores': {id: ...}, 'categories': {id: ...}}``).
+    """
+
+    def to_representation(self, data):
+        objects = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        sources = getattr(self.child, 'included_sources', None)
+        if sources is not None:
+            self.included = {
+                name: self.serialize_included(objects, source, serializer_class)
+                for name, (source, serializer_class) in sources.items()
+            }
+        return super().to_representation(objects)
+
+    def serialize_included(self, objects, source, serializer_class):
+        related = {}
+        for obj in objects:
+            value = getattr(obj, source)
+            if isinstance(value, models.manager.BaseManager):
+                related.update((item.pk, item) for item in value.all())
+            elif value is not None:
+                related[value.pk] = value
+        data = serializer_class(list(related.values()), many=True, context=self.context).data
+        return {str(item['id']): item for item in data}
+
+
 class PromoCodeSerializer(serializers.ModelSerializer):
     store = StoreSerializer(read_only=True)
     categories = CategorySerializer(many=True, read_only=True)
@@ -61,20 +228,55 @@ class PromoCodeSerializer(serializers.ModelSerializer):
         ]
         
         extra_kwargs = {}
-    
+        list_serializer_class = PromoCodeListSerializer
+
+    additional_fields = [
+        'offer_type', 'long_description', 'steps',
+        'fine_print', 'disclaimer', 'external_link'
+    ]
+    # Имена полей модели - вычисляются один раз, а не при каждом создании сериализатора
+    _model_fields = None
+
     def __init__(self, *args, **kwargs):
+        # fields=[...] - явный набор полей; иначе ?fields= / ?view=card из запроса в context
+        fields = kwargs.pop('fields', None)
         super().__init__(*args, **kwargs)
         
-        model_fields = [f.name for f in self.Meta.model._meta.get_fields()]
-        
-        additional_fields = [
-            'offer_type', 'long_description', 'steps', 
-            'fine_print', 'disclaimer', 'external_link'
-        ]
+        cls = type(self)
+        if cls._model_fields is None:
+            cls._model_fields = frozenset(f.name for f in self.Meta.model._meta.get_fields())
+        model_fields = cls._model_fields
         
-        for field_name in additional_fields:
+        for field_name in self.additional_fields:
             if field_name in model_fields and field_name not in self.fields:
                 self.fields[field_name] = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+        card = False
+        if fields is None:
+            fields, card = promo_fieldset(self.context.get('request'))
+        if card:
+            self.fields['store'] = StoreCardSerializer(read_only=True)
+            self.fields['categories'] = CategoryCardSerializer(many=True, read_only=True)
+        if fields is not None:
+            for field_name in list(self.fields):
+                if field_name not in fields:
+                    self.fields.pop(field_name)
+        if is_normalized(self.context.get('request')):
+            self.normalize_relations(card)
+
+    def normalize_relations(self, card):
+        """?format=normalized: store/categories -> store_id/category_ids, объекты - в included"""
+        self.included_sources = {}
+        if self.fields.pop('store', None) is not None:
+            self.fields['store_id'] = serializers.IntegerField(read_only=True)
+            self.included_sources['stores'] = ('store', StoreCardSerializer if card else StoreSerializer)
+        if self.fields.pop('categories', None) is not None:
+            self.fields['category_ids'] = serializers.PrimaryKeyRelatedField(
+                source='categories', many=True, read_only=True
+            )
+            self.included_sources['categories'] = (
+                'categories', CategoryCardSerializer if card else CategorySerializer
+            )
     
     def get_has_promocode(self, obj):
         return bool(getattr(obj, 'code', None) and str(getattr(obj, 'code', '')).strip())
@@ -132,9 +334,21 @@ class PromoCodeSerializer(serializers.ModelSerializer):
                 'cashback': 'Кэшбэк'
             }
             return type_mapping.get(offer_type, 'Промокод')
-        
+
         return 'Промокод'
 
+    # Варианты get_* для CompiledListSerializer: now - один на весь список
+
+    def compile_is_expired(self, now):
+        return lambda obj: bool(obj.expires_at) and obj.expires_at <= now
+
+    def compile_days_until_expiry(self, now):
+        def days_until_expiry(obj):
+            if not obj.expires_at:
+                return None
+            return max((obj.expires_at - now).days, 0)
+        return days_until_expiry
+
 
 class BannerSerializer(serializers.ModelSerializer):
     link = serializers.URLField(source='cta_url', read_only=True)
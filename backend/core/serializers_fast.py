@@ -0,0 +1,210 @@
+"""
+Compiled read-only serialization of lists.
+
+DRF serializes a list object by object and field by field: ``get_attribute``,
+the ``SkipField``/``None`` checks and ``to_representation`` of every bound
+field, and a nested serializer for every related row. For the promo code
+lists (up to 100 cards, each with a store and categories) that is most of
+the response time.
+
+``CompiledListSerializer`` (set as ``Meta.list_serializer_class``) turns the
+child's bound fields into plain getter functions once per list and then
+builds the rows with them:
+
+* simple fields (char/int/bool/read-only, ISO datetimes) are read and
+  converted without the DRF field machinery; anything else goes through the
+  bound field, so the output is the same as ``ModelSerializer`` produces;
+* ``SerializerMethodField`` uses ``compile_<name>(now)`` of the serializer
+  when it exists - derived values (``is_expired``, ``days_until_expiry``)
+  are computed against one ``now`` per request;
+* nested serializers are compiled too, and a related object (store,
+  category) is serialized once per list, not once per row;
+* ``Meta.batch_fields`` - ``{name: function(objects) -> {pk: value}}`` -
+  replaces per-row queries (``promocodes_count``) with one query per list;
+* every serialized model object is recorded as a cache tag
+  (``add_cache_tags``), so a cached response is invalidated when it changes.
+
+``context={'compiled': False}`` switches back to the plain DRF path.
+"""
+from django.db import models
+from django.utils import timezone
+from rest_framework import fields as drf_fields
+from rest_framework import serializers
+from rest_framework.relations import PKOnlyObject
+from rest_framework.settings import api_settings
+
+from .utils.cache import add_cache_tags, entity_tag
+
+# Поля, значение которых приводится без обращения к полю DRF
+_CONVERTERS = {
+    drf_fields.CharField: str,
+    drf_fields.SlugField: str,
+    drf_fields.URLField: str,
+    drf_fields.EmailField: str,
+    drf_fields.IntegerField: int,
+    drf_fields.BooleanField: bool,
+    drf_fields.ReadOnlyField: None,
+}
+
+
+def _iso_datetime(field):
+    """DateTimeField.to_representation for the default ISO 8601 format, or None."""
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if output_format is None or output_format.lower() != drf_fields.ISO_8601:
+        return None
+    tz = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if tz is None:
+        return None
+
+    def convert(value):
+        if isinstance(value, str):
+            return value
+        if timezone.is_aware(value):
+            value = value.astimezone(tz)
+        else:
+            value = timezone.make_aware(value, tz)
+        value = value.isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return convert
+
+
+def _compile_plain(field):
+    """Getter of a field read straight from a model attribute, or None."""
+    if len(field.source_attrs) != 1 or field.default is not drf_fields.empty:
+        return None
+    attr = field.source_attrs[0]
+    field_type = type(field)
+    if field_type in _CONVERTERS:
+        convert = _CONVERTERS[field_type]
+    elif field_type is drf_fields.DateTimeField:
+        convert = _iso_datetime(field)
+        if convert is None:
+            return None
+        # Пустое значение DRF отдаёт как None
+        return lambda obj: convert(value) if (value := getattr(obj, attr)) else None
+    else:
+        return None
+
+    if convert is None:
+        return lambda obj: getattr(obj, attr)
+    return lambda obj: None if (value := getattr(obj, attr)) is None else convert(value)
+
+
+def _compile_field(field):
+    """Generic getter: the bound field does the work (as Serializer.to_representation)."""
+    def getter(obj):
+        attribute = field.get_attribute(obj)
+        check_for_none = attribute.pk if isinstance(attribute, PKOnlyObject) else attribute
+        if check_for_none is None:
+            return None
+        return field.to_representation(attribute)
+    return getter
+
+
+def _related(obj, source_attrs):
+    for attr in source_attrs:
+        if obj is None:
+            return None
+        obj = getattr(obj, attr)
+    return obj
+
+
+class CompiledSerializer:
+    """Getter functions of a serializer's readable fields, built once per list."""
+
+    def __init__(self, serializer, now):
+        self.getters = []
+        self.nested = []
+        self.batches = []
+        meta = getattr(serializer, 'Meta', None)
+        self.model = getattr(meta, 'model', None)
+        batch_fields = getattr(meta, 'batch_fields', {})
+
+        for field in serializer._readable_fields:
+            name = field.field_name
+            if name in batch_fields:
+                values = {}
+                self.batches.append((batch_fields[name], values))
+                getter = (lambda values: lambda obj: values.get(obj.pk, 0))(values)
+            elif isinstance(field, serializers.ListSerializer) and isinstance(field.child, serializers.Serializer):
+                getter = self._compile_nested(field.source_attrs, field.child, now, many=True)
+            elif isinstance(field, serializers.Serializer):
+                getter = self._compile_nested(field.source_attrs, field, now, many=False)
+            elif isinstance(field, serializers.SerializerMethodField):
+                compile_method = getattr(field.parent, f'compile_{name}', None)
+                getter = compile_method(now) if compile_method else _compile_field(field)
+            else:
+                getter = _compile_plain(field) or _compile_field(field)
+            self.getters.append((name, getter))
+
+    def _compile_nested(self, source_attrs, serializer, now, many):
+        compiled = CompiledSerializer(serializer, now)
+        self.nested.append((source_attrs, compiled, many))
+        return compiled.related_getter(source_attrs, many)
+
+    def related_getter(self, source_attrs, many):
+        """Nested value getter; every related object is serialized once."""
+        done = {}
+
+        def one(related):
+            key = related.pk
+            if key not in done:
+                done[key] = self(related)
+            return done[key]
+
+        if many:
+            def getter(obj):
+                related = _related(obj, source_attrs)
+                if related is None:
+                    return None
+                if isinstance(related, models.manager.BaseManager):
+                    related = related.all()
+                return [one(item) for item in related]
+        else:
+            def getter(obj):
+                related = _related(obj, source_attrs)
+                return None if related is None else one(related)
+        return getter
+
+    def prepare(self, objects):
+        """Run batch fields for ``objects`` and their related objects, record cache tags."""
+        if self.model is not None:
+            add_cache_tags(entity_tag(obj) for obj in objects)
+        for function, values in self.batches:
+            values.update(function(objects))
+        for source_attrs, compiled, many in self.nested:
+            related = {}
+            for obj in objects:
+                value = _related(obj, source_attrs)
+                if value is None:
+                    continue
+                if many:
+                    items = value.all() if isinstance(value, models.manager.BaseManager) else value
+                    related.update((item.pk, item) for item in items)
+                else:
+                    related[value.pk] = value
+            compiled.prepare(list(related.values()))
+
+    def __call__(self, obj):
+        ret = {}
+        for name, getter in self.getters:
+            try:
+                ret[name] = getter(obj)
+            except drf_fields.SkipField:
+                pass
+        return ret
+
+
+class CompiledListSerializer(serializers.ListSerializer):
+    """ListSerializer that serializes rows with ``CompiledSerializer``."""
+
+    def to_representation(self, data):
+        if not self.context.get('compiled', True):
+            return super().to_representation(data)
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        objects = list(iterable)
+        compiled = CompiledSerializer(self.child, timezone.now())
+        compiled.prepare(objects)
+        return [compiled(obj) for obj in objects]
@@ -0,0 +1,208 @@
+"""
+Сигналы моделей core: поддержка производных данных в актуальном состоянии
+"""
+import logging
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Banner, Category, Partner, PromoCode, Showcase, ShowcaseItem, Store
+from .pagination import bump_count_version
+from .search import refresh_search_vectors
+from .search.suggest import bump_version as bump_suggest_version
+from .utils.cache import entity_tag, invalidate_tags, list_tag
+
+logger = logging.getLogger(__name__)
+
+
+def _refresh_search_on_commit(queryset):
+    """Пересчитать поисковые документы после коммита транзакции"""
+    def _refresh():
+        try:
+            refresh_search_vectors(queryset)
+        except Exception as e:
+            logger.error(f"Search vector refresh error: {str(e)}")
+
+    transaction.on_commit(_refresh)
+
+
+# Поля, от которых зависит индекс подсказок (search/suggest)
+SUGGEST_FIELDS = {
+    PromoCode: {'title', 'is_active', 'expires_at', 'store'},
+    Store: {'name', 'slug', 'is_active', 'rating'},
+    Category: {'name', 'slug', 'is_active'},
+}
+
+
+def _bump_suggest_on_commit():
+    def _bump():
+        try:
+            bump_suggest_version()
+        except Exception as e:
+            logger.error(f"Suggest index invalidation error: {str(e)}")
+
+    transaction.on_commit(_bump)
+
+
+@receiver(post_save, sender=PromoCode)
+@receiver(post_save, sender=Store)
+@receiver(post_save, sender=Category)
+def suggest_source_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    # Например, increment_views() не меняет подсказки
+    if update_fields and not set(update_fields) & SUGGEST_FIELDS[sender]:
+        return
+    _bump_suggest_on_commit()
+
+
+@receiver(post_delete, sender=PromoCode)
+@receiver(post_delete, sender=Store)
+@receiver(post_delete, sender=Category)
+def suggest_source_deleted(sender, instance, **kwargs):
+    _bump_suggest_on_commit()
+
+
+@receiver(post_save, sender=PromoCode)
+def promocode_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    # Счётчики просмотров и т.п. не влияют на поисковый документ
+    if update_fields and not set(update_fields) & {'title', 'description', 'code', 'discount_label', 'store'}:
+        return
+    _refresh_search_on_commit(PromoCode.objects.filter(pk=instance.pk))
+
+
+@receiver(m2m_changed, sender=PromoCode.categories.through)
+def promocode_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # instance - категория; при post_clear pk_set пустой, берём все промокоды
+        if pk_set:
+            queryset = PromoCode.objects.filter(pk__in=pk_set)
+        else:
+            queryset = PromoCode.objects.all()
+    else:
+        queryset = PromoCode.objects.filter(pk=instance.pk)
+    _refresh_search_on_commit(queryset)
+
+
+# Поля магазина, входящие в поисковый документ промокодов (search.engine._document_sql)
+STORE_SEARCH_FIELDS = {'name'}
+
+
+@receiver(pre_save, sender=Store)
+def store_pre_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Сохранение рейтинга/счётчиков не должно пересчитывать документы всех промокодов магазина
+    instance._search_fields_changed = False
+    if raw or instance.pk is None:
+        return
+    if update_fields and not set(update_fields) & STORE_SEARCH_FIELDS:
+        return
+    instance._search_fields_changed = (
+        Store.objects.filter(pk=instance.pk).exclude(name=instance.name).exists()
+    )
+
+
+@receiver(post_save, sender=Store)
+def store_saved(sender, instance, created=False, raw=False, **kwargs):
+    if raw or created or not getattr(instance, '_search_fields_changed', False):
+        return
+    _refresh_search_on_commit(PromoCode.objects.filter(store_id=instance.pk))
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created=False, raw=False, **kwargs):
+    if raw or created:
+        return
+    _refresh_search_on_commit(PromoCode.objects.filter(categories=instance))
+
+
+# Поля, не влияющие на состав списков промокодов (кэш количества в пагинации)
+COUNT_NEUTRAL_FIELDS = {'views_count', 'popularity_7d', 'trending_score', 'search_vector', 'updated_at'}
+
+
+def _bump_counts_on_commit():
+    def _bump():
+        try:
+            bump_count_version()
+        except Exception as e:
+            logger.error(f"List count invalidation error: {str(e)}")
+
+    transaction.on_commit(_bump)
+
+
+@receiver(post_save, sender=PromoCode)
+@receiver(post_save, sender=ShowcaseItem)
+def list_source_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields and set(update_fields) <= COUNT_NEUTRAL_FIELDS:
+        return
+    _bump_counts_on_commit()
+
+
+@receiver(post_delete, sender=PromoCode)
+@receiver(post_delete, sender=ShowcaseItem)
+def list_source_deleted(sender, instance, **kwargs):
+    _bump_counts_on_commit()
+
+
+@receiver(m2m_changed, sender=PromoCode.categories.through)
+def list_categories_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        _bump_counts_on_commit()
+
+
+def _invalidate_tags_on_commit(*tags):
+    def _invalidate():
+        try:
+            invalidate_tags(*tags)
+        except Exception as e:
+            logger.error(f"Response cache invalidation error: {str(e)}")
+
+    transaction.on_commit(_invalidate)
+
+
+def _cache_tags(instance):
+    """Теги кэша ответов API, которые устаревают при изменении объекта"""
+    if isinstance(instance, ShowcaseItem):
+        # Состав витрины и promos_count в списке витрин
+        return [f'showcase:{instance.showcase_id}', list_tag(Showcase)]
+    return [entity_tag(instance), list_tag(type(instance))]
+
+
+@receiver(post_save, sender=PromoCode)
+@receiver(post_save, sender=Store)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Showcase)
+@receiver(post_save, sender=ShowcaseItem)
+@receiver(post_save, sender=Banner)
+@receiver(post_save, sender=Partner)
+def cached_source_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    # Просмотры и рейтинги не сбрасывают кэш (popular/trending - через ranking_tag)
+    if update_fields and set(update_fields) <= COUNT_NEUTRAL_FIELDS:
+        return
+    _invalidate_tags_on_commit(*_cache_tags(instance))
+
+
+@receiver(post_delete, sender=PromoCode)
+@receiver(post_delete, sender=Store)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Showcase)
+@receiver(post_delete, sender=ShowcaseItem)
+@receiver(post_delete, sender=Banner)
+@receiver(post_delete, sender=Partner)
+def cached_source_deleted(sender, instance, **kwargs):
+    _invalidate_tags_on_commit(*_cache_tags(instance))
+
+
+@receiver(m2m_changed, sender=PromoCode.categories.through)
+def cached_categories_changed(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        # instance - промокод или категория (reverse)
+        _invalidate_tags_on_commit(entity_tag(instance), list_tag(PromoCode), list_tag(Category))
@@ -4,8 +4,7 @@ Celery задачи для BoltPromo
 from celery import shared_task
 from django.core.cache import cache
 from django.utils import timezone
-from django.db.models import Count, Q
-from datetime import timedelta, date
+from datetime import timedelta
 import logging
 
 logger = logging.getLogger(__name__)
@@ -17,20 +16,34 @@ def flush_cache(self, scope='all'):
     Задача очистки кэша
     scope: 'all', 'pages', 'api', 'showcases', 'banners'
     """
+    from .cache_warming import schedule_warm
+    from .models import Banner, Showcase
+    from .utils import local_cache
+    from .utils.cache import API_TAG, invalidate_tags, list_tag
+
     try:
         scope_patterns = {
             'all': '*',
             'pages': 'page:*',
-            'api': 'api:*',
-            'showcases': 'showcase:*',
-            'banners': 'banner:*',
+        }
+        # Ответы API (cache_api_response) сбрасываются тегом, а не по шаблону ключей
+        scope_tags = {
+            'api': API_TAG,
+            'showcases': list_tag(Showcase),
+            'banners': list_tag(Banner),
         }
 
         pattern = scope_patterns.get(scope, '*')
 
         if scope == 'all':
             cache.clear()
+            # Копии ответов в памяти веб-воркеров (L1)
+            local_cache.invalidate(clear=True)
+            schedule_warm(landing=True)
             logger.info(f"Cache flush: all cleared")
+        elif scope in scope_tags:
+            invalidate_tags(scope_tags[scope])
+            logger.info(f"Cache flush: {scope} invalidated by tag {scope_tags[scope]}")
         else:
             try:
                 cache.delete_pattern(pattern)
@@ -48,58 +61,83 @@ def flush_cache(self, scope='all'):
 @shared_task(bind=True, max_retries=3, soft_time_limit=120, time_limit=180)
 def aggregate_events_hourly(self):
     """
-    Агрегация событий в DailyAgg (запускать каждый час)
+    Агрегация событий в HourlyAgg/DailyAgg/MonthlyAgg (запускать каждый час)
+    Инкрементально: только события новее водяного знака, повторный запуск ничего не удвоит
     """
-    from .models import Event, DailyAgg
+    from .analytics.aggregation import aggregate_new_events
 
     try:
-        # Берём события за последний час + немного с запасом
-        cutoff_time = timezone.now() - timedelta(hours=2)
-        events = Event.objects.filter(created_at__gte=cutoff_time)
-
-        aggregated = 0
-        today = date.today()
-
-        # Группируем по типу, промо, магазину, витрине
-        groups = events.values(
-            'event_type', 'promo_id', 'store_id', 'showcase_id'
-        ).annotate(
-            total=Count('id'),
-            unique=Count('id', filter=Q(is_unique=True))
-        )
+        stats = aggregate_new_events()
+        return {'status': 'success', 'aggregated': stats['groups'], **stats}
 
-        from django.db.models import F
-
-        for group in groups:
-            # Используем get_or_create для определения существования записи
-            obj, created = DailyAgg.objects.get_or_create(
-                date=today,
-                event_type=group['event_type'],
-                promo_id=group['promo_id'],
-                store_id=group['store_id'],
-                showcase_id=group['showcase_id'],
-                defaults={
-                    'count': group['total'],
-                    'unique_count': group['unique']
-                }
-            )
+    except Exception as e:
+        logger.error(f"Event aggregation error: {str(e)}")
+        # Retry с экспоненциальной задержкой
+        raise self.retry(exc=e, countdown=60 * (2 ** self.request.retries))
 
-            # Если запись уже существовала, обновляем атомарно через F()
-            if not created:
-                DailyAgg.objects.filter(pk=obj.pk).update(
-                    count=F('count') + group['total'],
-                    unique_count=F('unique_count') + group['unique']
-                )
 
-            aggregated += 1
+@shared_task(bind=True, max_retries=1, soft_time_limit=600, time_limit=900)
+def rebuild_daily_aggregates(self, days=7):
+    """
+    Полный пересчёт агрегатов за последние N дней из сырых событий
+    Запускается вручную (админка, manage.py aggregate_events --rebuild)
+    """
+    from .analytics.aggregation import rebuild_daily_aggregates as rebuild
 
-        logger.info(f"Events aggregated: {aggregated} groups processed")
-        return {'status': 'success', 'aggregated': aggregated}
+    try:
+        stats = rebuild(days)
+        return {'status': 'success', **stats}
 
     except Exception as e:
-        logger.error(f"Event aggregation error: {str(e)}")
-        # Retry с экспоненциальной задержкой
-        raise self.retry(exc=e, countdown=60 * (2 ** self.request.retries))
+        logger.error(f"DailyAgg rebuild error: {str(e)}")
+        return {'status': 'error', 'message': str(e)}
+
+
+@shared_task(bind=True, max_retries=0, soft_time_limit=50, time_limit=60)
+def drain_event_stream(self, max_batches=50):
+    """
+    Перенос событий из Redis Stream в Event (ANALYTICS_INGEST_MODE=buffered)
+    Запускать каждые 10 секунд; в режиме direct ничего не делает
+    """
+    from .analytics import stream
+
+    if not stream.buffered_mode():
+        return {'status': 'skipped', 'reason': 'direct ingest mode'}
+
+    try:
+        stats = stream.drain(max_batches=max_batches)
+        if stats['events']:
+            logger.info(f"Event stream drained: {stats['events']} events from {stats['entries']} entries")
+        if stats['dead']:
+            logger.warning(f"Event stream: {stats['dead']} events rejected by the database, see dead-letter stream")
+        return {'status': 'success', **stats}
+
+    except Exception as e:
+        # Неподтверждённые записи останутся в pending и будут забраны повторно
+        logger.error(f"Event stream drain error: {str(e)}")
+        return {'status': 'error', 'message': str(e)}
+
+
+@shared_task(bind=True, max_retries=0, soft_time_limit=240, time_limit=280)
+def replay_event_spool(self):
+    """
+    Загрузка событий из локального spool в Event после сбоя Postgres/Redis
+    Запускать каждые 5 минут
+    """
+    from .analytics import spool
+
+    try:
+        stats = spool.replay()
+        if stats['files'] or stats['failed']:
+            logger.info(
+                f"Event spool replay: {stats['events']} events from {stats['files']} files, "
+                f"{stats['rejected']} rejected, {stats['failed']} failed"
+            )
+        return {'status': 'success', **stats}
+
+    except Exception as e:
+        logger.error(f"Event spool replay error: {str(e)}")
+        return {'status': 'error', 'message': str(e)}
 
 
 @shared_task(bind=True, max_retries=2, soft_time_limit=300, time_limit=600)
@@ -122,6 +160,73 @@ def cleanup_old_events(self, days=30):
         return {'status': 'error', 'message': str(e)}
 
 
+@shared_task(bind=True, max_retries=1, soft_time_limit=300, time_limit=600)
+def compact_rollups(self):
+    """
+    Удаление часовых агрегатов старше ANALYTICS_HOURLY_RETENTION_DAYS
+    Запускать раз в день; история остаётся в DailyAgg/MonthlyAgg
+    """
+    from .analytics.aggregation import compact_rollups as compact
+
+    try:
+        stats = compact()
+        return {'status': 'success', **stats}
+
+    except Exception as e:
+        logger.error(f"Rollup compaction error: {str(e)}")
+        return {'status': 'error', 'message': str(e)}
+
+
+@shared_task(bind=True, max_retries=1, soft_time_limit=600, time_limit=900)
+def reconcile_leaderboards(self, days=None):
+    """
+    Сверка живых топов в Redis с роллапами за прошедшие дни
+    Запускать раз в день (ZINCRBY при приёме событий мог разойтись с Event)
+    """
+    from .analytics import leaderboard
+
+    try:
+        stats = leaderboard.reconcile(days)
+        return {'status': 'success', **stats}
+
+    except Exception as e:
+        logger.error(f"Leaderboard reconcile error: {str(e)}")
+        return {'status': 'error', 'message': str(e)}
+
+
+@shared_task(bind=True, max_retries=3, soft_time_limit=120, time_limit=180)
+def update_trending(self):
+    """
+    Затухание trending_score промокодов и магазинов и учёт новых событий
+    Запускать каждые 15 минут; инкрементально, по своему водяному знаку
+    """
+    from .analytics.trending import update_trending_scores
+
+    try:
+        stats = update_trending_scores()
+        return {'status': 'success', **stats}
+
+    except Exception as e:
+        logger.error(f"Trending update error: {str(e)}")
+        raise self.retry(exc=e, countdown=60 * (2 ** self.request.retries))
+
+
+@shared_task(bind=True, max_retries=1, soft_time_limit=540, time_limit=600)
+def warm_cache(self, landing=True, top=None):
+    """
+    Прогрев кэша ответов API: частые запросы из выборки и (landing) все списки
+    Ставится после сброса тегов списков (invalidate_tags) и полной очистки кэша
+    """
+    from .cache_warming import warm
+
+    try:
+        stats = warm(top=top, landing=landing)
+        return {'status': 'success', **stats}
+    except Exception as e:
+        logger.error(f"Cache warm error: {str(e)}")
+        return {'status': 'error', 'message': str(e)}
+
+
 @shared_task(bind=True, max_retries=2, soft_time_limit=60, time_limit=120)
 def regenerate_sitemap(self):
     """
@@ -199,40 +304,6 @@ def regenerate_sitemap(self):
         return {'status': 'error', 'message': str(e)}
 
 
-@shared_task(bind=True, max_retries=2, soft_time_limit=120, time_limit=180)
-def cleanup_redis_dedup_keys(self):
-    """
-    Очистка старых Redis ключей дедупликации
-    Запускать каждые 6 часов
-    """
-    try:
-        import redis
-        from django.conf import settings
-
-        # Предполагаем что Redis используется для кэша
-        r = redis.from_url(settings.CACHES['default']['LOCATION'])
-
-        # Ключи дедупа имеют TTL 30 минут, Redis сам их удалит
-        # Но можем принудительно почистить устаревшие
-
-        pattern = 'click:*'
-        keys = r.keys(pattern)
-
-        deleted = 0
-        for key in keys:
-            ttl = r.ttl(key)
-            if ttl < 0:  # Ключ без TTL или истёкший
-                r.delete(key)
-                deleted += 1
-
-        logger.info(f"Redis dedup cleanup: {deleted} keys deleted")
-        return {'status': 'success', 'deleted': deleted}
-
-    except Exception as e:
-        logger.error(f"Redis cleanup error: {str(e)}")
-        return {'status': 'error', 'message': str(e)}
-
-
 @shared_task(bind=True, max_retries=1, soft_time_limit=300, time_limit=600)
 def generate_site_assets(self, asset_id):
     """
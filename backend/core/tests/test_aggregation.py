@@ -0,0 +1,287 @@
+"""
+Unit tests для инкрементальной агрегации событий (core.analytics.aggregation)
+
+Проверяем:
+1. Группировку по собственной дате события
+2. Идемпотентность повторного запуска (водяной знак)
+3. Отсутствие дублей строк с NULL в FK
+4. Полный пересчёт за N дней
+5. Часовые/месячные роллапы и планировщик запросов к ним
+"""
+
+from datetime import date, timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core.analytics.aggregation import (
+    DAILY, HOURLY, MONTHLY, aggregate_new_events, compact_rollups, local_midnight, rebuild_daily_aggregates,
+)
+from core.analytics.planner import plan, range_for_days, rollup_totals
+from core.models import AggregationWatermark, DailyAgg, Event, HourlyAgg, MonthlyAgg, PromoCode, Store
+
+
+class AggregationTestCase(TestCase):
+    """Тестирование Event -> DailyAgg"""
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.today = timezone.localdate()
+        self.store = Store.objects.create(name='Technopark', slug='technopark', site_url='https://technopark.ru')
+        self.promo = PromoCode.objects.create(
+            title='Phone sale', description='d', store=self.store,
+            expires_at=self.now + timedelta(days=30),
+        )
+
+    def _events(self, n, days_ago=0, **kwargs):
+        kwargs.setdefault('promo', self.promo)
+        Event.objects.bulk_create([
+            Event(event_type='promo_copy', created_at=self.now - timedelta(days=days_ago), **kwargs)
+            for _ in range(n)
+        ])
+
+    def _count(self, days_ago=0, **kwargs):
+        kwargs.setdefault('promo', self.promo)
+        row = DailyAgg.objects.get(date=self.today - timedelta(days=days_ago), event_type='promo_copy', **kwargs)
+        return row.count, row.unique_count
+
+    @mock.patch('core.analytics.uniques.get_redis_client', return_value=None)
+    def test_groups_by_event_date(self, _):
+        """Без Redis unique_count - сумма is_unique"""
+        self._events(3)
+        self._events(2, days_ago=1, is_unique=True)
+
+        stats = aggregate_new_events()
+
+        self.assertEqual(stats['groups'], 2)
+        self.assertEqual(self._count(), (3, 0))
+        self.assertEqual(self._count(days_ago=1), (2, 2))
+
+    def test_rerun_is_idempotent(self):
+        self._events(3)
+        aggregate_new_events()
+        aggregate_new_events()
+
+        self.assertEqual(self._count(), (3, 0))
+        self.assertEqual(
+            AggregationWatermark.objects.get(name='daily').last_event_id,
+            Event.objects.order_by('-id').first().id
+        )
+
+    def test_only_new_events_added(self):
+        self._events(3)
+        aggregate_new_events()
+        self._events(4)
+
+        stats = aggregate_new_events()
+
+        self.assertEqual(stats['groups'], 1)
+        self.assertEqual(self._count(), (7, 0))
+
+    def test_null_targets_do_not_duplicate_rows(self):
+        """Строки с NULL в promo/store/showcase обновляются, а не дублируются"""
+        self._events(1, promo=None)
+        aggregate_new_events()
+        self._events(1, promo=None)
+        aggregate_new_events()
+
+        self.assertEqual(DailyAgg.objects.count(), 1)
+        self.assertEqual(self._count(promo=None), (2, 0))
+
+    def test_rebuild(self):
+        self._events(3)
+        self._events(2, days_ago=10)
+        aggregate_new_events()
+        DailyAgg.objects.update(count=100)
+
+        stats = rebuild_daily_aggregates(days=5)
+
+        self.assertEqual(stats['groups'], 1)
+        self.assertEqual(self._count(), (3, 0))
+        # Дни вне окна пересчёта не трогаются
+        self.assertEqual(self._count(days_ago=10), (100, 0))
+
+    def test_hourly_and_monthly_rollups(self):
+        self._events(3)
+        self._events(2, days_ago=40)
+        aggregate_new_events()
+
+        hour = timezone.localtime(self.now).replace(minute=0, second=0, microsecond=0)
+        self.assertEqual(HourlyAgg.objects.get(hour=hour).count, 3)
+        month = self.today.replace(day=1)
+        self.assertEqual(
+            MonthlyAgg.objects.filter(month=month).aggregate(total=Sum('count'))['total'],
+            DailyAgg.objects.filter(date__gte=month).aggregate(total=Sum('count'))['total'],
+        )
+        self.assertEqual(MonthlyAgg.objects.aggregate(total=Sum('count'))['total'], 5)
+
+    def test_rebuild_keeps_months_consistent(self):
+        self._events(3)
+        self._events(2, days_ago=3)
+        aggregate_new_events()
+
+        rebuild_daily_aggregates(days=1)
+
+        self.assertEqual(MonthlyAgg.objects.aggregate(total=Sum('count'))['total'], 5)
+        self.assertEqual(HourlyAgg.objects.aggregate(total=Sum('count'))['total'], 5)
+
+    @override_settings(ANALYTICS_HOURLY_RETENTION_DAYS=5)
+    def test_compact_drops_old_hours(self):
+        self._events(3)
+        self._events(2, days_ago=10)
+        aggregate_new_events()
+
+        stats = compact_rollups()
+
+        self.assertEqual(stats['deleted'], 1)
+        self.assertEqual(HourlyAgg.objects.aggregate(total=Sum('count'))['total'], 3)
+        self.assertEqual(self._count(days_ago=10), (2, 0))
+
+
+class PlannerTestCase(TestCase):
+    """Тестирование выбора разрешения и хвоста сырых событий (core.analytics.planner)"""
+
+    def setUp(self):
+        self.store = Store.objects.create(name='Technopark', slug='technopark', site_url='https://technopark.ru')
+        self.promo = PromoCode.objects.create(
+            title='Phone sale', description='d', store=self.store,
+            expires_at=timezone.now() + timedelta(days=30),
+        )
+
+    def test_plan_uses_coarsest_resolution(self):
+        start = local_midnight(date(2026, 1, 20)) + timedelta(hours=5)
+        end = local_midnight(date(2026, 4, 3)) + timedelta(hours=2, minutes=30)
+
+        with override_settings(ANALYTICS_HOURLY_RETENTION_DAYS=100000):
+            segments = plan(start, end)
+
+        self.assertEqual(segments, [
+            (HOURLY, start, local_midnight(date(2026, 1, 21))),
+            (HOURLY, local_midnight(date(2026, 4, 3)), end + timedelta(minutes=30)),
+            (MONTHLY, date(2026, 2, 1), date(2026, 4, 1)),
+            (DAILY, date(2026, 1, 21), date(2026, 2, 1)),
+            (DAILY, date(2026, 4, 1), date(2026, 4, 3)),
+        ])
+
+    def test_plan_widens_expired_hours_to_days(self):
+        start = local_midnight(date(2026, 1, 20)) + timedelta(hours=5)
+        end = local_midnight(date(2026, 1, 25))
+
+        with override_settings(ANALYTICS_HOURLY_RETENTION_DAYS=0):
+            segments = plan(start, end)
+
+        self.assertEqual(segments, [(DAILY, date(2026, 1, 20), date(2026, 1, 25))])
+
+    def test_totals_combine_rollups_and_tail(self):
+        now = timezone.now()
+        Event.objects.bulk_create([
+            Event(event_type='promo_copy', promo=self.promo, created_at=now - timedelta(days=days_ago))
+            for days_ago in (0, 0, 3, 45, 90)
+        ])
+        aggregate_new_events()
+        # Ещё не агрегированные события берутся из Event
+        Event.objects.create(event_type='promo_copy', promo=self.promo, created_at=now)
+
+        start, end = range_for_days(60)
+        totals = rollup_totals(start, end, ('promo_id',), event_type='promo_copy')
+
+        self.assertEqual(totals, [{'promo_id': self.promo.id, 'count': 5, 'unique_count': 0}])
+
+    @override_settings(ANALYTICS_LEADERBOARD_DAYS=0)  # без живых топов Redis
+    def test_stats_endpoints_served_from_rollups(self):
+        now = timezone.now()
+        Event.objects.bulk_create([
+            Event(event_type='promo_copy', promo=self.promo, store=self.store, created_at=now - timedelta(days=1)),
+            Event(event_type='promo_open', promo=self.promo, store=self.store, created_at=now),
+        ])
+        aggregate_new_events()
+        Event.objects.create(event_type='promo_copy', promo=self.promo, store=self.store, created_at=now)
+        cache.clear()
+
+        promos = self.client.get('/api/v1/stats/top-promos/?range=7d').json()
+        stores = self.client.get('/api/v1/stats/top-stores/?range=7d').json()
+
+        self.assertEqual(promos['results'], [{'promo_id': self.promo.id, 'title': 'Phone sale', 'clicks': 3, 'unique': 0}])
+        self.assertEqual(stores['results'], [{'store_id': self.store.id, 'name': 'Technopark', 'clicks': 3, 'unique': 0}])
+
+
+class StatsSeriesTestCase(TestCase):
+    """Тестирование from/to/granularity в stats API (временные ряды из роллапов)"""
+
+    def setUp(self):
+        cache.clear()
+        self.today = timezone.localdate()
+        self.store = Store.objects.create(name='Technopark', slug='technopark', site_url='https://technopark.ru')
+        self.promo = PromoCode.objects.create(
+            title='Phone sale', description='d', store=self.store,
+            expires_at=timezone.now() + timedelta(days=30),
+        )
+        noon = local_midnight(self.today) + timedelta(hours=12)
+        Event.objects.bulk_create([
+            Event(event_type='promo_copy', promo=self.promo, store=self.store, created_at=noon - timedelta(days=days_ago))
+            for days_ago in (1, 1, 2)
+        ])
+        aggregate_new_events()
+        # Хвост выше водяного знака
+        Event.objects.create(event_type='promo_open', promo=self.promo, store=self.store, created_at=noon - timedelta(days=1))
+
+    def _get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_daily_series(self):
+        first = self.today - timedelta(days=3)
+        data = self._get(f'/api/v1/stats/top-promos/?from={first}&to={self.today}&granularity=day')
+
+        self.assertEqual(data['buckets'], [(first + timedelta(days=i)).isoformat() for i in range(4)])
+        self.assertEqual(data['results'], [{
+            'promo_id': self.promo.id, 'title': 'Phone sale', 'clicks': 4, 'series': [0, 1, 3, 0],
+        }])
+
+    def test_weekly_series_aligned_to_monday(self):
+        data = self._get(f'/api/v1/stats/top-stores/?from={self.today - timedelta(days=20)}&granularity=week')
+
+        monday = date.fromisoformat(data['buckets'][0])
+        self.assertEqual(monday.weekday(), 0)
+        self.assertEqual(data['results'][0]['clicks'], 4)
+        self.assertEqual(sum(data['results'][0]['series']), 4)
+
+    def test_hourly_series(self):
+        day = self.today - timedelta(days=1)
+        data = self._get(f'/api/v1/stats/types-share/?from={day}&to={day}&granularity=hour')
+
+        self.assertEqual(len(data['buckets']), 24)
+        self.assertEqual(data['results'][0]['series'][12], 3)
+
+    def test_series_is_one_query(self):
+        from core.views_analytics import _top_promos_series
+        from core.analytics.planner import DAY, bucket_starts, normalize_range
+
+        start, end = normalize_range(local_midnight(self.today - timedelta(days=90)), timezone.now(), DAY)
+        with CaptureQueriesContext(connection) as queries:
+            _top_promos_series(start, end, DAY, bucket_starts(start, end, DAY))
+
+        # водяной знак до и после + один UNION ALL (EXPLAIN добавляет silk в DEBUG)
+        executed = [q['sql'] for q in queries.captured_queries if not q['sql'].startswith('EXPLAIN')]
+        self.assertEqual(len(executed), 3)
+        self.assertIn('UNION ALL', executed[1])
+
+    def test_cache_key_normalized(self):
+        day = self.today - timedelta(days=1)
+        self._get(f'/api/v1/stats/top-promos/?from={day}T10:15&granularity=day')
+        Event.objects.create(event_type='promo_copy', promo=self.promo, created_at=timezone.now())
+
+        # Другой from внутри того же дня - тот же ключ кэша
+        data = self._get(f'/api/v1/stats/top-promos/?from={day}T00:00&granularity=day')
+        self.assertEqual(data['results'][0]['clicks'], 3)
+
+    def test_invalid_params(self):
+        for query in ('granularity=month', 'from=yesterday', 'from=2026-02-01&to=2026-01-01'):
+            response = self.client.get(f'/api/v1/stats/top-promos/?{query}')
+            self.assertEqual(response.status_code, 400, query)
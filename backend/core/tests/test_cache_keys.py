@@ -0,0 +1,109 @@
+"""
+Unit tests для каноничных ключей кэша ответов API (normalize_query, cache_api_response)
+
+Проверяем:
+1. Порядок параметров, метки utm_*/_rsc, значения по умолчанию и регистр поиска не меняют ключ
+2. Параметры вне списка view не входят в ключ и не доходят до view (ссылки пагинации)
+3. Отладочные заголовки X-Cache-Key/X-Cache-Query
+4. Длинные параметры сворачиваются в полный дайджест
+"""
+
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import PromoCode, Store
+from core.pagination import PromoCodePagination
+from core.utils.cache import generate_cache_key, normalize_query
+
+
+class NormalizeQueryTestCase(TestCase):
+    """Тестирование normalize_query"""
+
+    def _normalize(self, query, allowed=None, defaults=PromoCodePagination.default_params):
+        return normalize_query(QueryDict(query), allowed, defaults).urlencode()
+
+    def test_canonical_form(self):
+        expected = 'ordering=popular&page=1&page_size=12'
+        for query in (
+            'page=1&ordering=popular',
+            'ordering=popular&page=1',
+            'ordering=popular',
+            'utm_source=mail&ordering=popular&_rsc=1x2y&utm_campaign=sale&gclid=abc',
+        ):
+            with self.subTest(query=query):
+                self.assertEqual(self._normalize(query), expected)
+
+    def test_long_params_full_digest(self):
+        query = 'ordering=popular&page=1&page_size=12&search=' + 'x' * 100
+        key = generate_cache_key('api', query=query)
+        other = generate_cache_key('api', query=query + 'y')
+
+        self.assertNotEqual(key, other)
+        self.assertRegex(key, r':hash=[0-9a-f]{64}$')
+
+    def test_search_and_repeated_values(self):
+        self.assertEqual(
+            self._normalize('search=%20iPhone%20%2015%20&store=b&store=a&cursor=', defaults=None),
+            'cursor=&search=iphone+15&store=b&store=a',
+        )
+
+    def test_pagination_defaults(self):
+        self.assertEqual(self._normalize('cursor='), 'cursor=&page_size=12')
+        self.assertEqual(self._normalize('limit=5'), 'limit=5&page=1')
+        self.assertEqual(self._normalize('page=3&page_size=24'), 'page=3&page_size=24')
+
+    def test_allowed(self):
+        self.assertEqual(self._normalize('ordering=name&debug=1&page=2', allowed={'ordering'}), 'ordering=name&page=1&page_size=12')
+
+
+class CanonicalCacheKeyTestCase(TestCase):
+    """Тестирование ключей кэша списков промокодов"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        store = Store.objects.create(name='Technopark', slug='technopark', site_url='https://technopark.ru')
+        for i in range(2):
+            PromoCode.objects.create(
+                title=f'Phone sale {i}', description='d', store=store,
+                expires_at=timezone.now() + timedelta(days=30),
+            )
+
+    def test_equivalent_queries_share_entry(self):
+        first = self.client.get('/api/v1/promocodes/?ordering=popular&search=Phone')
+
+        with mock.patch('core.views.generics.ListAPIView.list') as view_list:
+            for url in (
+                '/api/v1/promocodes/?search=phone%20&ordering=popular&page=1',
+                '/api/v1/promocodes/?page_size=12&ordering=popular&search=PHONE&utm_source=tg',
+                '/api/v1/promocodes/?search=Phone&ordering=popular&_rsc=8f3k&yclid=123',
+            ):
+                with self.subTest(url=url):
+                    self.assertEqual(self.client.get(url).content, first.content)
+        view_list.assert_not_called()
+
+    def test_view_sees_canonical_query(self):
+        data = self.client.get('/api/v1/promocodes/?utm_source=mail&page_size=1&debug=1').json()
+
+        self.assertEqual(len(data['results']), 1)
+        self.assertEqual(data['next'], 'http://testserver/api/v1/promocodes/?page=2&page_size=1')
+
+    @override_settings(API_CACHE_KEY_HEADER=True)
+    def test_debug_headers(self):
+        miss = self.client.get('/api/v1/promocodes/?utm_source=mail&ordering=popular')
+        hit = self.client.get('/api/v1/promocodes/?ordering=popular&page=1')
+
+        self.assertEqual(miss['X-Cache-Key'], hit['X-Cache-Key'])
+        self.assertEqual(hit['X-Cache-Query'], 'ordering=popular&page=1&page_size=12')
+
+    def test_no_debug_headers_by_default(self):
+        with override_settings(API_CACHE_KEY_HEADER=False):
+            response = self.client.get('/api/v1/promocodes/')
+
+        self.assertFalse(response.has_header('X-Cache-Key'))
@@ -0,0 +1,79 @@
+"""
+Unit tests для stale-while-revalidate и объединения запросов (cache_api_response)
+
+Проверяем:
+1. После мягкого истечения один запрос пересчитывает, остальные получают устаревший ответ
+2. Холодный промах ждёт пересчёта другого запроса, а не выполняет view повторно
+3. Счётчики stale / lock_wait по view
+"""
+
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.views import APIView
+
+from core.utils.cache import cache_api_response, cache_metrics
+
+
+class CountingView(APIView):
+    calls = 0
+    delay = 0
+
+    @cache_api_response(ttl=0, stale_ttl=60)
+    def get(self, request):
+        time.sleep(self.delay)
+        type(self).calls += 1
+        return Response({'calls': type(self).calls})
+
+
+class StaleWhileRevalidateTestCase(TestCase):
+    """Тестирование мягкого/жёсткого истечения и блокировки пересчёта"""
+
+    def setUp(self):
+        cache.clear()
+        CountingView.calls = 0
+        CountingView.delay = 0
+        self.view = CountingView.as_view()
+
+    def _get(self):
+        return self.view(APIRequestFactory().get('/cached/')).content
+
+    def test_soft_expired_recomputed_by_lock_holder(self):
+        self.assertEqual(self._get(), b'{"calls":1}')
+
+        # Мягкий срок истёк (ttl=0): запрос, взявший блокировку, пересчитывает
+        self.assertEqual(self._get(), b'{"calls":2}')
+
+    def test_stale_served_while_locked(self):
+        self._get()
+
+        with mock.patch('core.utils.cache._acquire_lock', return_value=None):
+            content = self._get()
+
+        self.assertEqual(content, b'{"calls":1}')
+        self.assertEqual(CountingView.calls, 1)
+        self.assertEqual(cache_metrics()['countingview']['stale'], 1)
+
+    def test_cold_miss_waits_for_lock_holder(self):
+        CountingView.delay = 0.3
+        results = []
+        first = threading.Thread(target=lambda: results.append(self._get()))
+        first.start()
+        time.sleep(0.1)
+
+        results.append(self._get())
+        first.join()
+
+        self.assertEqual(results, [b'{"calls":1}', b'{"calls":1}'])
+        self.assertEqual(CountingView.calls, 1)
+        self.assertEqual(cache_metrics()['countingview']['lock_wait'], 1)
+
+    def test_metrics_endpoint_staff_only(self):
+        response = APIClient().get('/api/v1/stats/cache/')
+
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,99 @@
+"""
+Unit tests для тегов кэша ответов API (core.utils.cache, core.signals)
+
+Проверяем:
+1. Изменение магазина/категории/промокода сбрасывает только зависящие ответы
+2. Просмотры (views_count) кэш не сбрасывают
+3. Пересчёт популярности сбрасывает только ordering=popular
+4. flush_cache('api')
+"""
+
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.analytics.popularity import refresh_popularity
+from core.models import Category, DailyAgg, PromoCode, Store
+from core.tasks import flush_cache
+
+
+class CacheTagsTestCase(TestCase):
+    """Тестирование инвалидации кэша по тегам"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.store = Store.objects.create(name='Technopark', slug='technopark', site_url='https://technopark.ru')
+        self.other = Store.objects.create(name='Ozon', slug='ozon', site_url='https://ozon.ru')
+        self.category = Category.objects.create(name='Электроника', slug='electronics')
+        self.promo = PromoCode.objects.create(
+            title='Phone sale', description='d', store=self.store,
+            expires_at=timezone.now() + timedelta(days=30),
+        )
+        self.promo.categories.add(self.category)
+
+    def _hit(self, url):
+        """True, если ответ отдан из кэша (view не вызывалась)"""
+        with mock.patch('core.views.generics.ListAPIView.list', side_effect=AssertionError) as view_list:
+            try:
+                self.client.get(url)
+            except AssertionError:
+                return False
+        return not view_list.called
+
+    def _change(self, func):
+        with self.captureOnCommitCallbacks(execute=True):
+            func()
+
+    def test_store_change_invalidates_dependent_list(self):
+        self.client.get('/api/v1/promocodes/')
+        self._change(lambda: Store.objects.get(pk=self.other.pk).save())
+        self.assertTrue(self._hit('/api/v1/promocodes/'))
+
+        self.store.name = 'Технопарк'
+        self._change(self.store.save)
+
+        self.assertFalse(self._hit('/api/v1/promocodes/'))
+        self.assertEqual(self.client.get('/api/v1/promocodes/').json()['results'][0]['store']['name'], 'Технопарк')
+
+    def test_promo_changes(self):
+        self.client.get('/api/v1/promocodes/')
+        self._change(self.promo.increment_views)
+        self.assertTrue(self._hit('/api/v1/promocodes/'))
+
+        self._change(lambda: PromoCode.objects.create(
+            title='Laptop deal', description='d', store=self.other, expires_at=timezone.now() + timedelta(days=5)
+        ))
+
+        self.assertEqual(self.client.get('/api/v1/promocodes/').json()['count'], 2)
+
+    def test_category_list(self):
+        self.client.get('/api/v1/categories/')
+        self.category.name = 'Техника'
+        self._change(self.category.save)
+
+        self.assertEqual(self.client.get('/api/v1/categories/').json()['results'][0]['name'], 'Техника')
+
+        self._change(lambda: self.promo.categories.clear())
+        self.assertEqual(self.client.get('/api/v1/categories/').json()['results'][0]['promocodes_count'], 0)
+
+    def test_ranking_refresh(self):
+        self.client.get('/api/v1/promocodes/')
+        self.client.get('/api/v1/promocodes/?ordering=popular')
+        DailyAgg.objects.create(date=timezone.localdate(), event_type='promo_copy', promo=self.promo, count=5)
+
+        self._change(refresh_popularity)
+
+        self.assertTrue(self._hit('/api/v1/promocodes/'))
+        self.assertFalse(self._hit('/api/v1/promocodes/?ordering=popular'))
+
+    def test_flush_api_scope(self):
+        self.client.get('/api/v1/promocodes/')
+
+        flush_cache('api')
+
+        self.assertFalse(self._hit('/api/v1/promocodes/'))
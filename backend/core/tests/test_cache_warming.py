@@ -0,0 +1,102 @@
+"""
+Unit tests для прогрева кэша ответов API (core.cache_warming, manage.py warm_cache)
+
+Проверяем:
+1. Списки и страницы категорий/магазинов/витрин прогреты - запрос не доходит до view
+2. Частые запросы из выборки (Redis) попадают в прогрев
+3. Сброс тегов списков ставит один прогрев на окно CACHE_WARM_DELAY
+"""
+
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.cache_warming import landing_paths, warm
+from core.models import Category, PromoCode, Showcase, ShowcaseItem, Store
+from core.utils.cache import entity_tag, invalidate_tags, list_tag, top_requests
+from core.utils.redis import get_redis_client
+
+
+class CacheWarmingTestCase(TestCase):
+    """Тестирование прогрева кэша"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.store = Store.objects.create(name='Technopark', slug='technopark', site_url='https://technopark.ru')
+        self.category = Category.objects.create(name='Электроника', slug='electronics')
+        self.promo = PromoCode.objects.create(
+            title='Скидка на телефоны', description='d', store=self.store, code='PHONE',
+            expires_at=timezone.now() + timedelta(days=30),
+        )
+        self.promo.categories.add(self.category)
+        self.showcase = Showcase.objects.create(title='Top', slug='top', banner='showcases/top.png')
+        ShowcaseItem.objects.create(showcase=self.showcase, promocode=self.promo, position=0)
+
+    def test_landing_warmed(self):
+        stats = warm(top=0, concurrency=1)
+
+        self.assertEqual(len(landing_paths()), 8)
+        self.assertEqual((stats['paths'], stats['warmed'], stats['failed']), (8, 8, 0))
+        with mock.patch('core.views.generics.ListAPIView.list') as view_list:
+            for url in (
+                '/api/v1/promocodes/',
+                '/api/v1/categories/electronics/promocodes/',
+                '/api/v1/stores/technopark/promocodes/',
+            ):
+                with self.subTest(url=url):
+                    self.assertEqual(self.client.get(url).json()['results'][0]['code'], 'PHONE')
+        view_list.assert_not_called()
+
+    def test_showcase_promos_cached_until_composition_changes(self):
+        url = '/api/v1/showcases/top/promos/'
+        self.assertEqual(self.client.get(url).json()['count'], 1)
+
+        other = PromoCode.objects.create(
+            title='Скидка на ноутбуки', description='d', store=self.store,
+            expires_at=timezone.now() + timedelta(days=30),
+        )
+        ShowcaseItem.objects.create(showcase=self.showcase, promocode=other, position=1)
+        self.assertEqual(self.client.get(url).json()['count'], 1)
+
+        invalidate_tags(entity_tag(self.showcase))
+        self.assertEqual(self.client.get(url).json()['count'], 2)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('warm_cache', '--top', '0', '--concurrency', '1', stdout=out)
+
+        self.assertIn('Прогрето 8 из 8', out.getvalue())
+
+    @override_settings(CACHE_WARM_ON_INVALIDATE=True, CACHE_WARM_DELAY=60)
+    def test_invalidation_schedules_one_warm(self):
+        with mock.patch('core.tasks.warm_cache.apply_async') as apply_async:
+            invalidate_tags(entity_tag(self.promo))
+            apply_async.assert_not_called()
+
+            invalidate_tags(list_tag(PromoCode))
+            invalidate_tags(list_tag(Category))
+
+        apply_async.assert_called_once_with(kwargs={'landing': False}, countdown=60)
+
+    @override_settings(CACHE_WARM_SAMPLE_RATE=1.0)
+    def test_sampled_requests_warmed(self):
+        if get_redis_client() is None:
+            self.skipTest('request sample requires the Redis cache backend')
+        self.client.get('/api/v1/promocodes/?ordering=popular')
+        self.client.get('/api/v1/promocodes/?page=1&ordering=popular&utm_source=mail')
+        self.client.get('/api/v1/categories/')
+
+        # В выборке - каноничная форма запроса (normalize_query)
+        self.assertEqual(
+            top_requests(10),
+            ['/api/v1/promocodes/?ordering=popular&page=1&page_size=12', '/api/v1/categories/'],
+        )
+        stats = warm(top=1, concurrency=1, landing=False)
+        self.assertEqual((stats['paths'], stats['warmed']), (1, 1))
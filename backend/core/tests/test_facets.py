@@ -0,0 +1,152 @@
+"""
+Unit tests для фасетов поиска (core.search.facets)
+
+Проверяем:
+1. Счётчики по магазинам, категориям, типам, наличию кода и сроку
+2. Что все фасеты считаются одним запросом
+3. ?facets=1 в списке промокодов и глобальном поиске
+4. Фасет не сужается собственным фильтром (дизъюнктивные счётчики)
+"""
+
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import Category, PromoCode, Store
+from core.search.facets import compute_facets
+
+
+class FacetsTestCase(TestCase):
+    """Тестирование фасетных счётчиков"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        now = timezone.now()
+
+        # Поисковый документ пересчитывается в on_commit - выполняем сразу
+        with self.captureOnCommitCallbacks(execute=True):
+            self.electronics = Category.objects.create(name='Electronics', slug='electronics')
+            self.food = Category.objects.create(name='Food', slug='food')
+            self.store = Store.objects.create(name='Technopark', slug='technopark', site_url='https://technopark.ru')
+            self.other_store = Store.objects.create(name='Pizzeria', slug='pizzeria', site_url='https://pizza.ru')
+
+            phone = PromoCode.objects.create(
+                title='Phone sale', description='d', store=self.store, code='PHONE',
+                expires_at=now + timedelta(days=3),
+            )
+            phone.categories.add(self.electronics, self.food)
+            laptop = PromoCode.objects.create(
+                title='Laptop sale', description='d', store=self.store, offer_type='deal',
+                expires_at=now + timedelta(days=30),
+            )
+            laptop.categories.add(self.electronics)
+            PromoCode.objects.create(
+                title='Pizza sale', description='d', store=self.other_store, offer_type='cashback',
+                expires_at=now + timedelta(days=30),
+            )
+
+    def test_counts(self):
+        facets = compute_facets(PromoCode.objects.all())
+
+        self.assertEqual(
+            [(item['value'], item['count']) for item in facets['store']],
+            [('technopark', 2), ('pizzeria', 1)]
+        )
+        self.assertEqual(
+            [(item['value'], item['count']) for item in facets['category']],
+            [('electronics', 2), ('food', 1)]
+        )
+        self.assertEqual(
+            {item['value']: item['count'] for item in facets['offer_type']},
+            {'coupon': 1, 'deal': 1, 'cashback': 1}
+        )
+        self.assertEqual(facets['with_code'], 1)
+        self.assertEqual(facets['expires_soon'], 1)
+
+    def test_single_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            compute_facets(PromoCode.objects.filter(categories__slug='electronics'))
+        # EXPLAIN добавляет silk-профайлер в DEBUG, это не наш запрос
+        sql = [q['sql'] for q in queries if not q['sql'].startswith('EXPLAIN')]
+        self.assertEqual(len(sql), 1)
+
+    def test_m2m_filter_does_not_duplicate(self):
+        """Фильтр по категории не должен удваивать счётчики"""
+        facets = compute_facets(PromoCode.objects.filter(categories__slug__in=['electronics', 'food']))
+        self.assertEqual(facets['store'][0]['count'], 2)
+
+    def test_list_view_facets(self):
+        response = self.client.get('/api/v1/promocodes/?store=technopark&facets=1')
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(data['facets']['with_code'], 1)
+        self.assertEqual(
+            {item['value'] for item in data['facets']['offer_type']},
+            {'coupon', 'deal'}
+        )
+
+    def test_inactive_category_not_counted(self):
+        Category.objects.filter(pk=self.food.pk).update(is_active=False)
+
+        facets = compute_facets(PromoCode.objects.all())
+
+        self.assertEqual([item['value'] for item in facets['category']], ['electronics'])
+
+    def test_list_view_disjunctive_facets(self):
+        response = self.client.get('/api/v1/promocodes/?store=technopark&offer_type=deal&facets=1')
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['count'], 1)
+        # Магазины - по offer_type=deal без фильтра по магазину, типы - по магазину без фильтра по типу
+        self.assertEqual(
+            {item['value']: item['count'] for item in data['facets']['store']},
+            {'technopark': 1}
+        )
+        self.assertEqual(
+            {item['value']: item['count'] for item in data['facets']['offer_type']},
+            {'coupon': 1, 'deal': 1}
+        )
+        self.assertEqual(
+            {item['value']: item['count'] for item in data['facets']['category']},
+            {'electronics': 1}
+        )
+
+    def test_list_view_store_facet_keeps_other_stores(self):
+        response = self.client.get('/api/v1/promocodes/?store=pizzeria&facets=1')
+
+        data = response.json()
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(
+            {item['value']: item['count'] for item in data['facets']['store']},
+            {'technopark': 2, 'pizzeria': 1}
+        )
+
+    def test_list_view_disjunctive_facets_keep_search(self):
+        response = self.client.get('/api/v1/promocodes/?search=phone&store=pizzeria&facets=1')
+
+        data = response.json()
+        self.assertEqual(data['count'], 0)
+        self.assertEqual(
+            {item['value']: item['count'] for item in data['facets']['store']},
+            {'technopark': 1}
+        )
+
+    def test_list_view_without_facets(self):
+        response = self.client.get('/api/v1/promocodes/')
+        self.assertNotIn('facets', response.json())
+
+    def test_global_search_facets(self):
+        response = self.client.get('/api/v1/search/?q=sale&facets=1')
+
+        self.assertEqual(response.status_code, 200)
+        store_counts = {item['value']: item['count'] for item in response.json()['facets']['store']}
+        self.assertEqual(store_counts, {'technopark': 2, 'pizzeria': 1})
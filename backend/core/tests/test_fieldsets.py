@@ -0,0 +1,104 @@
+"""
+Unit tests для ?fields= и ?view=card (PromoCodeSerializer, apply_promo_fieldset)
+
+Проверяем:
+1. Набор полей ответа и облегчённые вложенные объекты карточки
+2. SELECT без длинных текстовых колонок
+3. Все списки промокодов, поиск и витрины
+"""
+
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import Category, PromoCode, Showcase, ShowcaseItem, Store
+from core.serializers import PROMO_CARD_FIELDS
+
+
+class FieldsetTestCase(TestCase):
+    """Тестирование разреженных наборов полей"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.store = Store.objects.create(
+            name='Technopark', slug='technopark', site_url='https://technopark.ru', description='Магазин техники'
+        )
+        self.category = Category.objects.create(name='Электроника', slug='electronics', description='Техника')
+        # on_commit: поисковый документ (Postgres) для /search/
+        with self.captureOnCommitCallbacks(execute=True):
+            self.promo = PromoCode.objects.create(
+                title='Phone sale', description='d', store=self.store, code='PHONE',
+                long_description='Очень длинное описание', steps='1. Скопировать',
+                expires_at=timezone.now() + timedelta(days=30),
+            )
+            self.promo.categories.add(self.category)
+
+    def _list(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        sql = [q['sql'] for q in queries.captured_queries if 'FROM "core_promocode"' in q['sql']]
+        return response.json(), sql
+
+    def test_card_view(self):
+        data, sql = self._list('/api/v1/promocodes/?view=card')
+        item = data['results'][0]
+
+        self.assertEqual(set(item), set(PROMO_CARD_FIELDS))
+        self.assertEqual(set(item['store']), {'id', 'name', 'slug', 'logo', 'site_url'})
+        self.assertEqual(item['categories'], [{'id': self.category.id, 'name': 'Электроника', 'slug': 'electronics'}])
+        self.assertEqual(item['discount_text'], 'Скидка')
+        select = [q for q in sql if q.startswith('SELECT "core_promocode"."id"')][0]
+        self.assertNotIn('long_description', select)
+        self.assertNotIn('"core_store"."description"', select)
+
+    def test_card_without_deferred_loads(self):
+        for i in range(3):
+            promo = PromoCode.objects.create(
+                title=f'Promo {i}', description='d', store=self.store, expires_at=timezone.now() + timedelta(days=30)
+            )
+            promo.categories.add(self.category)
+
+        for url in ('/api/v1/promocodes/?view=card', '/api/v1/promocodes/?view=card&ordering=trending&cursor='):
+            with self.subTest(url=url):
+                cache.clear()
+                _, sql = self._list(url)
+                # Доступ к отложенной колонке дал бы SELECT по одному промокоду
+                self.assertFalse([q for q in sql if '"core_promocode"."id" = ' in q])
+
+    def test_fields_param(self):
+        data, sql = self._list('/api/v1/promocodes/?fields=id,title,is_expired')
+
+        self.assertEqual(data['results'][0], {'id': self.promo.id, 'title': 'Phone sale', 'is_expired': False})
+        select = [q for q in sql if q.startswith('SELECT "core_promocode"."id"')][0]
+        self.assertNotIn('"core_promocode"."description"', select)
+        self.assertNotIn('core_promocode_categories', ' '.join(sql))
+
+    def test_full_output_unchanged(self):
+        item = self.client.get('/api/v1/promocodes/').json()['results'][0]
+
+        self.assertIn('long_description', item)
+        self.assertIn('description', item['store'])
+
+    def test_other_list_endpoints(self):
+        showcase = Showcase.objects.create(title='Top', slug='top', banner='showcases/top.png')
+        ShowcaseItem.objects.create(showcase=showcase, promocode=self.promo, position=0)
+
+        for url in (
+            '/api/v1/categories/electronics/promocodes/?view=card',
+            '/api/v1/stores/technopark/promocodes/?view=card',
+            '/api/v1/showcases/top/promos/?view=card',
+            '/api/v1/promocodes/?view=card&cursor=',
+        ):
+            with self.subTest(url=url):
+                item = self.client.get(url).json()['results'][0]
+                self.assertEqual(set(item), set(PROMO_CARD_FIELDS))
+
+        found = self.client.get('/api/v1/search/?q=Phone&fields=id,title').json()['promocodes']
+        self.assertEqual(found, [{'id': self.promo.id, 'title': 'Phone sale'}])
@@ -0,0 +1,159 @@
+"""
+Unit tests для L1-кэша ответов в памяти процесса (core.utils.local_cache)
+
+Проверяем:
+1. LRU: вытеснение по числу записей и по байтам, срок жизни, сброс по тегам
+2. Попадание в L1 отдаёт ответ без обращения к Redis
+3. Инвалидация из другого процесса (pub/sub) и локальная invalidate_tags
+4. Сообщения соседних воркеров после fork не считаются своими
+"""
+
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+
+from core.utils import local_cache
+from core.utils.cache import API_TAG, cache_api_response, flush_tier_counts, invalidate_tags, tier_metrics
+from core.utils.redis import get_redis_client, make_key
+
+
+class LocalCacheTestCase(unittest.TestCase):
+    """Тестирование ограниченного LRU"""
+
+    def setUp(self):
+        self.lru = local_cache.LocalCache()
+
+    def _set(self, key, size=1, ttl=60, tags=None):
+        self.lru.set(key, {'tags': tags or {}}, size, ttl=ttl, max_entries=2, max_bytes=10)
+
+    def test_evicts_least_recently_used(self):
+        self._set('a')
+        self._set('b')
+        self.lru.get('a')
+        self._set('c')
+
+        self.assertIsNone(self.lru.get('b'))
+        self.assertIsNotNone(self.lru.get('a'))
+        self.assertIsNotNone(self.lru.get('c'))
+
+    def test_bytes_bound(self):
+        self._set('a', size=6)
+        self._set('b', size=6)
+        self._set('huge', size=11)
+
+        self.assertEqual(len(self.lru), 1)
+        self.assertIsNotNone(self.lru.get('b'))
+        self.assertIsNone(self.lru.get('huge'))
+
+    def test_expiry_and_tags(self):
+        self._set('old', ttl=0)
+        self._set('tagged', tags={'store:1': 1})
+
+        self.assertIsNone(self.lru.get('old'))
+        self.lru.delete_tagged(['store:1'])
+        self.assertIsNone(self.lru.get('tagged'))
+
+
+class AfterForkTestCase(unittest.TestCase):
+    """Тестирование состояния L1 в дочернем процессе после fork"""
+
+    def setUp(self):
+        # _after_fork сбрасывает глобальное состояние слушателя - восстанавливаем после теста
+        for name, value in (('_origin', local_cache._origin), ('_listener', local_cache._listener),
+                            ('_subscribed', threading.Event())):
+            patcher = mock.patch.object(local_cache, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(local_cache.local_cache.clear)
+
+    def test_sibling_invalidation_applied(self):
+        # Соседний воркер унаследовал тот же origin от родителя
+        parent_origin = local_cache._origin
+        local_cache._after_fork()
+        self.assertNotEqual(local_cache._origin, parent_origin)
+
+        local_cache.local_cache.set('k', {'tags': {'store:1': 1}}, 1, ttl=60, max_entries=10, max_bytes=100)
+        local_cache._apply(json.dumps({'o': parent_origin, 'keys': [], 'tags': ['store:1'], 'clear': False}))
+
+        self.assertIsNone(local_cache.local_cache.get('k'))
+
+
+class CountingView(APIView):
+    calls = 0
+
+    @cache_api_response(ttl=60)
+    def get(self, request):
+        type(self).calls += 1
+        return Response({'calls': type(self).calls})
+
+
+@override_settings(API_L1_CACHE_ENABLED=True)
+class TwoTierCacheTestCase(TestCase):
+    """Тестирование L1 перед Redis"""
+
+    def setUp(self):
+        if get_redis_client() is None:
+            self.skipTest('L1 requires the Redis cache backend')
+        flush_tier_counts()
+        cache.clear()
+        local_cache.local_cache.clear()
+        CountingView.calls = 0
+        self.view = CountingView.as_view()
+        self.assertTrue(self._wait(local_cache.enabled))
+
+    def _wait(self, condition, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.02)
+        return True
+
+    def _get(self):
+        return self.view(APIRequestFactory().get('/l1/')).content
+
+    def _entries(self):
+        return len(local_cache.local_cache)
+
+    def test_hit_skips_redis(self):
+        self.assertEqual(self._get(), b'{"calls":1}')
+
+        with mock.patch('core.utils.cache.get_cached_api_response') as redis_get:
+            self.assertEqual(self._get(), b'{"calls":1}')
+
+        redis_get.assert_not_called()
+        tiers = tier_metrics()
+        self.assertEqual((tiers['l1'], tiers['l2'], tiers['miss']), (1, 0, 1))
+
+    def test_filled_from_redis(self):
+        self._get()
+        local_cache.local_cache.clear()
+
+        self.assertEqual(self._get(), b'{"calls":1}')
+        self.assertEqual(self._entries(), 1)
+        self.assertEqual(tier_metrics()['l2'], 1)
+
+    def test_remote_invalidation(self):
+        self._get()
+        self.assertEqual(self._entries(), 1)
+
+        payload = {'o': 'other-process', 'keys': [], 'tags': [API_TAG], 'clear': False}
+        get_redis_client().publish(make_key(local_cache.CHANNEL), json.dumps(payload))
+
+        self.assertTrue(self._wait(lambda: self._entries() == 0))
+
+    def test_local_invalidation(self):
+        self._get()
+
+        invalidate_tags(API_TAG)
+
+        self.assertEqual(self._entries(), 0)
+        self.assertEqual(self._get(), b'{"calls":2}')
@@ -0,0 +1,95 @@
+"""
+Unit tests для ?format=normalized (PromoCodeListSerializer, NormalizedJSONRenderer)
+
+Проверяем:
+1. store_id/category_ids в строках и каждый магазин/категория один раз в included
+2. Совместимость с ?view=card и ?fields=
+3. Все списки промокодов, поиск и витрины
+"""
+
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import Category, PromoCode, Showcase, ShowcaseItem, Store
+
+
+class NormalizedFormatTestCase(TestCase):
+    """Тестирование sideloaded-формата ответа"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.store = Store.objects.create(name='Technopark', slug='technopark', site_url='https://technopark.ru')
+        self.other = Store.objects.create(name='Ozon', slug='ozon', site_url='https://ozon.ru')
+        self.category = Category.objects.create(name='Электроника', slug='electronics')
+        # on_commit: поисковый документ (Postgres) для /search/
+        with self.captureOnCommitCallbacks(execute=True):
+            self.promos = []
+            for i, store in enumerate([self.store, self.store, self.other]):
+                promo = PromoCode.objects.create(
+                    title=f'Phone sale {i}', description='d', store=store,
+                    expires_at=timezone.now() + timedelta(days=30),
+                )
+                promo.categories.add(self.category)
+                self.promos.append(promo)
+
+    def _get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        return response.json()
+
+    def test_list_sideloads_relations(self):
+        data = self._get('/api/v1/promocodes/?format=normalized')
+
+        item = data['results'][0]
+        self.assertNotIn('store', item)
+        self.assertNotIn('categories', item)
+        self.assertEqual({row['store_id'] for row in data['results']}, {self.store.id, self.other.id})
+        self.assertEqual(item['category_ids'], [self.category.id])
+        self.assertEqual(set(data['included']['stores']), {str(self.store.id), str(self.other.id)})
+        self.assertEqual(list(data['included']['categories']), [str(self.category.id)])
+        store = data['included']['stores'][str(self.store.id)]
+        self.assertEqual((store['slug'], store['promocodes_count']), ('technopark', 2))
+
+    def test_default_format_unchanged(self):
+        data = self._get('/api/v1/promocodes/')
+
+        self.assertNotIn('included', data)
+        self.assertEqual(data['results'][0]['store']['id'], self.promos[2].store_id)
+
+    def test_card_and_fields(self):
+        data = self._get('/api/v1/promocodes/?format=normalized&view=card')
+        self.assertEqual(
+            set(data['included']['stores'][str(self.store.id)]), {'id', 'name', 'slug', 'logo', 'site_url'}
+        )
+        self.assertEqual(data['included']['categories'][str(self.category.id)]['slug'], 'electronics')
+
+        data = self._get('/api/v1/promocodes/?format=normalized&fields=id,store')
+        self.assertEqual(set(data['results'][0]), {'id', 'store_id'})
+        self.assertEqual(set(data['included']), {'stores'})
+
+    def test_other_endpoints(self):
+        showcase = Showcase.objects.create(title='Top', slug='top', banner='showcases/top.png')
+        ShowcaseItem.objects.create(showcase=showcase, promocode=self.promos[0], position=0)
+
+        for url in (
+            '/api/v1/categories/electronics/promocodes/?format=normalized',
+            '/api/v1/stores/technopark/promocodes/?format=normalized',
+            '/api/v1/showcases/top/promos/?format=normalized',
+            '/api/v1/promocodes/?format=normalized&cursor=',
+        ):
+            with self.subTest(url=url):
+                data = self._get(url)
+                self.assertEqual(data['results'][0]['category_ids'], [self.category.id])
+                self.assertIn(str(data['results'][0]['store_id']), data['included']['stores'])
+
+        data = self._get('/api/v1/search/?q=Phone&format=normalized')
+        self.assertEqual(len(data['promocodes']), 3)
+        self.assertEqual(len(data['included']['stores']), 2)
+        # Найденные магазины - отдельный список, как и без format
+        self.assertIn('stores', data)
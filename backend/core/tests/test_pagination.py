@@ -0,0 +1,195 @@
+"""
+Unit tests для пагинации промокодов (core.pagination)
+
+Проверяем:
+1. ?cursor= проходит весь список без пропусков и повторов (с равными ключами сортировки)
+2. Курсор для ordering=popular и trending
+3. Без COUNT(*) и OFFSET
+4. Страничный режим: count_type exact/cached/estimate и инвалидация
+"""
+
+from datetime import timedelta
+from urllib.parse import parse_qs, urlparse
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import Category, PromoCode, Showcase, ShowcaseItem, Store
+
+
+class CursorPaginationTestCase(TestCase):
+    """Тестирование ?cursor="""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.store = Store.objects.create(name='Technopark', slug='technopark', site_url='https://technopark.ru')
+        self.category = Category.objects.create(name='Электроника', slug='electronics')
+        expires_at = timezone.now() + timedelta(days=30)
+        self.promos = []
+        for i in range(7):
+            promo = PromoCode.objects.create(
+                title=f'Promo {i}', description='d', store=self.store, expires_at=expires_at,
+                is_hot=i % 3 == 0, popularity_7d=i % 2 * 10, trending_score=(i % 4) / 2,
+            )
+            promo.categories.add(self.category)
+            self.promos.append(promo)
+        # Одинаковый created_at: порядок держится на id
+        PromoCode.objects.update(created_at=timezone.now() - timedelta(hours=1))
+
+    def _walk(self, url):
+        ids, pages = [], 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertNotIn('count', data)
+            ids.extend(item['id'] for item in data['results'])
+            url = data['next']
+            pages += 1
+        return ids, pages
+
+    def _page_ids(self, url):
+        return [item['id'] for item in self.client.get(url).json()['results']]
+
+    def test_cursor_matches_page_order(self):
+        for ordering in ('&ordering=popular', '&ordering=trending'):
+            with self.subTest(ordering=ordering):
+                expected = self._page_ids(f'/api/v1/promocodes/?page_size=100{ordering}')
+                ids, pages = self._walk(f'/api/v1/promocodes/?cursor=&limit=3{ordering}')
+
+                self.assertEqual(ids, expected)
+                self.assertEqual(len(ids), 7)
+                self.assertEqual(pages, 3)
+
+    def test_cursor_ties_broken_by_id(self):
+        # Равные created_at/views_count: без id страницы теряли бы или повторяли строки
+        for ordering, key in (('', lambda p: (-p.is_hot, -p.id)), ('&ordering=views_count', lambda p: p.id)):
+            with self.subTest(ordering=ordering):
+                ids, _ = self._walk(f'/api/v1/promocodes/?cursor=&limit=2{ordering}')
+
+                self.assertEqual(ids, [promo.id for promo in sorted(self.promos, key=key)])
+
+    def test_cursor_on_category_and_store_lists(self):
+        expected = self._page_ids('/api/v1/categories/electronics/promocodes/?page_size=100&ordering=popular')
+        ids, _ = self._walk('/api/v1/categories/electronics/promocodes/?cursor=&page_size=2&ordering=popular')
+        self.assertEqual(ids, expected)
+
+        ids, _ = self._walk('/api/v1/stores/technopark/promocodes/?cursor=&page_size=4')
+        self.assertEqual(len(set(ids)), 7)
+
+    def test_cursor_on_showcase_promos(self):
+        showcase = Showcase.objects.create(title='Top', slug='top', banner='showcases/top.png')
+        for position, promo in enumerate(reversed(self.promos)):
+            ShowcaseItem.objects.create(showcase=showcase, promocode=promo, position=position // 2)
+
+        ids, _ = self._walk('/api/v1/showcases/top/promos/?cursor=&page_size=3')
+
+        self.assertEqual(ids, [promo.id for promo in reversed(self.promos)])
+
+    def _list_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [q['sql'].upper() for q in queries.captured_queries if q['sql'].startswith('SELECT') and 'silk_' not in q['sql']]
+
+    def test_deep_page_without_count_and_offset(self):
+        next_url = self.client.get('/api/v1/promocodes/?cursor=&limit=3').json()['next']
+
+        cursor_sql = self._list_queries(next_url)
+        page_sql = self._list_queries('/api/v1/promocodes/?page=2&limit=3&count=exact')
+
+        # COUNT(*) в ответе есть и от сериализатора магазина - сравниваем с режимом страниц
+        self.assertEqual(
+            len([q for q in cursor_sql if 'COUNT(' in q]), len([q for q in page_sql if 'COUNT(' in q]) - 1
+        )
+        self.assertTrue([q for q in page_sql if 'OFFSET' in q])
+        self.assertFalse([q for q in cursor_sql if 'OFFSET' in q])
+
+    def test_cursor_bound_to_ordering(self):
+        data = self.client.get('/api/v1/promocodes/?cursor=&limit=3').json()
+        cursor = parse_qs(urlparse(data['next']).query)['cursor'][0]
+
+        response = self.client.get(f'/api/v1/promocodes/?cursor={cursor}&ordering=popular')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get('/api/v1/promocodes/?cursor=garbage').status_code, 404)
+
+    def test_page_mode_unchanged(self):
+        data = self.client.get('/api/v1/promocodes/?page=2&limit=3&count=exact').json()
+
+        self.assertEqual((data['count'], data['count_type']), (7, 'exact'))
+        self.assertEqual(len(data['results']), 3)
+        self.assertIsNotNone(data['previous'])
+        self.assertIsNotNone(data['next'])
+
+
+class ListCountTestCase(TestCase):
+    """Тестирование count_type в страничном режиме"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.store = Store.objects.create(name='Technopark', slug='technopark', site_url='https://technopark.ru')
+        for i in range(5):
+            PromoCode.objects.create(
+                title=f'Promo {i}', description='d', store=self.store, is_hot=i < 4,
+                expires_at=timezone.now() + timedelta(days=30),
+            )
+
+    def _get(self, url):
+        """Ответ и число запросов COUNT(*) по промокодам (кроме счётчиков магазина в сериализаторе)"""
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(url).json()
+        counts = [
+            q['sql'] for q in queries.captured_queries
+            if q['sql'].startswith('SELECT COUNT(') and '"core_promocode"."store_id" = ' not in q['sql']
+        ]
+        return data, len(counts)
+
+    def test_last_page_counted_from_rows(self):
+        data, counts = self._get('/api/v1/promocodes/?page=2&limit=3')
+
+        self.assertEqual((data['count'], data['count_type']), (5, 'exact'))
+        self.assertEqual(counts, 0)
+
+    def test_filtered_count_cached_until_write(self):
+        # ordering не входит в ключ количества, но даёт новый ключ кэша ответа
+        url = '/api/v1/promocodes/?is_hot=true&limit=1'
+
+        data, counts = self._get(url)
+        self.assertEqual((data['count'], data['count_type'], counts), (4, 'exact', 1))
+
+        data, counts = self._get(url + '&page=2&ordering=popular')
+        self.assertEqual((data['count'], data['count_type'], counts), (4, 'cached', 0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PromoCode.objects.create(
+                title='New', description='d', store=self.store, is_hot=True,
+                expires_at=timezone.now() + timedelta(days=30),
+            )
+        data, counts = self._get(url + '&ordering=trending')
+        self.assertEqual((data['count'], data['count_type'], counts), (5, 'exact', 1))
+
+    def test_views_increment_keeps_cache(self):
+        url = '/api/v1/promocodes/?is_hot=true&limit=2'
+        self._get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PromoCode.objects.first().increment_views()
+
+        self.assertEqual(self._get(url + '&ordering=popular')[0]['count_type'], 'cached')
+
+    def test_unfiltered_list_uses_estimate_on_postgres(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('PostgreSQL planner estimate')
+
+        data, counts = self._get('/api/v1/promocodes/?limit=2')
+
+        self.assertEqual(data['count_type'], 'estimate')
+        self.assertGreaterEqual(data['count'], 3)
+        self.assertEqual(counts, 0)
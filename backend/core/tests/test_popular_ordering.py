@@ -5,12 +5,17 @@ Unit tests для popular ordering
 1. Badges first (is_hot OR is_recommended)
 2. Usage 7d (clicks + copies за последние 7 дней)
 3. Freshness (created_at)
+
+usage_7d хранится в PromoCode.popularity_7d и пересчитывается из DailyAgg
+(core.analytics.popularity) - в тестах перед запросом.
 """
 
+from django.core.cache import cache
 from django.test import TestCase
 from django.utils import timezone
 from datetime import timedelta
 from rest_framework.test import APIClient
+from core.analytics.popularity import refresh_popularity
 from core.models import PromoCode, Store, Category, DailyAgg
 from django.contrib.auth import get_user_model
 
@@ -33,7 +38,7 @@ class PopularOrderingTestCase(TestCase):
         self.store = Store.objects.create(
             name='TestStore',
             slug='teststore',
-            url='https://teststore.com'
+            site_url='https://teststore.com'
         )
 
         # Даты для тестирования
@@ -41,14 +46,30 @@ class PopularOrderingTestCase(TestCase):
         self.week_ago = (self.now - timedelta(days=7)).date()
         self.yesterday = (self.now - timedelta(days=1)).date()
 
+    def _create_promo(self, category=None, created_at=None, **kwargs):
+        """PromoCode с категорией; created_at (auto_now_add) выставляется отдельным UPDATE"""
+        kwargs.setdefault('description', 'Описание')
+        promo = PromoCode.objects.create(**kwargs)
+        if category:
+            promo.categories.add(category)
+        if created_at:
+            PromoCode.objects.filter(id=promo.id).update(created_at=created_at)
+        return promo
+
+    def _get(self, url):
+        """Запрос после пересчёта популярности (как после прогона агрегации)"""
+        refresh_popularity()
+        cache.clear()
+        return self.client.get(url)
+
     def test_badges_first_hot_promo(self):
         """is_hot промокоды должны быть первыми"""
 
         # Промокод с is_hot=True и минимальными кликами
-        hot_promo = PromoCode.objects.create(
+        hot_promo = self._create_promo(
             title='Hot Promo',
             code='HOT100',
-            promo_type='coupon',
+            offer_type='coupon',
             category=self.category,
             store=self.store,
             is_hot=True,
@@ -57,10 +78,10 @@ class PopularOrderingTestCase(TestCase):
         )
 
         # Промокод без бейджа, но с большим количеством кликов
-        popular_promo = PromoCode.objects.create(
+        popular_promo = self._create_promo(
             title='Popular Promo',
             code='POP200',
-            promo_type='coupon',
+            offer_type='coupon',
             category=self.category,
             store=self.store,
             is_hot=False,
@@ -77,7 +98,7 @@ class PopularOrderingTestCase(TestCase):
         )
 
         # Запрос с ordering=popular
-        response = self.client.get('/api/v1/promos/?ordering=popular')
+        response = self._get('/api/v1/promocodes/?ordering=popular')
 
         self.assertEqual(response.status_code, 200)
         results = response.json()['results']
@@ -90,10 +111,10 @@ class PopularOrderingTestCase(TestCase):
         """is_recommended промокоды должны быть первыми"""
 
         # Промокод с is_recommended=True
-        recommended_promo = PromoCode.objects.create(
+        recommended_promo = self._create_promo(
             title='Recommended Promo',
             code='REC300',
-            promo_type='coupon',
+            offer_type='coupon',
             category=self.category,
             store=self.store,
             is_recommended=True,
@@ -102,10 +123,10 @@ class PopularOrderingTestCase(TestCase):
         )
 
         # Промокод без бейджа с кликами
-        normal_promo = PromoCode.objects.create(
+        normal_promo = self._create_promo(
             title='Normal Promo',
             code='NORM400',
-            promo_type='coupon',
+            offer_type='coupon',
             category=self.category,
             store=self.store,
             is_hot=False,
@@ -122,7 +143,7 @@ class PopularOrderingTestCase(TestCase):
             count=500
         )
 
-        response = self.client.get('/api/v1/promos/?ordering=popular')
+        response = self._get('/api/v1/promocodes/?ordering=popular')
 
         self.assertEqual(response.status_code, 200)
         results = response.json()['results']
@@ -135,10 +156,10 @@ class PopularOrderingTestCase(TestCase):
         """Сортировка по usage_7d (клики + копирования) для промо без бейджей"""
 
         # Промо с 1000 кликов
-        promo_1000 = PromoCode.objects.create(
+        promo_1000 = self._create_promo(
             title='Promo 1000',
             code='P1000',
-            promo_type='coupon',
+            offer_type='coupon',
             category=self.category,
             store=self.store,
             is_active=True,
@@ -146,10 +167,10 @@ class PopularOrderingTestCase(TestCase):
         )
 
         # Промо с 500 кликов
-        promo_500 = PromoCode.objects.create(
+        promo_500 = self._create_promo(
             title='Promo 500',
             code='P500',
-            promo_type='coupon',
+            offer_type='coupon',
             category=self.category,
             store=self.store,
             is_active=True,
@@ -157,10 +178,10 @@ class PopularOrderingTestCase(TestCase):
         )
 
         # Промо с 200 кликов
-        promo_200 = PromoCode.objects.create(
+        promo_200 = self._create_promo(
             title='Promo 200',
             code='P200',
-            promo_type='coupon',
+            offer_type='coupon',
             category=self.category,
             store=self.store,
             is_active=True,
@@ -172,7 +193,7 @@ class PopularOrderingTestCase(TestCase):
         DailyAgg.objects.create(promo=promo_500, date=self.yesterday, event_type='click', count=500)
         DailyAgg.objects.create(promo=promo_200, date=self.yesterday, event_type='click', count=200)
 
-        response = self.client.get('/api/v1/promos/?ordering=popular')
+        response = self._get('/api/v1/promocodes/?ordering=popular')
 
         self.assertEqual(response.status_code, 200)
         results = response.json()['results']
@@ -186,10 +207,10 @@ class PopularOrderingTestCase(TestCase):
         """usage_7d должен учитывать и клики, и копирования"""
 
         # Промо с 300 кликов + 200 копирований = 500 total
-        promo_mixed = PromoCode.objects.create(
+        promo_mixed = self._create_promo(
             title='Promo Mixed',
             code='PMIX',
-            promo_type='coupon',
+            offer_type='coupon',
             category=self.category,
             store=self.store,
             is_active=True,
@@ -197,10 +218,10 @@ class PopularOrderingTestCase(TestCase):
         )
 
         # Промо с 400 кликов (без копирований)
-        promo_clicks = PromoCode.objects.create(
+        promo_clicks = self._create_promo(
             title='Promo Clicks',
             code='PCLICK',
-            promo_type='coupon',
+            offer_type='coupon',
             category=self.category,
             store=self.store,
             is_active=True,
@@ -214,7 +235,7 @@ class PopularOrderingTestCase(TestCase):
         # DailyAgg для promo_clicks
         DailyAgg.objects.create(promo=promo_clicks, date=self.yesterday, event_type='click', count=400)
 
-        response = self.client.get('/api/v1/promos/?ordering=popular')
+        response = self._get('/api/v1/promocodes/?ordering=popular')
 
         self.assertEqual(response.status_code, 200)
         results = response.json()['results']
@@ -227,10 +248,10 @@ class PopularOrderingTestCase(TestCase):
         """Сортировка по created_at для промокодов без кликов"""
 
         # Старый промокод (7 дней назад)
-        old_promo = PromoCode.objects.create(
+        old_promo = self._create_promo(
             title='Old Promo',
             code='OLD',
-            promo_type='coupon',
+            offer_type='coupon',
             category=self.category,
             store=self.store,
             is_active=True,
@@ -239,10 +260,10 @@ class PopularOrderingTestCase(TestCase):
         )
 
         # Новый промокод (вчера)
-        new_promo = PromoCode.objects.create(
+        new_promo = self._create_promo(
             title='New Promo',
             code='NEW',
-            promo_type='coupon',
+            offer_type='coupon',
             category=self.category,
             store=self.store,
             is_active=True,
@@ -252,7 +273,7 @@ class PopularOrderingTestCase(TestCase):
 
         # Нет DailyAgg записей (оба промо без кликов)
 
-        response = self.client.get('/api/v1/promos/?ordering=popular')
+        response = self._get('/api/v1/promocodes/?ordering=popular')
 
         self.assertEqual(response.status_code, 200)
         results = response.json()['results']
@@ -265,10 +286,10 @@ class PopularOrderingTestCase(TestCase):
         """Полная проверка: badges → usage → freshness"""
 
         # 1. Hot промо (старый, мало кликов)
-        hot_old = PromoCode.objects.create(
+        hot_old = self._create_promo(
             title='Hot Old',
             code='HOTOLD',
-            promo_type='coupon',
+            offer_type='coupon',
             category=self.category,
             store=self.store,
             is_hot=True,
@@ -279,10 +300,10 @@ class PopularOrderingTestCase(TestCase):
         DailyAgg.objects.create(promo=hot_old, date=self.yesterday, event_type='click', count=10)
 
         # 2. Recommended промо (новый, средние клики)
-        rec_new = PromoCode.objects.create(
+        rec_new = self._create_promo(
             title='Rec New',
             code='RECNEW',
-            promo_type='coupon',
+            offer_type='coupon',
             category=self.category,
             store=self.store,
             is_recommended=True,
@@ -293,10 +314,10 @@ class PopularOrderingTestCase(TestCase):
         DailyAgg.objects.create(promo=rec_new, date=self.yesterday, event_type='click', count=100)
 
         # 3. Обычный промо с большими кликами (500)
-        normal_popular = PromoCode.objects.create(
+        normal_popular = self._create_promo(
             title='Normal Popular',
             code='NORMPOP',
-            promo_type='coupon',
+            offer_type='coupon',
             category=self.category,
             store=self.store,
             is_hot=False,
@@ -308,10 +329,10 @@ class PopularOrderingTestCase(TestCase):
         DailyAgg.objects.create(promo=normal_popular, date=self.yesterday, event_type='click', count=500)
 
         # 4. Обычный промо с малыми кликами (50), но новый
-        normal_new = PromoCode.objects.create(
+        normal_new = self._create_promo(
             title='Normal New',
             code='NORMNEW',
-            promo_type='coupon',
+            offer_type='coupon',
             category=self.category,
             store=self.store,
             is_hot=False,
@@ -323,10 +344,10 @@ class PopularOrderingTestCase(TestCase):
         DailyAgg.objects.create(promo=normal_new, date=self.yesterday, event_type='click', count=50)
 
         # 5. Обычный промо с малыми кликами (50), старый
-        normal_old = PromoCode.objects.create(
+        normal_old = self._create_promo(
             title='Normal Old',
             code='NORMOLD',
-            promo_type='coupon',
+            offer_type='coupon',
             category=self.category,
             store=self.store,
             is_hot=False,
@@ -337,7 +358,7 @@ class PopularOrderingTestCase(TestCase):
         )
         DailyAgg.objects.create(promo=normal_old, date=self.yesterday, event_type='click', count=50)
 
-        response = self.client.get('/api/v1/promos/?ordering=popular')
+        response = self._get('/api/v1/promocodes/?ordering=popular')
 
         self.assertEqual(response.status_code, 200)
         results = response.json()['results']
@@ -359,10 +380,10 @@ class PopularOrderingTestCase(TestCase):
         """usage_7d должен учитывать только события за последние 7 дней"""
 
         # Промо с кликами 8 дней назад (не должны учитываться)
-        promo_old_clicks = PromoCode.objects.create(
+        promo_old_clicks = self._create_promo(
             title='Old Clicks',
             code='OLDCLICK',
-            promo_type='coupon',
+            offer_type='coupon',
             category=self.category,
             store=self.store,
             is_active=True,
@@ -370,10 +391,10 @@ class PopularOrderingTestCase(TestCase):
         )
 
         # Промо с кликами вчера (должны учитываться)
-        promo_recent = PromoCode.objects.create(
+        promo_recent = self._create_promo(
             title='Recent Clicks',
             code='RECENT',
-            promo_type='coupon',
+            offer_type='coupon',
             category=self.category,
             store=self.store,
             is_active=True,
@@ -396,7 +417,7 @@ class PopularOrderingTestCase(TestCase):
             count=100
         )
 
-        response = self.client.get('/api/v1/promos/?ordering=popular')
+        response = self._get('/api/v1/promocodes/?ordering=popular')
 
         self.assertEqual(response.status_code, 200)
         results = response.json()['results']
@@ -410,10 +431,10 @@ class PopularOrderingTestCase(TestCase):
         """Просмотры (views) НЕ должны учитываться в usage_7d"""
 
         # Промо с 1000 просмотров
-        promo_views = PromoCode.objects.create(
+        promo_views = self._create_promo(
             title='Promo Views',
             code='VIEWS',
-            promo_type='coupon',
+            offer_type='coupon',
             category=self.category,
             store=self.store,
             is_active=True,
@@ -421,10 +442,10 @@ class PopularOrderingTestCase(TestCase):
         )
 
         # Промо с 100 кликов
-        promo_clicks = PromoCode.objects.create(
+        promo_clicks = self._create_promo(
             title='Promo Clicks',
             code='CLICKS',
-            promo_type='coupon',
+            offer_type='coupon',
             category=self.category,
             store=self.store,
             is_active=True,
@@ -437,7 +458,7 @@ class PopularOrderingTestCase(TestCase):
         # 100 кликов для promo_clicks
         DailyAgg.objects.create(promo=promo_clicks, date=self.yesterday, event_type='click', count=100)
 
-        response = self.client.get('/api/v1/promos/?ordering=popular')
+        response = self._get('/api/v1/promocodes/?ordering=popular')
 
         self.assertEqual(response.status_code, 200)
         results = response.json()['results']
@@ -451,10 +472,10 @@ class PopularOrderingTestCase(TestCase):
         """Проверка работы popular ordering в CategoryPromocodesView"""
 
         # Создаём промокоды в категории
-        hot_promo = PromoCode.objects.create(
+        hot_promo = self._create_promo(
             title='Hot in Category',
             code='HOTCAT',
-            promo_type='coupon',
+            offer_type='coupon',
             category=self.category,
             store=self.store,
             is_hot=True,
@@ -462,10 +483,10 @@ class PopularOrderingTestCase(TestCase):
             expires_at=self.now + timedelta(days=30)
         )
 
-        normal_promo = PromoCode.objects.create(
+        normal_promo = self._create_promo(
             title='Normal in Category',
             code='NORMCAT',
-            promo_type='coupon',
+            offer_type='coupon',
             category=self.category,
             store=self.store,
             is_hot=False,
@@ -475,7 +496,7 @@ class PopularOrderingTestCase(TestCase):
 
         DailyAgg.objects.create(promo=normal_promo, date=self.yesterday, event_type='click', count=500)
 
-        response = self.client.get(f'/api/v1/categories/{self.category.slug}/promos/?ordering=popular')
+        response = self._get(f'/api/v1/categories/{self.category.slug}/promocodes/?ordering=popular')
 
         self.assertEqual(response.status_code, 200)
         results = response.json()['results']
@@ -488,10 +509,10 @@ class PopularOrderingTestCase(TestCase):
         """Проверка работы popular ordering в StorePromocodesView"""
 
         # Создаём промокоды для магазина
-        recommended = PromoCode.objects.create(
+        recommended = self._create_promo(
             title='Recommended in Store',
             code='RECSTORE',
-            promo_type='coupon',
+            offer_type='coupon',
             category=self.category,
             store=self.store,
             is_recommended=True,
@@ -499,10 +520,10 @@ class PopularOrderingTestCase(TestCase):
             expires_at=self.now + timedelta(days=30)
         )
 
-        popular = PromoCode.objects.create(
+        popular = self._create_promo(
             title='Popular in Store',
             code='POPSTORE',
-            promo_type='coupon',
+            offer_type='coupon',
             category=self.category,
             store=self.store,
             is_hot=False,
@@ -513,7 +534,7 @@ class PopularOrderingTestCase(TestCase):
 
         DailyAgg.objects.create(promo=popular, date=self.yesterday, event_type='click', count=800)
 
-        response = self.client.get(f'/api/v1/stores/{self.store.slug}/promos/?ordering=popular')
+        response = self._get(f'/api/v1/stores/{self.store.slug}/promocodes/?ordering=popular')
 
         self.assertEqual(response.status_code, 200)
         results = response.json()['results']
@@ -522,3 +543,37 @@ class PopularOrderingTestCase(TestCase):
         # popular вторым (800 кликов)
         self.assertEqual(results[0]['id'], recommended.id)
         self.assertEqual(results[1]['id'], popular.id)
+
+    def test_aggregation_refreshes_popularity(self):
+        """Прогон агрегации обновляет popularity_7d затронутых промокодов"""
+        from core.analytics.aggregation import aggregate_new_events
+        from core.models import Event
+
+        promo = self._create_promo(
+            title='Tracked', store=self.store, offer_type='coupon', expires_at=self.now + timedelta(days=30)
+        )
+        Event.objects.bulk_create(
+            [Event(event_type='promo_copy', promo=promo, store=self.store) for _ in range(3)]
+            + [Event(event_type='view', promo=promo, store=self.store)]
+        )
+
+        aggregate_new_events()
+        promo.refresh_from_db()
+        self.assertEqual(promo.popularity_7d, 3)
+
+        Event.objects.create(event_type='promo_open', promo=promo, store=self.store)
+        aggregate_new_events()
+        promo.refresh_from_db()
+        self.assertEqual(promo.popularity_7d, 4)
+
+    def test_popular_query_without_aggregate(self):
+        """ordering=popular - ORDER BY по хранимым полям, без JOIN с DailyAgg"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/promocodes/?ordering=popular')
+
+        self.assertEqual(response.status_code, 200)
+        for query in queries.captured_queries:
+            self.assertNotIn('core_dailyagg', query['sql'])
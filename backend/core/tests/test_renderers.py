@@ -0,0 +1,82 @@
+"""
+Unit tests для рендереров API и кэша готовых ответов (core.renderers, cache_api_response)
+
+Проверяем:
+1. ORJSONRenderer - те же байты, что и JSONRenderer DRF
+2. Попадание в кэш отдаёт сохранённые байты без вызова view и рендера
+3. MessagePack по Accept (если установлен msgpack)
+"""
+
+import unittest
+from datetime import timedelta
+from decimal import Decimal
+from importlib.util import find_spec
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from core.models import PromoCode, Store
+from core.renderers import ORJSONRenderer
+
+
+class RenderersTestCase(TestCase):
+    """Тестирование рендереров и кэширования байтов ответа"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.store = Store.objects.create(name='Технопарк', slug='technopark', site_url='https://technopark.ru')
+        self.promo = PromoCode.objects.create(
+            title='Скидка на телефоны', description='d', store=self.store, code='PHONE',
+            expires_at=timezone.now() + timedelta(days=30),
+        )
+
+    def test_orjson_matches_drf(self):
+        data = {
+            'promo': self.client.get('/api/v1/promocodes/').json()['results'][0],
+            'now': timezone.now(),
+            'date': timezone.localdate(),
+            'price': Decimal('9.90'),
+            'label': gettext_lazy('Скидка'),
+            'ids': (1, 2),
+            'nested': [{'a': None, 'b': True, 'c': 1.5}],
+        }
+
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_cache_hit_serves_bytes(self):
+        first = self.client.get('/api/v1/promocodes/')
+
+        with mock.patch('core.views.generics.ListAPIView.list') as view_list, \
+                mock.patch.object(ORJSONRenderer, 'render') as render:
+            second = self.client.get('/api/v1/promocodes/')
+
+        view_list.assert_not_called()
+        render.assert_not_called()
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Content-Type'], 'application/json')
+
+    def test_cache_key_per_renderer(self):
+        plain = self.client.get('/api/v1/promocodes/').json()
+        normalized = self.client.get('/api/v1/promocodes/?format=normalized').json()
+
+        self.assertIn('store', plain['results'][0])
+        self.assertIn('store_id', normalized['results'][0])
+        self.assertIn('included', normalized)
+
+    @unittest.skipUnless(find_spec('msgpack'), 'msgpack not installed')
+    def test_msgpack(self):
+        import msgpack
+
+        response = self.client.get('/api/v1/promocodes/', HTTP_ACCEPT='application/msgpack')
+
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content)['results'][0]['code'], 'PHONE')
+        # Ответ в JSON по тому же URL - отдельная запись кэша
+        self.assertEqual(self.client.get('/api/v1/promocodes/').json()['results'][0]['code'], 'PHONE')
+
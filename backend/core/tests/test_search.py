@@ -0,0 +1,193 @@
+"""
+Unit tests для поискового движка (core.search)
+
+Проверяем:
+1. Поиск по заголовку, магазину и категории
+2. AND-логику для нескольких терминов
+3. Поиск через все точки входа API (q, search, global_search)
+4. Варианты запроса: раскладка клавиатуры и транслитерация
+5. Опечатки в отдельных словах длинных полей (pg_trgm, word similarity)
+"""
+
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import Category, PromoCode, Store
+from core.search import query_variants, search_by_name, search_promocodes, uses_trigram_search
+
+
+class QueryVariantsTestCase(TestCase):
+    """Тестирование нормализатора запросов"""
+
+    def test_layout_swap_en_to_ru(self):
+        """Русское слово, набранное в английской раскладке"""
+        self.assertIn('привет', query_variants('ghbdtn'))
+
+    def test_layout_swap_and_transliteration(self):
+        """ьфкшф -> maria -> мария"""
+        variants = query_variants('ьфкшф')
+        self.assertEqual(variants[0], 'ьфкшф')
+        self.assertIn('maria', variants)
+        self.assertIn('мария', variants)
+
+    def test_transliteration_ru_to_lat(self):
+        """Кириллица транслитерируется в латиницу"""
+        self.assertIn('ozon', query_variants('Озон'))
+
+    def test_empty_query(self):
+        self.assertEqual(query_variants('   '), [])
+
+
+class SearchEngineTestCase(TestCase):
+    """Тестирование поиска промокодов"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.now = timezone.now()
+
+        self.electronics = Category.objects.create(name='Electronics', slug='electronics')
+        self.food = Category.objects.create(name='Food', slug='food')
+
+        self.store = Store.objects.create(name='Technopark', slug='technopark', site_url='https://technopark.ru')
+        self.other_store = Store.objects.create(name='Pizzeria', slug='pizzeria', site_url='https://pizza.ru')
+
+        self.phone_promo = self._create_promo('Скидка на смартфоны', self.store, self.electronics)
+        self.pizza_promo = self._create_promo('Вторая пицца в подарок', self.other_store, self.food)
+
+    def _create_promo(self, title, store, category, **kwargs):
+        # Поисковый документ пересчитывается в on_commit - выполняем сразу
+        with self.captureOnCommitCallbacks(execute=True):
+            promo = PromoCode.objects.create(
+                title=title,
+                description=kwargs.pop('description', 'Описание предложения'),
+                store=store,
+                expires_at=self.now + timedelta(days=30),
+                **kwargs
+            )
+            promo.categories.add(category)
+        return promo
+
+    def _search_ids(self, value):
+        return set(search_promocodes(PromoCode.objects.all(), value).values_list('id', flat=True))
+
+    def test_search_by_title(self):
+        """Поиск по заголовку"""
+        self.assertEqual(self._search_ids('смартфоны'), {self.phone_promo.id})
+
+    def test_search_by_store_name(self):
+        """Поиск по названию магазина"""
+        self.assertEqual(self._search_ids('technopark'), {self.phone_promo.id})
+
+    def test_search_by_category_name(self):
+        """Поиск по названию категории"""
+        self.assertEqual(self._search_ids('electronics'), {self.phone_promo.id})
+
+    def test_store_rename_refreshes_promos(self):
+        with mock.patch('core.signals.refresh_search_vectors') as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.store.rating = 4.5
+                self.store.save()
+                self.store.save(update_fields=['rating'])
+            refresh.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.store.name = 'Mvideo'
+                self.store.save()
+
+        refresh.assert_called_once()
+        self.assertEqual(list(refresh.call_args.args[0]), [self.phone_promo])
+
+    def test_all_terms_must_match(self):
+        """Все термины запроса должны найтись (AND-логика)"""
+        self.assertEqual(self._search_ids('пицца technopark'), set())
+
+    def test_short_terms_ignored(self):
+        """Однобуквенные термины игнорируются"""
+        self.assertEqual(
+            self._search_ids('а'),
+            {self.phone_promo.id, self.pizza_promo.id}
+        )
+
+    def test_list_view_search_param(self):
+        """?search= в списке промокодов идёт через движок"""
+        response = self.client.get('/api/v1/promocodes/?search=пицца')
+
+        self.assertEqual(response.status_code, 200)
+        ids = [item['id'] for item in response.json()['results']]
+        self.assertEqual(ids, [self.pizza_promo.id])
+
+    def test_list_view_q_param(self):
+        """?q= (PromoCodeFilter) идёт через движок"""
+        response = self.client.get('/api/v1/promocodes/?q=technopark')
+
+        self.assertEqual(response.status_code, 200)
+        ids = [item['id'] for item in response.json()['results']]
+        self.assertEqual(ids, [self.phone_promo.id])
+
+    def test_store_view_search(self):
+        """Поиск внутри магазина"""
+        response = self.client.get(f'/api/v1/stores/{self.store.slug}/promocodes/?search=смартфоны')
+
+        self.assertEqual(response.status_code, 200)
+        ids = [item['id'] for item in response.json()['results']]
+        self.assertEqual(ids, [self.phone_promo.id])
+
+    def test_global_search(self):
+        """Глобальный поиск возвращает промокоды через движок"""
+        response = self.client.get('/api/v1/search/?q=пицца')
+
+        self.assertEqual(response.status_code, 200)
+        ids = [item['id'] for item in response.json()['promocodes']]
+        self.assertEqual(ids, [self.pizza_promo.id])
+
+    def test_search_wrong_keyboard_layout(self):
+        """Запрос в неверной раскладке находит промокод"""
+        self.assertEqual(self._search_ids('еусртщзфкл'), {self.phone_promo.id})
+
+    def test_global_search_stores_layout_variant(self):
+        """Магазины в глобальном поиске ищутся с учётом раскладки"""
+        response = self.client.get('/api/v1/search/?q=зшяяукшф')
+
+        self.assertEqual(response.status_code, 200)
+        slugs = [item['slug'] for item in response.json()['stores']]
+        self.assertEqual(slugs, [self.other_store.slug])
+
+
+class TrigramSearchTestCase(TestCase):
+    """Нечёткий поиск по словам (только PostgreSQL с pg_trgm)"""
+
+    def setUp(self):
+        if not uses_trigram_search():
+            self.skipTest('pg_trgm extension required')
+        self.store = Store.objects.create(
+            name='Lenovo Official Store', slug='lenovo', site_url='https://lenovo.ru'
+        )
+        category = Category.objects.create(name='Electronics', slug='electronics')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.promo = PromoCode.objects.create(
+                title='Большая распродажа ноутбуков Lenovo и аксессуаров к ним',
+                description='Скидки на смартфоны Samsung Galaxy и планшеты до конца месяца',
+                store=self.store,
+                expires_at=timezone.now() + timedelta(days=30),
+            )
+            self.promo.categories.add(category)
+
+    def _search_ids(self, value):
+        return set(search_promocodes(PromoCode.objects.all(), value).values_list('id', flat=True))
+
+    def test_misspelled_word_in_long_title(self):
+        # similarity() всей строки заголовка для одного слова ниже порога
+        self.assertEqual(self._search_ids('lenvo'), {self.promo.id})
+
+    def test_misspelled_word_in_description(self):
+        self.assertEqual(self._search_ids('galaxxy'), {self.promo.id})
+
+    def test_store_name_word(self):
+        stores = search_by_name(Store.objects.all(), 'lenvo')
+        self.assertEqual(list(stores.values_list('id', flat=True)), [self.store.id])
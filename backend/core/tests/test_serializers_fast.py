@@ -0,0 +1,92 @@
+"""
+Unit tests для скомпилированной сериализации списков (core.serializers_fast)
+
+Проверяем:
+1. Побайтовое совпадение JSON с обычным путём DRF (полный, card, ?fields=)
+2. Списки магазинов и категорий: promocodes_count одним запросом на список
+3. Производные поля (is_expired, days_until_expiry) на границах
+"""
+
+from datetime import timedelta
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+from rest_framework.request import Request
+
+from core.models import Category, PromoCode, Store
+from core.serializers import CategorySerializer, PromoCodeSerializer, StoreSerializer
+
+
+class CompiledSerializerTestCase(TestCase):
+    """Тестирование CompiledListSerializer против ModelSerializer"""
+
+    def setUp(self):
+        now = timezone.now()
+        self.stores = [
+            Store.objects.create(name='Technopark', slug='technopark', site_url='https://technopark.ru', rating='4.5'),
+            Store.objects.create(name='Ozon', slug='ozon', site_url='https://ozon.ru', logo='stores/ozon.png'),
+        ]
+        self.categories = [
+            Category.objects.create(name='Электроника', slug='electronics', icon='phone'),
+            Category.objects.create(name='Дом', slug='home'),
+        ]
+        promos = [
+            dict(code='PHONE', discount_value=15, is_hot=True, expires_at=now + timedelta(days=30)),
+            dict(discount_label='−500 ₽', offer_type='deal', expires_at=now + timedelta(hours=5)),
+            dict(code='  ', is_recommended=True, offer_type='cashback', expires_at=now - timedelta(days=2)),
+            dict(code='OLD', is_active=False, expires_at=now + timedelta(days=3)),
+        ]
+        for i, extra in enumerate(promos):
+            promo = PromoCode.objects.create(
+                title=f'Promo {i}', description='d', store=self.stores[i % 2], **extra
+            )
+            promo.categories.set(self.categories[:i % 2 + 1])
+
+    def _request(self, query=''):
+        return Request(APIRequestFactory().get(f'/api/v1/promocodes/{query}', HTTP_HOST='testserver'))
+
+    def _render(self, serializer_class, queryset, request, compiled):
+        context = {'request': request, 'compiled': compiled}
+        return JSONRenderer().render(serializer_class(queryset, many=True, context=context).data)
+
+    def assertSameBytes(self, serializer_class, queryset, query=''):
+        request = self._request(query)
+        expected = self._render(serializer_class, queryset, request, compiled=False)
+        actual = self._render(serializer_class, queryset, request, compiled=True)
+        self.assertEqual(actual, expected)
+        return actual
+
+    def test_promocodes_match_drf(self):
+        queryset = PromoCode.objects.select_related('store').prefetch_related('categories').order_by('id')
+
+        for query in ('', '?view=card', '?fields=id,title,store,is_expired,valid_until'):
+            with self.subTest(query=query):
+                self.assertSameBytes(PromoCodeSerializer, queryset, query)
+
+    def test_stores_and_categories_match_drf(self):
+        self.assertSameBytes(StoreSerializer, Store.objects.all())
+        self.assertSameBytes(CategorySerializer, Category.objects.all())
+
+    def test_promocodes_count_batched(self):
+        request = self._request()
+        stores = list(Store.objects.all())
+        with CaptureQueriesContext(connection) as queries:
+            data = StoreSerializer(stores, many=True, context={'request': request}).data
+
+        sql = [q['sql'] for q in queries.captured_queries if 'silk_' not in q['sql'] and q['sql'].startswith('SELECT')]
+        self.assertEqual(len(sql), 1)
+        # Активные и не истёкшие: PHONE у Technopark, −500 ₽ у Ozon
+        self.assertEqual({row['slug']: row['promocodes_count'] for row in data}, {'technopark': 1, 'ozon': 1})
+
+    def test_derived_fields(self):
+        queryset = PromoCode.objects.select_related('store').prefetch_related('categories').order_by('id')
+        data = PromoCodeSerializer(queryset, many=True, context={'request': self._request()}).data
+
+        self.assertEqual([row['is_expired'] for row in data], [False, False, True, False])
+        self.assertEqual([row['days_until_expiry'] for row in data], [29, 0, 0, 2])
+        self.assertEqual([row['has_promocode'] for row in data], [True, False, False, True])
+        self.assertEqual(data[1]['discount_text'], '−500 ₽')
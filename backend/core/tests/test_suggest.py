@@ -0,0 +1,92 @@
+"""
+Unit tests для подсказок поиска (core.search.suggest)
+
+Проверяем:
+1. Префиксный поиск по началу любого слова
+2. Раскладку клавиатуры в подсказках
+3. Отсутствие запросов к БД при прогретом индексе
+4. Инвалидацию индекса при сохранении моделей
+"""
+
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import Category, PromoCode, Store
+from core.search import suggest as suggest_module
+
+
+class SuggestTestCase(TestCase):
+    """Тестирование /api/v1/search/suggest/"""
+
+    def setUp(self):
+        cache.clear()
+        suggest_module._state.update(version=None, checked_at=0.0)
+        self.client = APIClient()
+
+        self.store = Store.objects.create(name='Technopark', slug='technopark', site_url='https://technopark.ru')
+        self.category = Category.objects.create(name='Электроника', slug='electronics')
+        self.promo = PromoCode.objects.create(
+            title='Скидка на смартфоны',
+            description='Описание',
+            store=self.store,
+            expires_at=timezone.now() + timedelta(days=30),
+        )
+
+    def _get(self, q):
+        response = self.client.get('/api/v1/search/suggest/', {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_prefix_of_any_word(self):
+        """Префикс второго слова заголовка находит промокод"""
+        data = self._get('смарт')
+        self.assertEqual([item['id'] for item in data['promocodes']], [self.promo.id])
+
+    def test_store_and_category(self):
+        data = self._get('tech')
+        self.assertEqual([item['slug'] for item in data['stores']], ['technopark'])
+
+        data = self._get('элек')
+        self.assertEqual([item['slug'] for item in data['categories']], ['electronics'])
+
+    def test_wrong_layout(self):
+        """Запрос в английской раскладке находит кириллическую категорию"""
+        data = self._get("'ktr")
+        self.assertEqual([item['slug'] for item in data['categories']], ['electronics'])
+
+    def test_warm_index_does_not_query_db(self):
+        self._get('tech')
+
+        # Через API считать нельзя: middleware (silk и т.п.) пишут в БД сами
+        with CaptureQueriesContext(connection) as queries:
+            result = suggest_module.suggest('скид')
+        self.assertEqual(len(queries), 0)
+        self.assertEqual([item['id'] for item in result['promocodes']], [self.promo.id])
+
+    def test_rebuilt_after_save(self):
+        self._get('tech')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Store.objects.create(name='Techport', slug='techport', site_url='https://techport.ru')
+
+        data = self._get('tech')
+        self.assertEqual(
+            sorted(item['slug'] for item in data['stores']),
+            ['technopark', 'techport']
+        )
+
+    def test_expired_promo_hidden(self):
+        """Истёкший промокод скрывается без перестройки индекса"""
+        self._get('скид')
+
+        later = (timezone.now() + timedelta(days=31)).timestamp()
+        with mock.patch.object(suggest_module.time, 'time', return_value=later):
+            data = self._get('скид')
+        self.assertEqual(data['promocodes'], [])
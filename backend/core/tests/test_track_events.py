@@ -0,0 +1,373 @@
+"""
+Unit tests для приёма событий трекинга (/api/v1/track/)
+
+Проверяем:
+1. Батч пишется одним INSERT
+2. Дедупликацию кликов в рамках сессии
+3. Валидацию событий в памяти и счётчики в ответе
+4. Буферизованный режим: Redis Stream и перенос в Event
+5. Spool на диске и circuit breaker при сбоях бэкендов
+"""
+
+import json
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import IntegrityError, OperationalError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.analytics import ingest, spool, stream
+from core.models import Event, PromoCode, Store
+from core.utils.circuit_breaker import CircuitBreaker
+from core.utils.redis import get_redis_client, make_key
+
+
+class TrackEventsTestCase(TestCase):
+    """Тестирование батчевого трекинга"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.store = Store.objects.create(name='Technopark', slug='technopark', site_url='https://technopark.ru')
+        self.promo = PromoCode.objects.create(
+            title='Phone sale', description='d', store=self.store,
+            expires_at=timezone.now() + timezone.timedelta(days=30),
+        )
+
+    def _post(self, payload):
+        return self.client.post('/api/v1/track/', data=json.dumps(payload), content_type='application/json')
+
+    def _event(self, **kwargs):
+        event = {'event_type': 'promo_copy', 'promo_id': self.promo.id, 'session_id': 's1'}
+        event.update(kwargs)
+        return event
+
+    def test_batch_single_insert(self):
+        events = [self._event(session_id=f's{i}') for i in range(20)]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self._post({'events': events})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'accepted': 20, 'deduplicated': 0, 'rejected': 0})
+        inserts = [q for q in queries if q['sql'].startswith('INSERT') and 'INTO "core_event"' in q['sql']]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Event.objects.filter(is_unique=True).count(), 20)
+
+    def test_dedup_within_and_across_batches(self):
+        response = self._post({'events': [self._event(), self._event()]})
+        self.assertEqual(response.json()['deduplicated'], 1)
+
+        response = self._post(self._event())
+        self.assertEqual(response.json(), {'accepted': 1, 'deduplicated': 1, 'rejected': 0})
+
+        # Повторы сохраняются, но не считаются уникальными
+        self.assertEqual(Event.objects.count(), 3)
+        self.assertEqual(Event.objects.filter(is_unique=True).count(), 1)
+
+    def test_invalid_events_rejected(self):
+        response = self._post({'events': [
+            self._event(),
+            {'promo_id': self.promo.id},
+            self._event(promo_id='abc'),
+            'garbage',
+        ]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'accepted': 1, 'deduplicated': 0, 'rejected': 3})
+        self.assertEqual(Event.objects.count(), 1)
+
+    def test_long_values_truncated(self):
+        self._post(self._event(utm_source='x' * 500))
+        self.assertEqual(len(Event.objects.get().utm_source), 100)
+
+    def test_empty_batch(self):
+        self.assertEqual(self._post({'events': []}).status_code, 400)
+
+    def test_invalid_json(self):
+        response = self.client.post('/api/v1/track/', data='{', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(ANALYTICS_INGEST_MODE='buffered')
+class TrackEventsBufferedTestCase(TestCase):
+    """Тестирование буферизованного приёма через Redis Stream"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.redis = get_redis_client()
+        store = Store.objects.create(name='Technopark', slug='technopark', site_url='https://technopark.ru')
+        self.promo = PromoCode.objects.create(
+            title='Phone sale', description='d', store=store,
+            expires_at=timezone.now() + timezone.timedelta(days=30),
+        )
+
+    def _post(self, events):
+        return self.client.post('/api/v1/track/', data=json.dumps({'events': events}), content_type='application/json')
+
+    def _events(self, n):
+        return [{'event_type': 'promo_open', 'promo_id': self.promo.id, 'session_id': f's{i}'} for i in range(n)]
+
+    def test_buffered_then_drained(self):
+        if self.redis is None:
+            self.skipTest('Redis cache backend required')
+
+        response = self._post(self._events(5))
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['accepted'], 5)
+        self.assertEqual(Event.objects.count(), 0)
+        self.assertEqual(stream.stream_stats()['backlog'], 1)
+
+        stats = stream.drain(consumer='test')
+
+        self.assertEqual(stats['events'], 5)
+        self.assertEqual(Event.objects.filter(is_unique=True).count(), 5)
+        self.assertEqual(stream.stream_stats()['backlog'], 0)
+
+    def test_replay_is_idempotent(self):
+        """Повторная доставка той же записи не создаёт дублей"""
+        if self.redis is None:
+            self.skipTest('Redis cache backend required')
+
+        self._post(self._events(3))
+        entries = self.redis.xrange(stream._stream_key())
+
+        stream.ensure_group(self.redis)
+        stream._write_entries(self.redis, entries)
+        stream._write_entries(self.redis, entries)
+
+        self.assertEqual(Event.objects.count(), 3)
+
+    def test_stale_promo_id_does_not_block_drain(self):
+        if self.redis is None:
+            self.skipTest('Redis cache backend required')
+
+        events = self._events(2) + [{'event_type': 'promo_open', 'promo_id': 999999, 'session_id': 'x'}]
+        self._post(events)
+
+        stats = stream.drain(consumer='test')
+
+        self.assertEqual((stats['events'], stats['dead']), (3, 0))
+        self.assertEqual(Event.objects.filter(promo__isnull=True, session_id='x').count(), 1)
+        self.assertEqual(Event.objects.filter(promo=self.promo).count(), 2)
+        lag = stream.stream_stats()
+        self.assertEqual((lag['backlog'], lag['pending']), (0, 0))
+
+    def test_rejected_events_dead_lettered(self):
+        if self.redis is None:
+            self.skipTest('Redis cache backend required')
+        insert = stream._bulk_insert
+
+        def bulk_insert(events):
+            if any(event.session_id == 'bad' for event in events):
+                raise IntegrityError('rejected')
+            insert(events)
+
+        self._post(self._events(2) + [{'event_type': 'promo_open', 'session_id': 'bad'}])
+        with mock.patch('core.analytics.stream._bulk_insert', side_effect=bulk_insert):
+            stats = stream.drain(consumer='test')
+
+        self.assertEqual((stats['events'], stats['dead']), (2, 1))
+        self.assertEqual(Event.objects.count(), 2)
+        dead = self.redis.xrange(make_key(stream.DEAD_LETTER_KEY))
+        self.assertEqual(json.loads(dead[0][1][b'rows'])[0]['session_id'], 'bad')
+        # Запись подтверждена: следующий прогон её не перечитает
+        lag = stream.stream_stats()
+        self.assertEqual((lag['backlog'], lag['pending']), (0, 0))
+
+    def test_falls_back_to_direct_without_redis(self):
+        with mock.patch('core.analytics.stream.get_redis_client', return_value=None):
+            response = self._post(self._events(2))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Event.objects.count(), 2)
+
+
+class TrackEventsSpoolTestCase(TestCase):
+    """Тестирование spool-фолбэка и circuit breaker"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool_dir, ignore_errors=True)
+        settings_override = override_settings(ANALYTICS_SPOOL_DIR=self.spool_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        spool._writer = None
+        for breaker in (ingest.db_breaker, ingest.redis_breaker):
+            breaker.reset()
+            self.addCleanup(breaker.reset)
+
+        store = Store.objects.create(name='Technopark', slug='technopark', site_url='https://technopark.ru')
+        self.promo = PromoCode.objects.create(
+            title='Phone sale', description='d', store=store,
+            expires_at=timezone.now() + timezone.timedelta(days=30),
+        )
+
+    def _post(self, n):
+        events = [{'event_type': 'promo_open', 'promo_id': self.promo.id} for _ in range(n)]
+        return self.client.post('/api/v1/track/', data=json.dumps({'events': events}), content_type='application/json')
+
+    def test_db_failure_spools_and_replays(self):
+        with mock.patch('core.analytics.ingest.write_events', side_effect=OperationalError('db down')):
+            response = self._post(3)
+            self._post(2)
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(Event.objects.count(), 0)
+
+        spool.get_writer().rotate()
+        stats = spool.replay()
+
+        self.assertEqual(stats, {'files': 1, 'events': 5, 'rejected': 0, 'failed': 0})
+        self.assertEqual(Event.objects.count(), 5)
+        self.assertEqual(spool.pending_files(), 0)
+
+    def test_breaker_skips_db_after_failures(self):
+        failing = mock.Mock(side_effect=OperationalError('db down'))
+        with mock.patch('core.analytics.ingest.write_events', failing):
+            for _ in range(ingest.db_breaker.failure_threshold + 2):
+                self._post(1)
+
+        # После открытия breaker'а БД больше не дёргаем
+        self.assertEqual(failing.call_count, ingest.db_breaker.failure_threshold)
+        self.assertEqual(ingest.db_breaker.state, 'open')
+
+    def test_rejected_rows_do_not_trip_breaker(self):
+        data = {'events': [
+            {'event_type': 'promo_open', 'promo_id': self.promo.id},
+            {'event_type': 'promo_open', 'promo_id': 999999},
+        ]}
+        response = self.client.post('/api/v1/track/', data=json.dumps(data), content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Event.objects.filter(promo__isnull=True).count(), 1)
+
+        # Ошибка запроса (не недоступность БД) не открывает breaker
+        with mock.patch('core.analytics.ingest.write_events', side_effect=IntegrityError('bad row')):
+            for _ in range(ingest.db_breaker.failure_threshold + 1):
+                self._post(1)
+
+        self.assertEqual(ingest.db_breaker.failures, 0)
+        self.assertEqual(ingest.db_breaker.state, 'closed')
+
+    def test_half_open_trial_with_bad_data_closes_breaker(self):
+        breaker = ingest.db_breaker
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+
+        with mock.patch('core.utils.circuit_breaker.time.monotonic', return_value=breaker.opened_at + breaker.reset_timeout):
+            with mock.patch('core.analytics.ingest.write_events', side_effect=IntegrityError('bad row')):
+                self._post(1)
+
+        # Бэкенд ответил - breaker не застревает в half-open
+        self.assertEqual(breaker.state, 'closed')
+        self.assertEqual(self._post(1).status_code, 200)
+        self.assertEqual(Event.objects.count(), 1)
+
+    def test_replay_quarantines_rejected_rows(self):
+        with mock.patch('core.analytics.ingest.write_events', side_effect=OperationalError('db down')):
+            self._post(3)
+        spool.get_writer().rotate()
+
+        real_insert = stream._bulk_insert
+
+        def reject_second(events):
+            if any(event.ingest_id.endswith(':0:1') for event in events):
+                raise IntegrityError('bad row')
+            real_insert(events)
+
+        with mock.patch('core.analytics.stream._bulk_insert', side_effect=reject_second):
+            stats = spool.replay()
+
+        self.assertEqual(stats, {'files': 1, 'events': 2, 'rejected': 1, 'failed': 0})
+        self.assertEqual(Event.objects.count(), 2)
+        # Файл не остаётся в очереди: отвергнутое событие отложено в .rejected
+        self.assertEqual(spool.pending_files(), 0)
+        rejected = list(Path(self.spool_dir).glob(f'*{spool.REJECTED_SUFFIX}'))
+        self.assertEqual([len(rows) for rows in spool.read_records(rejected[0])], [1])
+
+    def test_replay_file_is_idempotent(self):
+        with mock.patch('core.analytics.ingest.write_events', side_effect=OperationalError('db down')):
+            self._post(4)
+        spool.get_writer().rotate()
+
+        path = next(Path(self.spool_dir).iterdir())
+        spool.replay_file(path)
+        spool.replay_file(path)
+
+        self.assertEqual(Event.objects.count(), 4)
+
+    def test_rotation_after_open_file_claimed(self):
+        with mock.patch('core.analytics.ingest.write_events', side_effect=OperationalError('db down')):
+            self._post(1)
+            # replay забрал ещё открытый файл
+            path = next(Path(self.spool_dir).glob(f'*{spool.OPEN_SUFFIX}'))
+            path.rename(path.with_suffix(spool.REPLAYING_SUFFIX))
+
+            spool.get_writer().rotate()
+            response = self._post(2)
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(len(list(Path(self.spool_dir).glob(f'*{spool.OPEN_SUFFIX}'))), 1)
+
+    def test_idle_open_file_of_live_writer_not_claimed(self):
+        finished = subprocess.Popen(['true'])
+        finished.wait()
+        old = time.time() - spool.ABANDONED_AFTER - 1
+        rows = [stream.encode_row(ingest.validate_events([{'event_type': 'promo_open'}])[0][0])]
+        paths = {}
+        for owner, pid in (('live', os.getppid()), ('dead', finished.pid)):
+            paths[owner] = Path(self.spool_dir) / f'{socket.gethostname()}-{pid}-1-1{spool.OPEN_SUFFIX}'
+            spool._write_record(paths[owner], rows)
+            os.utime(paths[owner], (old, old))
+
+        stats = spool.replay()
+
+        self.assertEqual((stats['files'], stats['events']), (1, 1))
+        self.assertTrue(paths['live'].exists())
+        self.assertFalse(paths['dead'].exists())
+
+    def test_truncated_record_skipped(self):
+        with mock.patch('core.analytics.ingest.write_events', side_effect=OperationalError('db down')):
+            self._post(2)
+            self._post(3)
+        spool.get_writer().rotate()
+
+        path = next(Path(self.spool_dir).iterdir())
+        with open(path, 'r+b') as f:
+            f.truncate(path.stat().st_size - 5)
+
+        self.assertEqual([len(rows) for rows in spool.read_records(path)], [2])
+
+
+class CircuitBreakerTestCase(TestCase):
+
+    def test_half_open_after_timeout(self):
+        breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=30)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+        with mock.patch('core.utils.circuit_breaker.time.monotonic', return_value=breaker.opened_at + 31):
+            self.assertTrue(breaker.allow())
+            # Только одна пробная попытка
+            self.assertFalse(breaker.allow())
+
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
@@ -0,0 +1,105 @@
+"""
+Unit tests для trending_score (core.analytics.trending)
+
+Проверяем:
+1. Вес события затухает с периодом полураспада
+2. Инкрементальное обновление: затухание накопленного + новые события
+3. ordering=trending в списках промокодов и магазинов
+"""
+
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.analytics import trending
+from core.models import AggregationWatermark, Event, PromoCode, Store
+
+
+@override_settings(ANALYTICS_TRENDING_HALF_LIFE_HOURS=24)
+class TrendingTestCase(TestCase):
+    """Тестирование затухающего счёта"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        # Середина часа: вес событий считается от середины их часа (TruncHour),
+        # при «плавающем» now результат зависел бы от минуты запуска теста
+        self.now = timezone.now().replace(minute=30, second=0, microsecond=0)
+        patcher = mock.patch('django.utils.timezone.now', return_value=self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.store = Store.objects.create(name='Technopark', slug='technopark', site_url='https://technopark.ru')
+        self.other_store = Store.objects.create(name='Ozon', slug='ozon', site_url='https://ozon.ru')
+        self.steady = PromoCode.objects.create(
+            title='Steady', description='d', store=self.other_store, expires_at=self.now + timedelta(days=30)
+        )
+        self.rising = PromoCode.objects.create(
+            title='Rising', description='d', store=self.store, expires_at=self.now + timedelta(days=30)
+        )
+
+    def _events(self, promo, n, age, event_type='promo_copy'):
+        Event.objects.bulk_create([
+            Event(event_type=event_type, promo=promo, store=promo.store, created_at=self.now - age)
+            for _ in range(n)
+        ])
+
+    def test_decay_half_life(self):
+        self.assertEqual(trending.decay(timedelta(0)), 1)
+        self.assertAlmostEqual(trending.decay(timedelta(hours=24)), 0.5)
+        self.assertAlmostEqual(trending.decay(timedelta(hours=72)), 0.125)
+
+    def test_recent_burst_outranks_older_total(self):
+        # 10 кликов три дня назад против 4 кликов сейчас
+        self._events(self.steady, 10, timedelta(days=3))
+        self._events(self.rising, 4, timedelta(minutes=30))
+        self._events(self.steady, 50, timedelta(minutes=30), event_type='view')
+
+        trending.update_trending_scores()
+
+        self.steady.refresh_from_db()
+        self.rising.refresh_from_db()
+        self.assertAlmostEqual(self.steady.trending_score, 1.25, delta=0.05)
+        self.assertAlmostEqual(self.rising.trending_score, 4, delta=0.1)
+        self.assertAlmostEqual(Store.objects.get(id=self.store.id).trending_score, 4, delta=0.1)
+
+    def test_incremental_update_decays_stored_scores(self):
+        self._events(self.rising, 4, timedelta(minutes=30))
+        trending.update_trending_scores()
+        score = PromoCode.objects.get(id=self.rising.id).trending_score
+
+        # Следующий прогон через сутки: старое затухает вдвое, новое добавляется
+        AggregationWatermark.objects.filter(name=trending.WATERMARK_NAME).update(
+            updated_at=self.now - timedelta(hours=24)
+        )
+        self._events(self.rising, 1, timedelta(minutes=30))
+        stats = trending.update_trending_scores()
+
+        self.assertEqual(stats['promos'], 1)
+        self.assertAlmostEqual(PromoCode.objects.get(id=self.rising.id).trending_score, score / 2 + 1, delta=0.05)
+
+        # Повторный прогон без новых событий ничего не удваивает
+        trending.update_trending_scores()
+        self.assertAlmostEqual(PromoCode.objects.get(id=self.rising.id).trending_score, score / 2 + 1, delta=0.05)
+
+    def test_ordering_trending_endpoints(self):
+        self._events(self.steady, 10, timedelta(days=3))
+        self._events(self.rising, 4, timedelta(minutes=30))
+        trending.update_trending_scores()
+
+        promos = self.client.get('/api/v1/promocodes/?ordering=trending').json()['results']
+        self.assertEqual([promo['id'] for promo in promos], [self.rising.id, self.steady.id])
+
+        stores = self.client.get('/api/v1/stores/?ordering=trending').json()['results']
+        self.assertEqual([store['id'] for store in stores], [self.store.id, self.other_store.id])
+
+    def test_task(self):
+        from core.tasks import update_trending
+
+        with mock.patch('core.analytics.trending.update_trending_scores', return_value={'promos': 0}):
+            result = update_trending.apply().get()
+
+        self.assertEqual(result, {'status': 'success', 'promos': 0})
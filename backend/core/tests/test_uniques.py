@@ -0,0 +1,117 @@
+"""
+Unit tests для уникальных посетителей на HyperLogLog (core.analytics.uniques)
+
+Проверяем:
+1. is_unique по PFADD при приёме событий
+2. Запись PFCOUNT в DailyAgg/MonthlyAgg при агрегации (только затронутые строки)
+3. Уникальных за период - объединение дней, а не сумма
+"""
+
+import json
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Max
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.analytics import uniques
+from core.analytics.aggregation import aggregate_new_events
+from core.analytics.ingest import validate_events, write_events
+from core.models import DailyAgg, Event, MonthlyAgg, PromoCode, Store
+from core.utils.redis import get_redis_client
+
+
+class UniquesTestCase(TestCase):
+    """Тестирование HyperLogLog счётчиков"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        if get_redis_client() is None:
+            self.skipTest('Redis cache backend required')
+        self.store = Store.objects.create(name='Technopark', slug='technopark', site_url='https://technopark.ru')
+        self.promo = PromoCode.objects.create(
+            title='Phone sale', description='d', store=self.store,
+            expires_at=timezone.now() + timedelta(days=30),
+        )
+
+    def _track(self, *sessions):
+        events = [
+            {'event_type': 'promo_copy', 'promo_id': self.promo.id, 'store_id': self.store.id, 'session_id': session}
+            for session in sessions
+        ]
+        return self.client.post(
+            '/api/v1/track/', data=json.dumps({'events': events}), content_type='application/json'
+        ).json()
+
+    def _ingest_at(self, created_at, *sessions):
+        """Батч с заданным временем (как из spool/стрима), минуя HTTP"""
+        rows, _ = validate_events([
+            {'event_type': 'promo_copy', 'promo_id': self.promo.id, 'store_id': self.store.id, 'session_id': session}
+            for session in sessions
+        ])
+        for row in rows:
+            row['created_at'] = created_at
+        uniques.mark_unique(rows)
+        write_events(rows)
+
+    def test_repeat_sessions_not_unique(self):
+        self.assertEqual(self._track('s1', 's1', 's2')['deduplicated'], 1)
+        self.assertEqual(self._track('s2', 's3')['deduplicated'], 1)
+
+        self.assertEqual(Event.objects.filter(is_unique=True).count(), 3)
+
+    def test_aggregation_persists_pfcount(self):
+        self._track('s1', 's1', 's2')
+        self._track('s3')
+
+        aggregate_new_events()
+
+        row = DailyAgg.objects.get(date=timezone.localdate(), promo=self.promo)
+        self.assertEqual((row.count, row.unique_count), (4, 3))
+        self.assertEqual(MonthlyAgg.objects.get(promo=self.promo).unique_count, 3)
+
+    def test_persist_touches_only_event_keys(self):
+        other = DailyAgg.objects.create(
+            date=timezone.localdate(), event_type='promo_copy', store=self.store, count=9, unique_count=5
+        )
+        self._track('s1', 's2')
+        aggregate_new_events()
+        DailyAgg.objects.filter(promo=self.promo).update(unique_count=0)
+        MonthlyAgg.objects.filter(promo=self.promo).update(unique_count=0)
+
+        with CaptureQueriesContext(connection) as queries:
+            updated = uniques.persist_unique_counts(0, Event.objects.aggregate(last=Max('id'))['last'])
+
+        self.assertEqual(updated, 2)
+        self.assertEqual(DailyAgg.objects.get(promo=self.promo).unique_count, 2)
+        # Строка того же дня без событий в диапазоне не пересчитана
+        other.refresh_from_db()
+        self.assertEqual(other.unique_count, 5)
+        if connection.vendor == 'postgresql':
+            # Ни одной строки роллапа не читается в Python
+            self.assertFalse([q for q in queries if q['sql'].startswith('SELECT') and 'agg"' in q['sql']])
+
+    def test_range_uniques_are_union_of_days(self):
+        now = timezone.now()
+        self._ingest_at(now - timedelta(days=1), 's1', 's2')
+        self._ingest_at(now, 's1', 's3')
+
+        counts = uniques.count_entities(
+            uniques.PROMO, [self.promo.id], timezone.localdate() - timedelta(days=1), timezone.localdate()
+        )
+
+        # Сумма дневных уникальных дала бы 4
+        self.assertEqual(counts, {self.promo.id: 3})
+
+    def test_stats_expose_unique(self):
+        self._track('s1', 's1', 's2')
+
+        data = self.client.get('/api/v1/stats/top-stores/?range=7d').json()
+
+        self.assertEqual(data['results'][0]['clicks'], 3)
+        self.assertEqual(data['results'][0]['unique'], 2)
@@ -39,6 +39,7 @@ urlpatterns = [
     path('promocodes/<int:promo_id>/increment-views/', views.increment_promo_views, name='increment-views'),
     
     # Поиск
+    path('search/suggest/', views.search_suggest, name='search-suggest'),
     path('search/', views.global_search, name='global-search'),
     
     # Обратная связь
@@ -64,6 +65,8 @@ urlpatterns = [
     path('stats/top-stores/', views_analytics.stats_top_stores, name='stats-top-stores'),
     path('stats/types-share/', views_analytics.stats_types_share, name='stats-types-share'),
     path('stats/showcases-ctr/', views_analytics.stats_showcases_ctr, name='stats-showcases-ctr'),
+    path('stats/ingest/', views_analytics.stats_ingest, name='stats-ingest'),
+    path('stats/cache/', views_analytics.stats_cache, name='stats-cache'),
 
     # Медиа-ресурсы сайта
     path('site/assets/', views.site_assets_view, name='site-assets'),
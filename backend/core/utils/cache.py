@@ -7,13 +7,142 @@ TTL management, and cache invalidation support.
 
 from django.core.cache import cache
 from django.conf import settings
+from django.http import QueryDict
+from contextvars import ContextVar
+import functools
 import hashlib
 import json
-from typing import Any, Optional, Dict
+import random
+import time
+import uuid
+from typing import Any, Iterable, Optional, Dict
 import logging
 
+from . import local_cache
+from .redis import get_redis_client, make_key
+
 logger = logging.getLogger(__name__)
 
+# Тег всех кэшированных ответов API (flush_cache('api'))
+API_TAG = 'api'
+TAG_VERSION_PREFIX = 'cache:tag:'
+
+# Пересчёт устаревшего ответа: блокировка одного пересчёта и ожидание остальных при холодном промахе
+LOCK_PREFIX = 'cache:lock:'
+LOCK_TIMEOUT = 30
+COALESCE_WAIT = 5.0
+COALESCE_POLL = 0.05
+
+# Счётчики по view: stale (отдан устаревший ответ), lock_wait (ожидание чужого пересчёта), recompute
+METRIC_PREFIX = 'cache:metric:'
+METRIC_EVENTS = ('stale', 'lock_wait', 'recompute')
+_metric_views = set()
+
+# Выборка запросов к кэшируемым view (sorted set путь -> частота) для прогрева кэша.
+# Версия ключа постоянная: выборка переживает смену CACHE_VERSION, после которой прогрев и нужен
+WARM_SAMPLE_KEY = 'cache:warm:requests'
+WARM_SAMPLE_VERSION = 0
+
+# Параметры запроса, не влияющие на ответ: рекламные метки и cache-buster'ы клиентов (Next.js - _rsc)
+IGNORED_QUERY_PARAMS = frozenset({'_', '_rsc', 'fbclid', 'gclid', 'yclid', 'ysclid'})
+IGNORED_QUERY_PREFIXES = ('utm_',)
+# Поисковые строки: регистр и пробелы не влияют на результат
+SEARCH_QUERY_PARAMS = ('q', 'search')
+
+# Попадания по уровням: l1 - память процесса, l2 - Redis; копятся в процессе и сбрасываются в Redis
+TIERS = ('l1', 'l2', 'miss')
+TIER_FLUSH_INTERVAL = 10
+_tier_counts = dict.fromkeys(TIERS, 0)
+_tier_flushed = time.monotonic()
+
+# Теги, собираемые сериализаторами во время построения ответа
+_collected_tags: ContextVar[Optional[set]] = ContextVar('collected_cache_tags', default=None)
+
+
+def entity_tag(instance) -> str:
+    """Tag of one object: ``'<model_name>:<pk>'`` (e.g. ``store:5``)."""
+    return f"{instance._meta.model_name}:{instance.pk}"
+
+
+def list_tag(model) -> str:
+    """Tag of a list whose membership changes on any save of ``model``."""
+    return f"{model._meta.model_name}-list"
+
+
+def ranking_tag(ordering: str) -> str:
+    """Tag of promo lists in a computed order (``popular``, ``trending``)."""
+    return f"promocode-ranking:{ordering}"
+
+
+def add_cache_tags(tags: Iterable[str]) -> None:
+    """Record tags the response being cached depends on (no-op outside ``cache_api_response``)."""
+    collected = _collected_tags.get()
+    if collected is not None:
+        collected.update(tags)
+
+
+def get_tag_versions(tags: Iterable[str]) -> Dict[str, int]:
+    """Current version of every tag (0 if never invalidated)."""
+    tags = list(tags)
+    if not tags:
+        # MGET без ключей - ошибка Redis
+        return {}
+    stored = cache.get_many([f"{TAG_VERSION_PREFIX}{tag}" for tag in tags])
+    return {tag: stored.get(f"{TAG_VERSION_PREFIX}{tag}", 0) for tag in tags}
+
+
+def invalidate_tags(*tags: str) -> None:
+    """Invalidate every cached response that recorded one of ``tags``."""
+    for tag in tags:
+        key = f"{TAG_VERSION_PREFIX}{tag}"
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 1, None)
+    local_cache.invalidate(tags=tags)
+    if any(is_hot_tag(tag) for tag in tags):
+        from core.cache_warming import schedule_warm
+        schedule_warm()
+
+
+def is_hot_tag(tag: str) -> bool:
+    """Tags of the high-traffic responses: whole lists and rankings, not single objects."""
+    return tag == API_TAG or tag.endswith('-list') or tag.startswith('promocode-ranking:')
+
+
+def sample_request(path: str) -> None:
+    """Count ``path`` in the request sample (CACHE_WARM_SAMPLE_RATE of requests)."""
+    if random.random() >= getattr(settings, 'CACHE_WARM_SAMPLE_RATE', 0):
+        return
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        client.zincrby(make_key(WARM_SAMPLE_KEY, version=WARM_SAMPLE_VERSION), 1, path)
+    except Exception as e:
+        logger.warning(f"Request sample error: {e}")
+
+
+def top_requests(limit: int) -> list:
+    """Most frequent sampled paths, most frequent first."""
+    client = get_redis_client()
+    if client is None or limit <= 0:
+        return []
+    paths = client.zrevrange(make_key(WARM_SAMPLE_KEY, version=WARM_SAMPLE_VERSION), 0, limit - 1)
+    return [path.decode() if isinstance(path, bytes) else path for path in paths]
+
+
+def decay_request_samples(keep: int) -> None:
+    """Halve the sampled frequencies (recent traffic weighs more) and keep the top ``keep`` paths."""
+    client = get_redis_client()
+    if client is None:
+        return
+    key = make_key(WARM_SAMPLE_KEY, version=WARM_SAMPLE_VERSION)
+    pipe = client.pipeline()
+    pipe.zunionstore(key, {key: 0.5})
+    pipe.zremrangebyrank(key, 0, -keep - 1)
+    pipe.execute()
+
 
 def generate_cache_key(prefix: str, **kwargs) -> str:
     """
@@ -36,9 +165,9 @@ def generate_cache_key(prefix: str, **kwargs) -> str:
     sorted_params = sorted(kwargs.items())
     params_str = ':'.join(f"{k}={v}" for k, v in sorted_params if v is not None)
 
-    # Хэш для длинных параметров
+    # Хэш для длинных параметров: полный дайджест - коллизия отдала бы чужой ответ
     if len(params_str) > 100:
-        params_hash = hashlib.md5(params_str.encode()).hexdigest()[:8]
+        params_hash = hashlib.sha256(params_str.encode()).hexdigest()
         params_str = f"hash={params_hash}"
 
     key = f"v{cache_version}:{prefix}:{params_str}" if params_str else f"v{cache_version}:{prefix}"
@@ -125,41 +254,294 @@ def invalidate_cache_pattern(pattern_prefix: str) -> int:
         return 0
 
 
-def cache_api_response(ttl: int = 900):
+def record_cache_metric(view_name: str, event: str) -> None:
+    _incr_metric(f"{METRIC_PREFIX}{view_name}:{event}")
+
+
+def _incr_metric(key: str, delta: int = 1) -> None:
+    try:
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            cache.add(key, delta, None)
+    except Exception as e:
+        logger.warning(f"Cache metric error for {key}: {e}")
+
+
+def count_tier(tier: str) -> None:
+    """Count a lookup served by ``tier``; flushed to Redis every TIER_FLUSH_INTERVAL seconds."""
+    _tier_counts[tier] += 1
+    if time.monotonic() - _tier_flushed >= TIER_FLUSH_INTERVAL:
+        flush_tier_counts()
+
+
+def flush_tier_counts() -> None:
+    global _tier_flushed
+    _tier_flushed = time.monotonic()
+    for tier in TIERS:
+        delta, _tier_counts[tier] = _tier_counts[tier], 0
+        if delta:
+            _incr_metric(f"{METRIC_PREFIX}tier:{tier}", delta)
+
+
+def tier_metrics() -> Dict[str, Any]:
+    """Lookups per tier over all processes and the hit ratio of each tier."""
+    flush_tier_counts()
+    stored = cache.get_many([f"{METRIC_PREFIX}tier:{tier}" for tier in TIERS])
+    counts = {tier: stored.get(f"{METRIC_PREFIX}tier:{tier}", 0) for tier in TIERS}
+    total = sum(counts.values())
+    return {
+        **counts,
+        'l1_hit_ratio': round(counts['l1'] / total, 4) if total else None,
+        'l2_hit_ratio': round(counts['l2'] / total, 4) if total else None,
+    }
+
+
+def cache_metrics() -> Dict[str, Dict[str, int]]:
+    """``{view: {event: count}}`` of every ``cache_api_response`` view."""
+    keys = [f"{METRIC_PREFIX}{view}:{event}" for view in sorted(_metric_views) for event in METRIC_EVENTS]
+    stored = cache.get_many(keys)
+    return {
+        view: {event: stored.get(f"{METRIC_PREFIX}{view}:{event}", 0) for event in METRIC_EVENTS}
+        for view in sorted(_metric_views)
+    }
+
+
+def _get_valid_entry(cache_key: str, count: bool = False) -> Optional[Dict]:
+    """
+    Cached entry whose tags were not invalidated since it was stored.
+
+    A fresh entry of the in-process L1 is trusted without checking tags
+    (its invalidations arrive by pub/sub); anything else is read from Redis.
+    """
+    entry = local_cache.get_entry(cache_key)
+    if entry is not None and time.time() < entry['fresh_until']:
+        if count:
+            count_tier('l1')
+        return entry
+
+    entry = get_cached_api_response(cache_key)
+    tags = entry.get('tags') if entry is not None else None
+    if tags is None or 'fresh_until' not in entry:
+        entry = None
+    else:
+        try:
+            if get_tag_versions(tags) != tags:
+                entry = None
+        except Exception as e:
+            logger.warning(f"Cache tag check error for key {cache_key}: {e}")
+            entry = None
+
+    if count:
+        count_tier('miss' if entry is None else 'l2')
+    if entry is not None and time.time() < entry['fresh_until']:
+        local_cache.set_entry(cache_key, entry)
+    return entry
+
+
+def _entry_response(entry: Dict):
+    from django.http import HttpResponse
+    return HttpResponse(entry['content'], content_type=entry['content_type'])
+
+
+def _acquire_lock(lock_key: str) -> Optional[str]:
+    token = uuid.uuid4().hex
+    try:
+        return token if cache.add(lock_key, token, LOCK_TIMEOUT) else None
+    except Exception as e:
+        # Без Redis - пересчёт без блокировки
+        logger.warning(f"Cache lock error for {lock_key}: {e}")
+        return token
+
+
+def _release_lock(lock_key: str, token: str) -> None:
+    try:
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+    except Exception as e:
+        logger.warning(f"Cache unlock error for {lock_key}: {e}")
+
+
+def _wait_for_entry(cache_key: str, lock_key: str) -> Optional[Dict]:
+    """Wait for the lock holder's result; None if it gave up (lock released, no entry) or timed out."""
+    deadline = time.monotonic() + COALESCE_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(COALESCE_POLL)
+        entry = _get_valid_entry(cache_key)
+        if entry is not None:
+            return entry
+        if cache.get(lock_key) is None:
+            return None
+    return None
+
+
+def normalize_query(query: QueryDict, allowed=None, defaults=None) -> QueryDict:
+    """
+    Canonical form of request query parameters (the cache key part).
+
+    Drops tracking and cache-buster parameters and those not in ``allowed``,
+    lowercases and trims search terms, fills ``defaults`` for absent
+    parameters and sorts parameters by name (repeated values keep order).
+    """
+    params = {}
+    for key, values in query.lists():
+        if key in IGNORED_QUERY_PARAMS or key.startswith(IGNORED_QUERY_PREFIXES):
+            continue
+        if allowed is not None and key not in allowed:
+            continue
+        if key in SEARCH_QUERY_PARAMS:
+            values = [' '.join(value.lower().split()) for value in values]
+        params[key] = values
+
+    defaults = defaults(params) if callable(defaults) else defaults or {}
+    for key, value in defaults.items():
+        params.setdefault(key, [str(value)])
+
+    canonical = QueryDict(mutable=True)
+    for key in sorted(params):
+        canonical.setlist(key, params[key])
+    canonical._mutable = False
+    return canonical
+
+
+def _use_query(request, query: QueryDict) -> None:
+    """Make the view see ``query`` (DRF query_params and absolute URLs read the HttpRequest)."""
+    http_request = getattr(request, '_request', request)
+    http_request.GET = query
+    http_request.META['QUERY_STRING'] = query.urlencode()
+
+
+def cache_api_response(ttl: int = 900, tags=None, stale_ttl: Optional[int] = None, params=None, defaults=None):
     """
     Decorator for caching DRF list view responses.
 
+    The response is rendered once by the negotiated renderer and the encoded
+    bytes are cached with their content type; a hit returns them as is,
+    without unpickling ``response.data`` and rendering it again. The
+    renderer format is part of the key (JSON, MessagePack, normalized).
+
+    Every entry records the versions of the tags it depends on: ``tags``
+    (a list, or a function of the request) plus the objects the serializers
+    put into the response (``add_cache_tags``). A hit whose tag versions
+    changed since (``invalidate_tags`` from model signals) is a miss.
+
+    Stale-while-revalidate: an entry is fresh for ``ttl`` and kept for
+    ``stale_ttl`` more (default ``ttl``). After the soft expiry one request
+    takes a short lock and recomputes the response inline while the others
+    keep getting the stale one. On a cold miss (no entry, or its tags were
+    invalidated) requests wait for the lock holder instead of all running
+    the view. Stale serves, lock waits and recomputes are counted per view
+    (``cache_metrics``).
+
+    The key is built from the canonical query (``normalize_query``): only
+    ``params`` (all but tracking parameters if None) in a stable order, with
+    ``defaults`` filled and search terms lowercased, so ``?ordering=popular``
+    and ``?utm_source=x&page=1&ordering=popular`` share one entry. The view
+    runs with the canonical query too. ``API_CACHE_KEY_HEADER`` adds the key
+    and the canonical query to the response (``X-Cache-Key``/``X-Cache-Query``).
+
     Usage:
-        @cache_api_response(ttl=1800)  # 30 minutes
+        @cache_api_response(ttl=1800, tags=['showcase-list'])
         def list(self, request, *args, **kwargs):
             return super().list(request, *args, **kwargs)
 
     Args:
-        ttl: Time-to-live in seconds
+        ttl: Seconds the response is fresh
+        tags: Tags of the whole list, or ``callable(request) -> tags``
+        stale_ttl: Seconds a soft-expired response may still be served
+        params: Query parameters the view reads (allow-list), None - all
+        defaults: ``{param: value}`` the view assumes when a parameter is
+            absent, or ``callable(params) -> dict``
     """
+    stale_ttl = ttl if stale_ttl is None else stale_ttl
+
     def decorator(func):
+        _metric_views.add(func.__qualname__.split('.')[0].lower())
+
+        def cached(self, request, view_name, cache_key, *args, **kwargs):
+            renderer = request.accepted_renderer
+            lock_key = f"{LOCK_PREFIX}{cache_key}"
+            sample_request(request.get_full_path())
+
+            # Try to get from cache
+            entry = _get_valid_entry(cache_key, count=True)
+            if entry is not None and time.time() < entry['fresh_until']:
+                return _entry_response(entry)
+
+            token = _acquire_lock(lock_key)
+            if token is None:
+                if entry is not None:
+                    # Пересчитывает другой запрос - пока отдаём устаревший ответ
+                    record_cache_metric(view_name, 'stale')
+                    return _entry_response(entry)
+                record_cache_metric(view_name, 'lock_wait')
+                entry = _wait_for_entry(cache_key, lock_key)
+                if entry is not None:
+                    return _entry_response(entry)
+                logger.debug(f"Cache coalescing gave up: {cache_key}")
+
+            try:
+                record_cache_metric(view_name, 'recompute')
+                # Версии тегов списка - до построения ответа: изменение во время запроса не потеряется
+                list_tags = [API_TAG, *(tags(request) if callable(tags) else tags or [])]
+                try:
+                    versions = get_tag_versions(list_tags)
+                except Exception as e:
+                    logger.warning(f"Cache tag versions error for key {cache_key}: {e}")
+                    versions = None
+
+                # Execute view and cache result
+                collector = _collected_tags.set(set())
+                try:
+                    response = func(self, request, *args, **kwargs)
+                    collected = _collected_tags.get()
+                finally:
+                    _collected_tags.reset(collector)
+
+                # Only cache successful responses
+                if response.status_code == 200 and versions is not None:
+                    # Рендер здесь же (DRF не рендерит повторно уже готовый ответ)
+                    response.accepted_renderer = renderer
+                    response.accepted_media_type = request.accepted_media_type
+                    response.renderer_context = self.get_renderer_context()
+                    response.render()
+                    try:
+                        versions.update(get_tag_versions(collected - versions.keys()))
+                    except Exception as e:
+                        logger.warning(f"Cache tag versions error for key {cache_key}: {e}")
+                        return response
+                    entry = {
+                        'content': response.content,
+                        'content_type': response['Content-Type'],
+                        'tags': versions,
+                        'fresh_until': time.time() + ttl,
+                    }
+                    if set_cached_api_response(cache_key, entry, ttl=ttl + stale_ttl):
+                        # Старые копии ключа в L1 других процессов сбрасываются
+                        local_cache.set_entry(cache_key, entry, broadcast=True)
+                return response
+            finally:
+                if token is not None:
+                    _release_lock(lock_key, token)
+
+        @functools.wraps(func)
         def wrapper(self, request, *args, **kwargs):
-            # Generate cache key from request params
+            # Каноничные параметры видит и view: ссылки пагинации в ответе не зависят от формы запроса
+            query = normalize_query(request.query_params, params, defaults)
+            _use_query(request, query)
+
             view_name = self.__class__.__name__.lower()
             cache_key = generate_cache_key(
                 view_name,
-                query=request.GET.urlencode(),
-                path=request.path
+                query=query.urlencode(),
+                path=request.path,
+                renderer=request.accepted_renderer.format,
+                media_type=request.accepted_media_type,
             )
-
-            # Try to get from cache
-            cached_response = get_cached_api_response(cache_key)
-            if cached_response is not None:
-                from rest_framework.response import Response
-                return Response(cached_response)
-
-            # Execute view and cache result
-            response = func(self, request, *args, **kwargs)
-
-            # Only cache successful responses
-            if response.status_code == 200:
-                set_cached_api_response(cache_key, response.data, ttl=ttl)
-
+            response = cached(self, request, view_name, cache_key, *args, **kwargs)
+            if getattr(settings, 'API_CACHE_KEY_HEADER', False):
+                response['X-Cache-Key'] = cache_key
+                response['X-Cache-Query'] = query.urlencode()
             return response
 
         return wrapper
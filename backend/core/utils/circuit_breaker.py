@@ -0,0 +1,61 @@
+"""
+Minimal in-process circuit breaker.
+
+After ``failure_threshold`` consecutive failures the breaker opens and
+callers skip the backend immediately (no connection timeouts on the request
+thread). After ``reset_timeout`` seconds one trial call is let through
+(half-open); its success closes the breaker, its failure re-opens it.
+
+State is per process: each gunicorn/celery worker learns on its own, which
+is enough to keep latency flat and needs no shared storage (the shared
+storage is usually what is down).
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow(self):
+        """True if a call to the backend should be attempted."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Пропускаем одну пробную попытку
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit breaker '{self.name}' closed")
+            self.reset()
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuit breaker '{self.name}' opened after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
@@ -0,0 +1,221 @@
+"""
+In-process (L1) cache of API responses in front of Redis.
+
+Every worker process keeps the hottest ``cache_api_response`` entries in a
+bounded LRU (``API_L1_CACHE_MAX_ENTRIES`` entries, ``API_L1_CACHE_MAX_BYTES``
+of response bytes) for ``API_L1_CACHE_TTL`` seconds, so a hit needs neither
+a Redis round trip nor unpickling.
+
+Coherence: invalidations (a key was rewritten, tags were invalidated, the
+cache was flushed) are published on a Redis pub/sub channel. A daemon thread
+in every process listens to it and drops the matching entries; the process
+that publishes applies the change to its own L1 directly. Pub/sub is
+at-most-once - the short TTL bounds staleness if a message is lost, and the
+L1 is cleared whenever the subscription is re-established.
+
+The L1 is used only when ``API_L1_CACHE_ENABLED`` is set, the default cache
+is Redis and the listener is subscribed.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .redis import get_redis_client, make_key
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'cache:l1:invalidate'
+RECONNECT_DELAY = 1.0
+
+# Отправитель сообщения: свои изменения процесс применяет сразу, а не из канала
+_origin = uuid.uuid4().hex
+
+
+class LocalCache:
+    """Thread-safe LRU with per-entry expiry, bounded by entry count and bytes."""
+
+    def __init__(self):
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, _, value = item
+            if expires <= time.monotonic():
+                self._pop(key)
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, size, ttl, max_entries, max_bytes):
+        if size > max_bytes:
+            return
+        with self._lock:
+            self._pop(key)
+            self._data[key] = (time.monotonic() + ttl, size, value)
+            self._bytes += size
+            while len(self._data) > max_entries or self._bytes > max_bytes:
+                _, (_, evicted, _) = self._data.popitem(last=False)
+                self._bytes -= evicted
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._pop(key)
+
+    def delete_tagged(self, tags):
+        """Drop entries whose ``value['tags']`` contain one of ``tags``."""
+        tags = set(tags)
+        with self._lock:
+            stale = [
+                key for key, (_, _, value) in self._data.items()
+                if tags & set(value.get('tags') or ())
+            ]
+            for key in stale:
+                self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _pop(self, key):
+        item = self._data.pop(key, None)
+        if item is not None:
+            self._bytes -= item[1]
+
+
+local_cache = LocalCache()
+
+_subscribed = threading.Event()
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def _apply(message):
+    payload = json.loads(message)
+    if payload.get('o') == _origin:
+        return
+    if payload.get('clear'):
+        local_cache.clear()
+    if payload.get('keys'):
+        local_cache.delete(*payload['keys'])
+    if payload.get('tags'):
+        local_cache.delete_tagged(payload['tags'])
+
+
+def _listen():
+    channel = make_key(CHANNEL)
+    while True:
+        pubsub = None
+        try:
+            client = get_redis_client()
+            if client is None:
+                return
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(channel)
+            # Сообщения, пропущенные без подписки, не восстановить
+            local_cache.clear()
+            _subscribed.set()
+            for message in pubsub.listen():
+                if message.get('type') == 'message':
+                    _apply(message['data'])
+        except Exception as e:
+            logger.warning(f"L1 cache invalidation listener error: {str(e)}")
+        finally:
+            _subscribed.clear()
+            local_cache.clear()
+            if pubsub is not None:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+        time.sleep(RECONNECT_DELAY)
+
+
+def enabled():
+    """True if the L1 can be used (starts the listener in this process on first call)."""
+    global _listener
+
+    if not getattr(settings, 'API_L1_CACHE_ENABLED', False):
+        return False
+    if _subscribed.is_set():
+        return True
+    with _listener_lock:
+        if _listener is None or not _listener.is_alive():
+            if get_redis_client() is None:
+                return False
+            _listener = threading.Thread(target=_listen, name='l1-cache-invalidation', daemon=True)
+            _listener.start()
+    return _subscribed.is_set()
+
+
+def get_entry(key):
+    if not enabled():
+        return None
+    return local_cache.get(key)
+
+
+def set_entry(key, entry, broadcast=False):
+    """Store a response entry; ``broadcast`` - it was rewritten, other processes drop their copies."""
+    if not enabled():
+        return
+    local_cache.set(
+        key, entry, len(entry.get('content') or b''),
+        ttl=settings.API_L1_CACHE_TTL,
+        max_entries=settings.API_L1_CACHE_MAX_ENTRIES,
+        max_bytes=settings.API_L1_CACHE_MAX_BYTES,
+    )
+    if broadcast:
+        _broadcast(keys=[key])
+
+
+def invalidate(keys=(), tags=(), clear=False):
+    """Apply an invalidation to this process and broadcast it to the others."""
+    if clear:
+        local_cache.clear()
+    if keys:
+        local_cache.delete(*keys)
+    if tags:
+        local_cache.delete_tagged(tags)
+    _broadcast(keys=keys, tags=tags, clear=clear)
+
+
+def _broadcast(keys=(), tags=(), clear=False):
+    # Публикуют и процессы без своего L1 (Celery): L1 есть у веб-воркеров
+    if not getattr(settings, 'API_L1_CACHE_ENABLED', False):
+        return
+    client = get_redis_client()
+    if client is None:
+        return
+    payload = {'o': _origin, 'keys': list(keys), 'tags': list(tags), 'clear': clear}
+    try:
+        client.publish(make_key(CHANNEL), json.dumps(payload))
+    except Exception as e:
+        logger.warning(f"L1 cache invalidation publish error: {str(e)}")
+
+
+def _after_fork():
+    # Поток слушателя не переживает fork (gunicorn --preload), данные родителя - не наши.
+    # Origin тоже свой: иначе соседние воркеры отбрасывают сообщения друг друга как свои
+    global _listener, _origin
+    _listener = None
+    _origin = uuid.uuid4().hex
+    _subscribed.clear()
+    local_cache.clear()
+
+
+os.register_at_fork(after_in_child=_after_fork)
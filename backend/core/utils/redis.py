@@ -0,0 +1,35 @@
+"""
+Access to the raw Redis client behind Django's cache.
+
+Django's ``RedisCache`` covers get/set/incr, but pipelines, streams, sorted
+sets and HyperLogLog need the underlying redis-py client. Keys must go
+through ``cache.make_key()`` so they share the cache's prefix and version.
+"""
+import logging
+
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+def get_redis_client(alias='default', write=True):
+    """
+    Raw redis-py client of a cache alias, or None if the alias is not Redis.
+
+    In development (LocMemCache) callers fall back to plain cache calls.
+    """
+    cache = caches[alias]
+    backend = getattr(cache, '_cache', None)
+    get_client = getattr(backend, 'get_client', None)
+    if get_client is None:
+        return None
+    try:
+        return get_client(write=write)
+    except Exception as e:
+        logger.error(f"Redis client error ({alias}): {str(e)}")
+        return None
+
+
+def make_key(key, alias='default', version=None):
+    """Full Redis key for a cache key (KEY_PREFIX + VERSION applied)."""
+    return caches[alias].make_key(key, version=version)
@@ -1,11 +1,10 @@
 from rest_framework import generics, filters, status
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from django.utils import timezone
-from django.db.models import Q, Prefetch
+from django.db.models import Prefetch
 from django.db import connection
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
@@ -20,33 +19,54 @@ import logging
 logger = logging.getLogger(__name__)
 
 # Import cache utilities for API response caching
-from .utils.cache import cache_api_response
+from .utils.cache import add_cache_tags, cache_api_response, entity_tag, list_tag, ranking_tag
 
 from .models import Store, Category, PromoCode, Banner, StaticPage, Partner, ContactMessage, Showcase, ShowcaseItem
 from .serializers import (
     StoreSerializer, StoreDetailSerializer, CategorySerializer,
     PromoCodeSerializer, BannerSerializer, StaticPageSerializer,
-    PartnerSerializer, ContactMessageSerializer, ShowcaseListSerializer, ShowcaseDetailSerializer
+    PartnerSerializer, ContactMessageSerializer, ShowcaseListSerializer, ShowcaseDetailSerializer,
+    apply_promo_fieldset, included_of,
 )
-from .filters import PromoCodeFilter, PromoCodeOrderingFilter
+from .pagination import NON_FILTER_PARAMS, PromoCodePagination
+from .filters import PromoCodeFilter, PromoCodeOrderingFilter, PromoCodeSearchFilter, StoreOrderingFilter
+from .search import search_by_name, search_promocodes
+from .search.engine import order_by_rank
+from .search.facets import DISJUNCTIVE_FACETS, compute_facets, wants_facets
+from .search.suggest import suggest
 
 
-class PromoCodePagination(PageNumberPagination):
-    """Pagination for promo codes with optional `limit` query support."""
-    page_size = 12
-    page_size_query_param = 'page_size'
-    max_page_size = 100
+# Параметры, которые читают фильтры, пагинация и сериализатор списков промокодов;
+# остальные не входят в ключ кэша ответа (cache_api_response) и не доходят до view
+PROMO_LIST_PARAMS = frozenset({*PromoCodeFilter.base_filters, *NON_FILTER_PARAMS, 'search', 'fields', 'view'})
+SHOWCASE_PROMOS_PARAMS = frozenset({*NON_FILTER_PARAMS, 'fields', 'view'})
+
+
+def promo_list_cache_tags(request):
+    """Теги кэша списка промокодов: состав и пересчитываемая сортировка popular/trending"""
+    tags = [list_tag(PromoCode)]
+    ordering = request.query_params.get('ordering', '').lstrip('-')
+    if ordering in ('popular', 'trending'):
+        tags.append(ranking_tag(ordering))
+    return tags
+
+
+class PromoFieldsetMixin:
+    """
+    ?fields= / ?view=card: queryset списка грузит только нужные сериализатору колонки;
+    ?format=normalized: магазины и категории страницы - в блоке included
+    """
+
+    def filter_queryset(self, queryset):
+        return apply_promo_fieldset(super().filter_queryset(queryset), self.request)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        included = included_of(data)
+        if included is not None:
+            response.data['included'] = included
+        return response
 
-    def get_page_size(self, request):
-        limit = request.query_params.get('limit')
-        if limit is not None:
-            try:
-                limit_value = int(limit)
-                if limit_value > 0:
-                    return min(limit_value, self.max_page_size)
-            except (TypeError, ValueError):
-                pass
-        return super().get_page_size(request)
 
 class CategoryListView(generics.ListAPIView):
     serializer_class = CategorySerializer
@@ -60,7 +80,10 @@ class CategoryListView(generics.ListAPIView):
     def get_queryset(self):
         return Category.objects.filter(is_active=True).order_by('name')
 
-    @cache_api_response(ttl=3600)  # 60 minutes cache for categories (rarely change)
+    # Сбрасывается сигналами; promocodes_count зависит от промокодов
+    @cache_api_response(
+        ttl=6 * 3600, tags=[list_tag(Category), list_tag(PromoCode)], params=('search', 'ordering', 'format')
+    )
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
         serializer = self.get_serializer(queryset, many=True)
@@ -79,19 +102,14 @@ class CategoryDetailView(generics.RetrieveAPIView):
     lookup_field = 'slug'
 
 
-class CategoryPromocodesView(generics.ListAPIView):
+class CategoryPromocodesView(PromoFieldsetMixin, generics.ListAPIView):
+    pagination_class = PromoCodePagination
     serializer_class = PromoCodeSerializer
-    filter_backends = [DjangoFilterBackend, PromoCodeOrderingFilter, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, PromoCodeOrderingFilter, PromoCodeSearchFilter]
     filterset_class = PromoCodeFilter
-    ordering_fields = ['created_at', 'views_count', 'expires_at', 'is_recommended', 'is_hot', 'popular']
+    ordering_fields = ['created_at', 'views_count', 'expires_at', 'is_recommended', 'is_hot', 'popular', 'trending']
     ordering = ['-is_recommended', '-is_hot', '-created_at']
     
-    search_fields = [
-        'title', 
-        'description', 
-        'store__name'
-    ]
-    
     def get_queryset(self):
         slug = self.kwargs.get('slug')
 
@@ -108,26 +126,6 @@ class CategoryPromocodesView(generics.ListAPIView):
             Prefetch('categories', queryset=Category.objects.filter(is_active=True))
         )
 
-        search_query = self.request.query_params.get('search', None)
-        if search_query:
-            search_terms = search_query.lower().strip().split()
-            search_q = Q()
-            
-            for term in search_terms:
-                term_q = (
-                    Q(title__icontains=term) |
-                    Q(description__icontains=term) |
-                    Q(store__name__icontains=term)
-                )
-                
-                if hasattr(PromoCode, 'discount_label'):
-                    term_q |= Q(discount_label__icontains=term)
-                
-                search_q &= term_q
-            
-            if search_q:
-                queryset = queryset.filter(search_q).distinct()
-        
         store = self.request.query_params.get('store', None)
         if store:
             queryset = queryset.filter(store__slug=store)
@@ -142,6 +140,9 @@ class CategoryPromocodesView(generics.ListAPIView):
         
         return queryset
     
+    @cache_api_response(
+        ttl=900, tags=promo_list_cache_tags, params=PROMO_LIST_PARAMS, defaults=PromoCodePagination.default_params
+    )
     def list(self, request, *args, **kwargs):
         slug = self.kwargs.get('slug')
         
@@ -149,6 +150,7 @@ class CategoryPromocodesView(generics.ListAPIView):
             category = Category.objects.get(slug=slug, is_active=True)
         except Category.DoesNotExist:
             return Response({'error': 'API endpoint'}, status=404)
+        add_cache_tags([entity_tag(category)])
         
         response = super().list(request, *args, **kwargs)
         
@@ -181,9 +183,9 @@ def category_promocodes(request, slug):
 
 class StoreListView(generics.ListAPIView):
     serializer_class = StoreSerializer
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [filters.SearchFilter, StoreOrderingFilter]
     search_fields = ['name', 'description']
-    ordering_fields = ['name', 'rating', 'created_at']
+    ordering_fields = ['name', 'rating', 'created_at', 'trending']
     ordering = ['-rating', 'name']
     
     def get_queryset(self):
@@ -196,21 +198,14 @@ class StoreDetailView(generics.RetrieveAPIView):
     lookup_field = 'slug'
 
 
-class StorePromocodesView(generics.ListAPIView):
+class StorePromocodesView(PromoFieldsetMixin, generics.ListAPIView):
+    pagination_class = PromoCodePagination
     serializer_class = PromoCodeSerializer
-    filter_backends = [DjangoFilterBackend, PromoCodeOrderingFilter, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, PromoCodeOrderingFilter, PromoCodeSearchFilter]
     filterset_class = PromoCodeFilter
-    ordering_fields = ['created_at', 'views_count', 'expires_at', 'is_recommended', 'is_hot', 'popular']
+    ordering_fields = ['created_at', 'views_count', 'expires_at', 'is_recommended', 'is_hot', 'popular', 'trending']
     ordering = ['-is_recommended', '-is_hot', '-created_at']
     
-    search_fields = [
-        'title', 
-        'description', 
-        'long_description',
-        'categories__name',
-        'discount_label'
-    ]
-    
     def get_queryset(self):
         slug = self.kwargs.get('slug')
         
@@ -224,26 +219,6 @@ class StorePromocodesView(generics.ListAPIView):
             expires_at__gt=timezone.now()
         ).prefetch_related('categories')
         
-        search_query = self.request.query_params.get('search', None)
-        if search_query:
-            search_terms = search_query.lower().strip().split()
-            search_q = Q()
-            
-            for term in search_terms:
-                term_q = (
-                    Q(title__icontains=term) |
-                    Q(description__icontains=term) |
-                    Q(categories__name__icontains=term)
-                )
-                
-                if hasattr(PromoCode, 'discount_label'):
-                    term_q |= Q(discount_label__icontains=term)
-                
-                search_q &= term_q
-            
-            if search_q:
-                queryset = queryset.filter(search_q).distinct()
-        
         category = self.request.query_params.get('category', None)
         if category:
             queryset = queryset.filter(categories__slug=category)
@@ -258,6 +233,9 @@ class StorePromocodesView(generics.ListAPIView):
         
         return queryset
     
+    @cache_api_response(
+        ttl=900, tags=promo_list_cache_tags, params=PROMO_LIST_PARAMS, defaults=PromoCodePagination.default_params
+    )
     def list(self, request, *args, **kwargs):
         slug = self.kwargs.get('slug')
         
@@ -265,6 +243,7 @@ class StorePromocodesView(generics.ListAPIView):
             store = Store.objects.get(slug=slug, is_active=True)
         except Store.DoesNotExist:
             return Response({'error': 'API endpoint'}, status=404)
+        add_cache_tags([entity_tag(store)])
         
         response = super().list(request, *args, **kwargs)
         
@@ -312,25 +291,53 @@ def store_stats(request, slug):
         return Response({'error': 'API endpoint'}, status=404)
 
 
-class PromoCodeListView(generics.ListAPIView):
+class PromoCodeListView(PromoFieldsetMixin, generics.ListAPIView):
     """List active promo codes with filtering and ordering."""
     pagination_class = PromoCodePagination
     serializer_class = PromoCodeSerializer
-    filter_backends = [DjangoFilterBackend, PromoCodeOrderingFilter, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, PromoCodeOrderingFilter, PromoCodeSearchFilter]
     filterset_class = PromoCodeFilter
-    ordering_fields = ['created_at', 'views_count', 'expires_at', 'is_recommended', 'is_hot', 'popular']
+    ordering_fields = ['created_at', 'views_count', 'expires_at', 'is_recommended', 'is_hot', 'popular', 'trending']
     ordering = ['-is_recommended', '-is_hot', '-created_at']
 
-    search_fields = [
-        'title',
-        'description',
-        'store__name',
-        'categories__name'
-    ]
-
-    @cache_api_response(ttl=900)  # 15 minutes cache for promo codes list
+    # Сбрасывается сигналами; TTL ограничивает показ истёкших промокодов
+    @cache_api_response(
+        ttl=900, tags=promo_list_cache_tags, params=PROMO_LIST_PARAMS, defaults=PromoCodePagination.default_params
+    )
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        response = super().list(request, *args, **kwargs)
+        # ?facets=1 - счётчики для сайдбара фильтров одним запросом
+        if wants_facets(request):
+            response.data['facets'] = compute_facets(
+                self.filter_queryset(self.get_queryset()), facet_querysets=self.facet_querysets()
+            )
+        return response
+
+    def facet_querysets(self):
+        """
+        Result set without the facet's own filter, for every facet filter in the request.
+
+        PromoCodeFilter and the search are applied to a copy of the query
+        params; the filters of get_queryset() (store, category, is_hot,
+        is_recommended) are all part of PromoCodeFilter.
+        """
+        params = self.request.query_params
+        search = params.get(PromoCodeSearchFilter.search_param, '')
+        querysets = {}
+        for facet in DISJUNCTIVE_FACETS:
+            if facet not in params:
+                continue
+            facet_params = params.copy()
+            facet_params.pop(facet)
+            queryset = PromoCodeFilter(
+                facet_params,
+                queryset=PromoCode.objects.filter(is_active=True, expires_at__gt=timezone.now()),
+                request=self.request,
+            ).qs
+            if search.strip():
+                queryset = search_promocodes(queryset, search)
+            querysets[facet] = queryset
+        return querysets
 
     def get_queryset(self):
         queryset = PromoCode.objects.filter(
@@ -338,26 +345,6 @@ class PromoCodeListView(generics.ListAPIView):
             expires_at__gt=timezone.now()
         ).select_related('store').prefetch_related('categories')
         
-        search_query = self.request.query_params.get('search', None)
-        if search_query:
-            search_terms = search_query.lower().strip().split()
-            
-            search_q = Q()
-            for term in search_terms:
-                term_q = (
-                    Q(title__icontains=term) |
-                    Q(description__icontains=term) |
-                    Q(store__name__icontains=term) |
-                    Q(categories__name__icontains=term)
-                )
-                
-                if hasattr(PromoCode, 'discount_label'):
-                    term_q |= Q(discount_label__icontains=term)
-                
-            
-            if search_q:
-                queryset = queryset.filter(search_q).distinct()
-        
         category = self.request.query_params.get('category', None)
         if category:
             queryset = queryset.filter(categories__slug=category)
@@ -392,11 +379,23 @@ class BannerListView(generics.ListAPIView):
     queryset = Banner.objects.filter(is_active=True).order_by('sort_order', '-created_at')
     serializer_class = BannerSerializer
 
+    @cache_api_response(  # сбрасывается сигналами
+        ttl=6 * 3600, tags=[list_tag(Banner)], params=('page', 'ordering', 'format'), defaults={'page': 1}
+    )
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
 
 class PartnerListView(generics.ListAPIView):
     queryset = Partner.objects.filter(is_active=True).order_by('order', 'name')
     serializer_class = PartnerSerializer
 
+    @cache_api_response(  # сбрасывается сигналами
+        ttl=6 * 3600, tags=[list_tag(Partner)], params=('page', 'ordering', 'format'), defaults={'page': 1}
+    )
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
 
 class StaticPageDetailView(generics.RetrieveAPIView):
     queryset = StaticPage.objects.filter(is_active=True)
@@ -428,34 +427,50 @@ def global_search(request):
             'total': 0
         })
     
-    promocodes = PromoCode.objects.filter(
-        Q(title__icontains=query) |
-        Q(description__icontains=query) |
-        Q(store__name__icontains=query) |
-        Q(categories__name__icontains=query),
-        is_active=True,
-        expires_at__gt=timezone.now()
-    ).select_related('store').prefetch_related('categories').distinct()[:limit]
-    
-    stores = Store.objects.filter(
-        Q(name__icontains=query) |
-        Q(description__icontains=query),
-        is_active=True
+    matched = search_promocodes(
+        PromoCode.objects.filter(is_active=True, expires_at__gt=timezone.now()),
+        query
+    )
+    promocodes = apply_promo_fieldset(
+        order_by_rank(matched).select_related('store').prefetch_related('categories'), request
     )[:limit]
     
-    categories = Category.objects.filter(
-        Q(name__icontains=query) |
-        Q(description__icontains=query),
-        is_active=True
-    )[:limit]
+    # Раскладка/транслитерация и опечатки обрабатываются внутри движка одним запросом
+    stores = search_by_name(Store.objects.filter(is_active=True), query)[:limit]
     
-    return Response({
+    categories = search_by_name(Category.objects.filter(is_active=True), query)[:limit]
+    
+    promocodes_data = PromoCodeSerializer(promocodes, many=True, context={'request': request}).data
+    data = {
         'query': query,
-        'promocodes': PromoCodeSerializer(promocodes, many=True).data,
+        'promocodes': promocodes_data,
         'stores': StoreSerializer(stores, many=True).data,
         'categories': CategorySerializer(categories, many=True).data,
         'total': len(promocodes) + len(stores) + len(categories)
-    })
+    }
+    included = included_of(promocodes_data)
+    if included is not None:
+        data['included'] = included
+    if wants_facets(request):
+        data['facets'] = compute_facets(matched)
+    return Response(data)
+
+
+@api_view(['GET'])
+def search_suggest(request):
+    """
+    Подсказки для строки поиска в шапке.
+
+    Отдаётся из индекса в памяти процесса (core.search.suggest), без запросов к БД.
+    Параметры: q - префикс, limit - максимум подсказок каждого типа (до 20).
+    """
+    query = request.query_params.get('q', '').strip()
+    try:
+        limit = min(max(int(request.query_params.get('limit', 5)), 1), 20)
+    except ValueError:
+        limit = 5
+
+    return Response({'query': query, **suggest(query, limit=limit)})
 
 
 class ContactMessageCreateView(generics.CreateAPIView):
@@ -719,17 +734,24 @@ class ShowcaseViewSet(viewsets.ReadOnlyModelViewSet):
             return ShowcaseDetailSerializer
         return ShowcaseListSerializer
 
-    @cache_api_response(ttl=1800)  # 30 minutes cache for showcases list
+    @cache_api_response(  # сбрасывается сигналами
+        ttl=6 * 3600, tags=[list_tag(Showcase)],
+        params=NON_FILTER_PARAMS, defaults=PromoCodePagination.default_params,
+    )
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
     @action(detail=True, methods=['get'], url_path='promos')
+    @cache_api_response(  # сбрасывается тегами витрины (состав) и промокодов страницы
+        ttl=900, params=SHOWCASE_PROMOS_PARAMS, defaults=PromoCodePagination.default_params
+    )
     def promos(self, request, slug=None):
         """
         Эндпоинт для получения промокодов конкретной витрины с пагинацией
         GET /api/v1/showcases/<slug>/promos/?page=1&page_size=24
         """
         showcase = self.get_object()
+        add_cache_tags([entity_tag(showcase)])
 
         # Получаем промокоды через ShowcaseItem с нужным порядком
         showcase_items = ShowcaseItem.objects.filter(
@@ -740,18 +762,22 @@ class ShowcaseViewSet(viewsets.ReadOnlyModelViewSet):
         ).prefetch_related(
             'promocode__categories'
         ).order_by('position', 'id')
+        showcase_items = apply_promo_fieldset(showcase_items, request, prefix='promocode__')
 
-        # Извлекаем промокоды из ShowcaseItem
-        promocodes = [item.promocode for item in showcase_items]
-
-        # Пагинация
+        # Пагинация на уровне запроса (страница или ?cursor= по position, id)
         paginator = self.pagination_class()
-        paginated_promocodes = paginator.paginate_queryset(promocodes, request, view=self)
+        paginated_items = paginator.paginate_queryset(showcase_items, request, view=self)
 
         # Сериализация
-        serializer = PromoCodeSerializer(paginated_promocodes, many=True)
+        serializer = PromoCodeSerializer(
+            [item.promocode for item in paginated_items], many=True, context={'request': request}
+        )
 
-        return paginator.get_paginated_response(serializer.data)
+        response = paginator.get_paginated_response(serializer.data)
+        included = included_of(serializer.data)
+        if included is not None:
+            response.data['included'] = included
+        return response
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
@@ -3,14 +3,15 @@ Analytics и Tracking views
 """
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from django.http import JsonResponse, HttpResponse
-from django.db import transaction
+from django.http import JsonResponse
+from django.conf import settings
+from django.utils import timezone
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from django.db.models import Count
-from datetime import date, timedelta
+from datetime import timedelta
 from ipware import get_client_ip
 from django_ratelimit.decorators import ratelimit
+from .analytics.leaderboard import CLICK_EVENT_TYPES
 import json
 import logging
 
@@ -25,140 +26,280 @@ def track_events(request):
     POST /api/v1/track/
     Принимает батч событий для трекинга
     Body: {"events": [{...}]} OR одиночный объект {...}
+
+    Батч валидируется в памяти, дедуплицируется одним Redis pipeline
+    и пишется одним bulk_create (core.analytics.ingest).
+    При ANALYTICS_INGEST_MODE=buffered батч только кладётся в Redis Stream (202),
+    при недоступности Postgres - в локальный spool на диске (тоже 202).
+    Ответ: {"accepted": n, "deduplicated": n, "rejected": n}
     """
     try:
-        from django.core.cache import cache
-        from .models import Event
-
-        data = json.loads(request.body)
+        from .analytics import ingest_batch, parse_events
 
-        # Поддерживаем как массив в поле 'events', так и одиночный объект
-        if 'events' in data:
-            events_data = data['events']
-        elif 'event_type' in data:
-            # Одиночное событие - оборачиваем в массив
-            events_data = [data]
-        else:
-            events_data = []
+        try:
+            data = json.loads(request.body)
+        except (ValueError, UnicodeDecodeError):
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
 
+        events_data = parse_events(data)
         if not events_data:
             return JsonResponse({'error': 'No events provided'}, status=400)
 
         # Получаем IP и User-Agent (безопасно через django-ipware)
         client_ip, is_routable = get_client_ip(request)
         if client_ip is None:
-            client_ip = 'unknown'
             logger.warning('Could not determine client IP for analytics event')
 
         user_agent = request.META.get('HTTP_USER_AGENT', '')
 
-        created_count = 0
-
-        # Атомарная транзакция для всех событий
-        with transaction.atomic():
-            for event_data in events_data:
-                event_type = event_data.get('event_type')
-                if not event_type:
-                    continue
-
-                promo_id = event_data.get('promo_id')
-                store_id = event_data.get('store_id')
-                showcase_id = event_data.get('showcase_id')
-                session_id = event_data.get('session_id', '')
-
-                # Redis дедупликация (30 минут)
-                dedup_key = f"click:{event_type}:{promo_id}:{session_id}"
-                is_unique = False
-
-                if session_id:
-                    if not cache.get(dedup_key):
-                        cache.set(dedup_key, '1', timeout=1800)  # 30 min
-                        is_unique = True
-
-                # Создаём событие
-                Event.objects.create(
-                    event_type=event_type,
-                    promo_id=promo_id,
-                    store_id=store_id,
-                    showcase_id=showcase_id,
-                    session_id=session_id,
-                    client_ip=client_ip,
-                    user_agent=user_agent,
-                    ref=event_data.get('ref', ''),
-                    utm_source=event_data.get('utm_source', ''),
-                    utm_medium=event_data.get('utm_medium', ''),
-                    utm_campaign=event_data.get('utm_campaign', ''),
-                    is_unique=is_unique
-                )
-
-                created_count += 1
-
-        return HttpResponse(status=204)
+        result = ingest_batch(events_data, client_ip=client_ip, user_agent=user_agent)
+        sink = result.pop('sink')
+        return JsonResponse(result, status=200 if sink == 'db' else 202)
 
     except Exception as e:
         logger.error(f"Track events error: {str(e)}")
         return JsonResponse({'error': 'Internal error'}, status=500)
 
 
+@api_view(['GET'])
+def stats_ingest(request):
+    """GET /api/v1/stats/ingest/ - отставание буфера событий (только для staff)"""
+    from .analytics import ingest, spool, stream_stats
+
+    if not request.user.is_staff:
+        return Response({}, status=403)
+
+    try:
+        data = stream_stats()
+        data['spool_files'] = spool.pending_files()
+        data['breakers'] = {
+            breaker.name: breaker.state for breaker in (ingest.redis_breaker, ingest.db_breaker)
+        }
+        return Response(data)
+    except Exception as e:
+        logger.error(f'stats_ingest error: {str(e)}')
+        return Response({'error': 'Stream unavailable'}, status=503)
+
+
+@api_view(['GET'])
+def stats_cache(request):
+    """GET /api/v1/stats/cache/ - события кэша по view и попадания по уровням L1/L2 (только для staff)"""
+    from .utils.cache import cache_metrics, tier_metrics
+
+    if not request.user.is_staff:
+        return Response({}, status=403)
+
+    try:
+        return Response({'views': cache_metrics(), 'tiers': tier_metrics()})
+    except Exception as e:
+        logger.error(f'stats_cache error: {str(e)}')
+        return Response({'error': 'Cache unavailable'}, status=503)
+
+
+# Ограничение длины ряда (точек на графике)
+MAX_SERIES_BUCKETS = 1000
+
+
+def _parse_bound(value, inclusive=False):
+    """YYYY-MM-DD или ISO datetime -> aware datetime; дата в "to" включается целиком"""
+    from django.utils.dateparse import parse_date, parse_datetime
+    from .analytics.aggregation import local_midnight
+
+    if not value:
+        return None
+    try:
+        # parse_datetime принимает и голую дату (как полночь) - поэтому сначала дата
+        day = parse_date(value)
+        if day is not None:
+            return local_midnight(day + timedelta(days=1 if inclusive else 0))
+        moment = parse_datetime(value)
+        if moment is None:
+            raise ValueError
+    except ValueError:
+        raise ValueError(f'Invalid date: {value}')
+    return moment if timezone.is_aware(moment) else timezone.make_aware(moment)
+
+
+def _series_range(params):
+    """from/to/granularity -> нормализованные (start, end, granularity); ValueError при ошибке"""
+    from .analytics.aggregation import local_midnight
+    from .analytics.planner import DAY, GRANULARITIES, HOUR, bucket_starts, normalize_range
+
+    granularity = params.get('granularity', DAY)
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of: {', '.join(GRANULARITIES)}")
+
+    end = _parse_bound(params.get('to'), inclusive=True) or timezone.now()
+    start = _parse_bound(params.get('from')) or end - timedelta(days=7)
+    start, end = normalize_range(start, end, granularity)
+    if start >= end:
+        raise ValueError('"from" must be before "to"')
+    if len(bucket_starts(start, end, granularity)) > MAX_SERIES_BUCKETS:
+        raise ValueError(f'Too many points, max {MAX_SERIES_BUCKETS}')
+    hourly_from = local_midnight(timezone.localdate() - timedelta(days=settings.ANALYTICS_HOURLY_RETENTION_DAYS))
+    if granularity == HOUR and start < hourly_from:
+        raise ValueError(f'Hourly data is kept for {settings.ANALYTICS_HOURLY_RETENTION_DAYS} days')
+    return start, end, granularity
+
+
+def _series_response(request, name, compute):
+    """
+    Ответ в виде временного ряда, если передан from/to/granularity (иначе None - формат range=Nd).
+    compute(start, end, granularity, buckets) -> results, где ряды выровнены по buckets.
+    Кэш по нормализованному диапазону: любые from/to внутри одних и тех же бакетов дают один ключ.
+    """
+    from django.core.cache import cache
+    from .analytics.planner import bucket_starts
+
+    if not any(param in request.GET for param in ('from', 'to', 'granularity')):
+        return None
+    try:
+        start, end, granularity = _series_range(request.GET)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
+
+    start, end = timezone.localtime(start), timezone.localtime(end)
+    cache_key = f"stats:{name}:{granularity}:{start:%Y%m%d%H}:{end:%Y%m%d%H}"
+    data = cache.get(cache_key)
+    if data is None:
+        buckets = bucket_starts(start, end, granularity)
+        results = compute(start, end, granularity, buckets)
+        data = {
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'granularity': granularity,
+            'buckets': [bucket.isoformat() for bucket in buckets],
+            'results': results,
+            'count': len(results),
+        }
+        cache.set(cache_key, data, timeout=300)
+    return Response(data)
+
+
+def _series_by(rows, key_fields, buckets):
+    """Строки rollup_series -> {ключ: {'total': n, 'series': [n по бакетам]}}"""
+    positions = {bucket: i for i, bucket in enumerate(buckets)}
+    grouped = {}
+    for row in rows:
+        key = tuple(row[field] for field in key_fields)
+        item = grouped.setdefault(key, {'total': 0, 'series': [0] * len(buckets)})
+        item['total'] += row['count']
+        item['series'][positions[row['bucket']]] += row['count']
+    return grouped
+
+
+def _top_series(start, end, granularity, buckets, key_fields, **filters):
+    from .analytics.planner import rollup_series
+
+    rows = rollup_series(start, end, granularity, key_fields, **filters)
+    grouped = _series_by(rows, key_fields, buckets)
+    return sorted(grouped.items(), key=lambda item: item[1]['total'], reverse=True)
+
+
+def _live_top(dimension, range_param, model=None, label_field=None, limit=10):
+    """
+    Топ за range=Nd из живых лидербордов Redis (core.analytics.leaderboard).
+    Возвращает [(id, подпись, счётчик)] или None - тогда считаем по роллапам.
+    """
+    from .analytics import leaderboard
+
+    days = int(range_param.replace('d', ''))
+    top = leaderboard.top(dimension, days, limit=limit)
+    if top is None:
+        return None
+    if model is None:
+        return [(member, member, score) for member, score in top]
+
+    # Подписи - один запрос по первичному ключу, без агрегации
+    labels = dict(model.objects.filter(id__in=[member for member, _ in top]).values_list('id', label_field))
+    return [
+        (int(member), labels[int(member)], score)
+        for member, score in top if int(member) in labels
+    ]
+
+
+def _range_uniques(dimension, ids, range_param):
+    """
+    Уникальные посетители за range=Nd по HyperLogLog (core.analytics.uniques): объединение дней, а не сумма.
+    None без Redis или если счётчики части дней уже истекли.
+    """
+    from .analytics import uniques
+
+    days = int(range_param.replace('d', ''))
+    if days > settings.ANALYTICS_UNIQUES_DAYS:
+        return None
+    today = timezone.localdate()
+    return uniques.count_entities(dimension, ids, today - timedelta(days=days), today)
+
+
+def _range_totals(range_param, group_by, **filters):
+    """Счётчики за range=Nd из роллапов (core.analytics.planner) + ещё не агрегированный хвост"""
+    from .analytics.planner import range_for_days, rollup_totals
+
+    days = int(range_param.replace('d', ''))
+    start, end = range_for_days(days)
+    return rollup_totals(start, end, group_by, **filters)
+
+
+def _top_promos_series(start, end, granularity, buckets):
+    top = _top_series(
+        start, end, granularity, buckets, ('promo_id', 'promo__title'),
+        event_type__in=CLICK_EVENT_TYPES, promo__isnull=False
+    )[:10]
+    return [
+        {'promo_id': promo_id, 'title': title, 'clicks': item['total'], 'series': item['series']}
+        for (promo_id, title), item in top
+    ]
+
+
 @api_view(['GET'])
 def stats_top_promos(request):
-    """GET /api/v1/stats/top-promos?range=7d"""
+    """
+    GET /api/v1/stats/top-promos?range=7d
+    GET /api/v1/stats/top-promos?from=2025-01-01&to=2025-03-31&granularity=hour|day|week - временной ряд
+    """
     from django.core.cache import cache
-    from .models import DailyAgg, Event
+    from .analytics.leaderboard import PROMO
+    from .models import PromoCode
 
     try:
+        series = _series_response(request, 'top_promos', _top_promos_series)
+        if series is not None:
+            return series
+
         range_param = request.GET.get('range', '7d')
+        live = _live_top(PROMO, range_param, PromoCode, 'title')
+        if live is not None:
+            unique = _range_uniques(PROMO, [promo_id for promo_id, _, _ in live], range_param) or {}
+            data = [
+                {'promo_id': promo_id, 'title': title, 'clicks': clicks, 'unique': unique.get(promo_id)}
+                for promo_id, title, clicks in live
+            ]
+            return Response({'results': data, 'count': len(data)})
+
         cache_key = f"stats:top_promos:{range_param}"
         cached = cache.get(cache_key)
         if cached:
             return Response({'results': cached, 'count': len(cached)})
 
-        days = int(range_param.replace('d', ''))
-        start_date = date.today() - timedelta(days=days)
-
         # Топ-10 промокодов по кликам
-        from django.db.models import Sum
-
-        # Всегда используем свежие данные из Event для актуальности
-        # (особенно важно для сегодняшних событий)
-        if False:  # Отключаем агрегированные данные, всегда берем свежие
-            # Используем агрегированные данные из DailyAgg
-            CLICK_EVENT_TYPES = [
-                'copy', 'open',                   # основные типы
-                'promo_copy', 'promo_open',       # промокоды
-                'finance_open',                   # финансовые предложения
-                'deal_open',                      # акции
-                'click', 'copy_code'              # legacy типы
-            ]
-
-            top = DailyAgg.objects.filter(
-                date__gte=start_date,
-                event_type__in=CLICK_EVENT_TYPES,
-                promo__isnull=False
-            ).values('promo_id', 'promo__title').annotate(
-                total_clicks=Sum('count')
-            ).order_by('-total_clicks')[:10]
-
-            data = [{'promo_id': item['promo_id'], 'title': item['promo__title'], 'clicks': item['total_clicks']} for item in top]
-        else:
-            # Fallback: используем сырые события из Event
-            logger.warning('No aggregated data found, using raw events')
-
-            CLICK_EVENT_TYPES = [
-                'copy', 'open',
-                'promo_copy', 'promo_open',
-                'finance_open', 'deal_open'
-            ]
-
-            top = Event.objects.filter(
-                created_at__date__gte=start_date,
-                event_type__in=CLICK_EVENT_TYPES,
-                promo__isnull=False
-            ).values('promo_id', 'promo__title').annotate(
-                total_clicks=Count('id')
-            ).order_by('-total_clicks')[:10]
-
-            data = [{'promo_id': item['promo_id'], 'title': item['promo__title'], 'clicks': item['total_clicks']} for item in top]
+        totals = _range_totals(
+            range_param, ('promo_id', 'promo__title'),
+            event_type__in=CLICK_EVENT_TYPES, promo__isnull=False
+        )
+        top = sorted(totals, key=lambda x: x['count'], reverse=True)[:10]
+
+        unique = _range_uniques(PROMO, [item['promo_id'] for item in top], range_param)
+        data = [
+            {
+                'promo_id': item['promo_id'],
+                'title': item['promo__title'],
+                'clicks': item['count'],
+                # Без Redis - сумма дневных уникальных (приблизительно)
+                'unique': unique[item['promo_id']] if unique else item['unique_count'],
+            }
+            for item in top
+        ]
 
         cache.set(cache_key, data, timeout=300)  # 5 min
         return Response({'results': data, 'count': len(data)})
@@ -167,45 +308,57 @@ def stats_top_promos(request):
         return Response({'results': [], 'count': 0}, status=200)  # Empty with proper structure
 
 
+def _top_stores_series(start, end, granularity, buckets):
+    top = _top_series(start, end, granularity, buckets, ('store_id', 'store__name'), store__isnull=False)[:10]
+    return [
+        {'store_id': store_id, 'name': name, 'clicks': item['total'], 'series': item['series']}
+        for (store_id, name), item in top
+    ]
+
+
 @api_view(['GET'])
 def stats_top_stores(request):
-    """GET /api/v1/stats/top-stores?range=7d"""
+    """
+    GET /api/v1/stats/top-stores?range=7d
+    GET /api/v1/stats/top-stores?from=...&to=...&granularity=hour|day|week - временной ряд
+    """
     from django.core.cache import cache
-    from .models import DailyAgg, Event
+    from .analytics.leaderboard import STORE
+    from .models import Store
 
     try:
+        series = _series_response(request, 'top_stores', _top_stores_series)
+        if series is not None:
+            return series
+
         range_param = request.GET.get('range', '7d')
+        live = _live_top(STORE, range_param, Store, 'name')
+        if live is not None:
+            unique = _range_uniques(STORE, [store_id for store_id, _, _ in live], range_param) or {}
+            data = [
+                {'store_id': store_id, 'name': name, 'clicks': clicks, 'unique': unique.get(store_id)}
+                for store_id, name, clicks in live
+            ]
+            return Response({'results': data, 'count': len(data)})
+
         cache_key = f"stats:top_stores:{range_param}"
         cached = cache.get(cache_key)
         if cached:
             return Response({'results': cached, 'count': len(cached)})
 
-        days = int(range_param.replace('d', ''))
-        start_date = date.today() - timedelta(days=days)
-
-        from django.db.models import Sum
-
-        # Всегда используем свежие данные из Event для актуальности
-        # (особенно важно для сегодняшних событий)
-        if False:  # Отключаем агрегированные данные, всегда берем свежие
-            top = DailyAgg.objects.filter(
-                date__gte=start_date,
-                store__isnull=False
-            ).values('store_id', 'store__name').annotate(
-                total_clicks=Sum('count')
-            ).order_by('-total_clicks')[:10]
-
-            data = [{'store_id': item['store_id'], 'name': item['store__name'], 'clicks': item['total_clicks']} for item in top]
-        else:
-            # Fallback: используем сырые события
-            top = Event.objects.filter(
-                created_at__date__gte=start_date,
-                store__isnull=False
-            ).values('store_id', 'store__name').annotate(
-                total_clicks=Count('id')
-            ).order_by('-total_clicks')[:10]
-
-            data = [{'store_id': item['store_id'], 'name': item['store__name'], 'clicks': item['total_clicks']} for item in top]
+        totals = _range_totals(range_param, ('store_id', 'store__name'), store__isnull=False)
+        top = sorted(totals, key=lambda x: x['count'], reverse=True)[:10]
+
+        unique = _range_uniques(STORE, [item['store_id'] for item in top], range_param)
+        data = [
+            {
+                'store_id': item['store_id'],
+                'name': item['store__name'],
+                'clicks': item['count'],
+                'unique': unique[item['store_id']] if unique else item['unique_count'],
+            }
+            for item in top
+        ]
 
         cache.set(cache_key, data, timeout=300)
         return Response({'results': data, 'count': len(data)})
@@ -214,45 +367,43 @@ def stats_top_stores(request):
         return Response({'results': [], 'count': 0}, status=200)
 
 
+def _types_share_series(start, end, granularity, buckets):
+    types = _top_series(start, end, granularity, buckets, ('promo__offer_type',), promo__isnull=False)
+    return [
+        {'type': offer_type, 'count': item['total'], 'series': item['series']}
+        for (offer_type,), item in types
+    ]
+
+
 @api_view(['GET'])
 def stats_types_share(request):
-    """GET /api/v1/stats/types-share?range=7d"""
+    """
+    GET /api/v1/stats/types-share?range=7d
+    GET /api/v1/stats/types-share?from=...&to=...&granularity=hour|day|week - временной ряд
+    """
     from django.core.cache import cache
-    from .models import DailyAgg, Event
+    from .analytics.leaderboard import TYPE
 
     try:
+        series = _series_response(request, 'types_share', _types_share_series)
+        if series is not None:
+            return series
+
         range_param = request.GET.get('range', '7d')
+        live = _live_top(TYPE, range_param, limit=None)
+        if live is not None:
+            data = [{'type': offer_type, 'count': count} for offer_type, _, count in live]
+            return Response({'results': data, 'count': len(data)})
+
         cache_key = f"stats:types_share:{range_param}"
         cached = cache.get(cache_key)
         if cached:
             return Response({'results': cached, 'count': len(cached)})
 
-        days = int(range_param.replace('d', ''))
-        start_date = date.today() - timedelta(days=days)
-
-        from django.db.models import Sum
-
-        # Всегда используем свежие данные из Event для актуальности
-        # (особенно важно для сегодняшних событий)
-        if False:  # Отключаем агрегированные данные, всегда берем свежие
-            types = DailyAgg.objects.filter(
-                date__gte=start_date,
-                promo__isnull=False
-            ).values('promo__offer_type').annotate(
-                total=Sum('count')
-            ).order_by('-total')
-
-            data = [{'type': item['promo__offer_type'], 'count': item['total']} for item in types]
-        else:
-            # Fallback: используем сырые события
-            types = Event.objects.filter(
-                created_at__date__gte=start_date,
-                promo__isnull=False
-            ).values('promo__offer_type').annotate(
-                total=Count('id')
-            ).order_by('-total')
-
-            data = [{'type': item['promo__offer_type'], 'count': item['total']} for item in types]
+        totals = _range_totals(range_param, ('promo__offer_type',), promo__isnull=False)
+        types = sorted(totals, key=lambda x: x['count'], reverse=True)
+
+        data = [{'type': item['promo__offer_type'], 'count': item['count']} for item in types]
 
         cache.set(cache_key, data, timeout=300)
         return Response({'results': data, 'count': len(data)})
@@ -261,81 +412,88 @@ def stats_types_share(request):
         return Response({'results': [], 'count': 0}, status=200)
 
 
+def _ctr(clicks, views):
+    return round(clicks / views * 100, 2) if views > 0 else 0
+
+
+def _showcases_ctr_series(start, end, granularity, buckets):
+    from .analytics.planner import rollup_series
+
+    rows = rollup_series(
+        start, end, granularity, ('showcase_id', 'showcase__title', 'event_type'),
+        event_type__in=['view', 'showcase_open'], showcase__isnull=False
+    )
+    views = _series_by([row for row in rows if row['event_type'] == 'view'], ('showcase_id', 'showcase__title'), buckets)
+    clicks = _series_by([row for row in rows if row['event_type'] == 'showcase_open'], ('showcase_id',), buckets)
+
+    data = []
+    for (showcase_id, title), view_item in views.items():
+        click_item = clicks.get((showcase_id,), {'total': 0, 'series': [0] * len(buckets)})
+        data.append({
+            'showcase_id': showcase_id,
+            'title': title,
+            'views': view_item['total'],
+            'clicks': click_item['total'],
+            'ctr': _ctr(click_item['total'], view_item['total']),
+            'series': [
+                {'views': v, 'clicks': c, 'ctr': _ctr(c, v)}
+                for v, c in zip(view_item['series'], click_item['series'])
+            ],
+        })
+    return sorted(data, key=lambda x: x['ctr'], reverse=True)[:10]
+
+
 @api_view(['GET'])
 def stats_showcases_ctr(request):
-    """GET /api/v1/stats/showcases-ctr?range=7d"""
+    """
+    GET /api/v1/stats/showcases-ctr?range=7d
+    GET /api/v1/stats/showcases-ctr?from=...&to=...&granularity=hour|day|week - временной ряд
+    """
     from django.core.cache import cache
-    from .models import DailyAgg, Event
+    from .analytics.uniques import SHOWCASE
 
     try:
+        series = _series_response(request, 'showcases_ctr', _showcases_ctr_series)
+        if series is not None:
+            return series
+
         range_param = request.GET.get('range', '7d')
         cache_key = f"stats:showcases_ctr:{range_param}"
         cached = cache.get(cache_key)
         if cached:
             return Response({'results': cached, 'count': len(cached)})
 
-        days = int(range_param.replace('d', ''))
-        start_date = date.today() - timedelta(days=days)
-
-        from django.db.models import Sum
-
-        # Всегда используем свежие данные из Event для актуальности
-        # (особенно важно для сегодняшних событий)
-        if False:  # Отключаем агрегированные данные, всегда берем свежие
-            views = DailyAgg.objects.filter(
-                date__gte=start_date,
-                event_type='showcase_view',
-                showcase__isnull=False
-            ).values('showcase_id', 'showcase__title').annotate(
-                views_count=Sum('count')
-            )
-
-            clicks = DailyAgg.objects.filter(
-                date__gte=start_date,
-                event_type='showcase_open',
-                showcase__isnull=False
-            ).values('showcase_id').annotate(
-                clicks_count=Sum('count')
-            )
-        else:
-            # Fallback: используем сырые события
-            # ВАЖНО: используем 'view' вместо 'showcase_view' т.к. в Event хранится 'view' для витрин
-            views = Event.objects.filter(
-                created_at__date__gte=start_date,
-                event_type='view',
-                showcase__isnull=False
-            ).values('showcase_id', 'showcase__title').annotate(
-                views_count=Count('id')
-            )
-
-            clicks = Event.objects.filter(
-                created_at__date__gte=start_date,
-                event_type='showcase_open',
-                showcase__isnull=False
-            ).values('showcase_id').annotate(
-                clicks_count=Count('id')
-            )
-
-        # Объединяем
-        clicks_dict = {item['showcase_id']: item['clicks_count'] for item in clicks}
+        # ВАЖНО: используем 'view' вместо 'showcase_view' т.к. в Event хранится 'view' для витрин
+        totals = _range_totals(
+            range_param, ('showcase_id', 'showcase__title', 'event_type'),
+            event_type__in=['view', 'showcase_open'], showcase__isnull=False
+        )
+        views = [item for item in totals if item['event_type'] == 'view']
+        clicks_dict = {item['showcase_id']: item['count'] for item in totals if item['event_type'] == 'showcase_open'}
 
         data = []
         for view_item in views:
             showcase_id = view_item['showcase_id']
-            views_count = view_item['views_count']
+            views_count = view_item['count']
             clicks_count = clicks_dict.get(showcase_id, 0)
-            ctr = (clicks_count / views_count * 100) if views_count > 0 else 0
 
             data.append({
                 'showcase_id': showcase_id,
                 'title': view_item.get('showcase__title', 'Unknown'),
                 'views': views_count,
                 'clicks': clicks_count,
-                'ctr': round(ctr, 2)
+                'ctr': _ctr(clicks_count, views_count)
             })
 
         data = sorted(data, key=lambda x: x['ctr'], reverse=True)[:10]
 
+        # Без Redis - сумма дневных уникальных просмотров (приблизительно)
+        unique = _range_uniques(SHOWCASE, [item['showcase_id'] for item in data], range_param) or {
+            item['showcase_id']: item['unique_count'] for item in views
+        }
+        for item in data:
+            item['unique_visitors'] = unique[item['showcase_id']]
+
         cache.set(cache_key, data, timeout=300)
         return Response({'results': data, 'count': len(data)})
     except Exception as e:
@@ -59,6 +59,14 @@ if [ "${CLEAR_SESSIONS}" == "yes" ]; then
     cd ..
 fi
 
+# Прогрев кэша API: списки и страницы категорий/магазинов/витрин
+if [ -f "backend/manage.py" ]; then
+    echo "Warming API cache..."
+    cd backend
+    python manage.py warm_cache || echo "⚠️  API cache warming failed"
+    cd ..
+fi
+
 echo ""
 echo "✅ Cache cleared successfully!"
 echo "Done!"
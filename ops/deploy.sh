@@ -190,6 +190,14 @@ else
     log_warning "Backend API health check failed"
 fi
 
+# Прогрев кэша API: после деплоя (и смены CACHE_VERSION) кэш холодный
+log "Warming API cache..."
+if (cd "$BACKEND_DIR" && python manage.py warm_cache); then
+    log "✓ API cache warmed"
+else
+    log_warning "API cache warming failed"
+fi
+
 # Test frontend
 if curl -s -f http://localhost:3000/ > /dev/null 2>&1; then
     log "✓ Frontend is responding"